@@ -0,0 +1,69 @@
+"""Response encoding benchmark, Rekognition style JSON vs. the npy, npz and msgpack encodings.
+
+python benchmarks/bench_encoding.py --boxes 10,100,1000 --output encoding.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+from suite import measure  # noqa: E402
+
+ACCEPTS = ["application/json", "application/x-npy", "application/x-npz", "application/x-msgpack"]
+
+
+def make_detections(num_frames, boxes_per_frame, num_labels=80, seed=0):
+    from darknet.py.detections import DETECTION_DTYPE
+    from darknet.sagemaker.encoding import Detections
+
+    rng = np.random.RandomState(seed)
+    detections = np.zeros(num_frames * boxes_per_frame, dtype=DETECTION_DTYPE)
+    detections["frame_index"] = np.repeat(np.arange(num_frames), boxes_per_frame)
+    detections["class_id"] = rng.randint(0, num_labels, len(detections))
+    detections["prob"] = rng.rand(len(detections))
+    for field, scale in (("x", 1920), ("y", 1080), ("w", 200), ("h", 200)):
+        detections[field] = rng.rand(len(detections)) * scale
+    labels = [f"label-{i}" for i in range(num_labels)]
+    return Detections(detections, num_frames, labels, num_frames > 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--frames", default="1,8")
+    parser.add_argument("--boxes", default="10,100,1000", help="boxes per frame")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    from darknet.sagemaker.encoding import encode_prediction, msgpack
+
+    accepts = ACCEPTS if msgpack is not None else ACCEPTS[:-1]
+    results = []
+    for num_frames in [int(n) for n in args.frames.split(",")]:
+        for boxes in [int(n) for n in args.boxes.split(",")]:
+            prediction = make_detections(num_frames, boxes)
+            for accept in accepts:
+                timings = measure(lambda: encode_prediction(prediction, accept), args.repeat)
+                size = len(encode_prediction(prediction, accept))
+                params = dict(accept=accept, num_frames=num_frames, boxes_per_frame=boxes)
+                results.append(dict(name="encode_prediction", params=params, bytes=size, **timings))
+                print(
+                    f"{accept:<24} frames={num_frames:<3} boxes={boxes:<5} "
+                    f"median={timings['median'] * 1e3:9.3f}ms bytes={size}",
+                    file=sys.stderr,
+                )
+
+    text = json.dumps(dict(benchmark="encoding", results=results), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
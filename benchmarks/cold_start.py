@@ -0,0 +1,89 @@
+"""Cold start benchmark, Network.open through fsspec vs. from a local snapshot.
+
+Every measurement loads the network in a fresh Python process, the way a new worker would:
+
+    python benchmarks/cold_start.py CONFIG_URL WEIGHTS_URL --repeat 5 --output cold_start.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+_LOAD_NETWORK = """
+import time
+start = time.perf_counter()
+from darknet.py.network import Network
+network = Network.open({config_url!r}, {weights_url!r}, snapshot={snapshot!r})
+print(time.perf_counter() - start)
+"""
+
+
+def load_in_subprocess(config_url, weights_url, snapshot):
+    script = _LOAD_NETWORK.format(config_url=config_url, weights_url=weights_url, snapshot=snapshot)
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    # darknet writes its own progress messages to stdout, the timing is the last line
+    return float(output.strip().splitlines()[-1])
+
+
+def summarize(seconds):
+    return dict(
+        repeat=len(seconds),
+        min=min(seconds),
+        median=statistics.median(seconds),
+        max=max(seconds),
+        seconds=seconds,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config_url")
+    parser.add_argument("weights_url")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    from darknet.py.snapshot import create_snapshot
+
+    start = time.perf_counter()
+    snapshot = create_snapshot(args.config_url, args.weights_url)
+    create_seconds = time.perf_counter() - start
+
+    results = dict(
+        benchmark="cold_start",
+        config_url=args.config_url,
+        weights_url=args.weights_url,
+        snapshot_key=snapshot.key,
+        snapshot_create_seconds=create_seconds,
+        fsspec=summarize(
+            [
+                load_in_subprocess(args.config_url, args.weights_url, False)
+                for _ in range(args.repeat)
+            ]
+        ),
+        snapshot=summarize(
+            [
+                load_in_subprocess(args.config_url, args.weights_url, True)
+                for _ in range(args.repeat)
+            ]
+        ),
+    )
+    results["speedup"] = results["fsspec"]["median"] / results["snapshot"]["median"]
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
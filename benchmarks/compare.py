@@ -0,0 +1,58 @@
+"""Compares two benchmarks/suite.py results, e.g. the last release against a candidate.
+
+    python benchmarks/compare.py baseline.json candidate.json --threshold 0.1
+
+Exits with status 1 when a benchmark median is slower than the baseline by more than threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(baseline, candidate, threshold=0.1):
+    """Returns a (name, params, baseline median, candidate median, ratio, regressed) per result."""
+    baseline = {_key(result): result for result in baseline["results"]}
+    rows = []
+    for result in candidate["results"]:
+        before = baseline.get(_key(result))
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"] if before["median"] > 0 else float("inf")
+        rows.append(
+            (
+                result["name"],
+                result["params"],
+                before["median"],
+                result["median"],
+                ratio,
+                ratio > 1 + threshold,
+            )
+        )
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown ratio")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f, open(args.candidate) as g:
+        rows = compare(json.load(f), json.load(g), args.threshold)
+
+    for name, params, before, after, ratio, regressed in rows:
+        print(
+            f"{'!' if regressed else ' '} {name:<28} {json.dumps(params):<48} "
+            f"{before * 1e3:9.3f}ms -> {after * 1e3:9.3f}ms ({ratio:5.2f}x)"
+        )
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
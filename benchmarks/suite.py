@@ -0,0 +1,263 @@
+"""Offline benchmarks of the inference hot paths, on synthetic networks with random weights.
+
+The networks are generated with darknet.py.synthetic, so the suite needs no downloads:
+
+    python benchmarks/suite.py --batch-sizes 1,4,8 --image-sizes 640x480,1920x1080 --output a.json
+    python benchmarks/compare.py baseline.json a.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def measure(fn, repeat, warmup=1):
+    """Calls fn warmup + repeat times, and summarizes the timings of the last repeat calls."""
+    for _ in range(warmup):
+        fn()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return summarize(seconds)
+
+
+def summarize(seconds):
+    ordered = sorted(seconds)
+    return dict(
+        repeat=len(seconds),
+        min=ordered[0],
+        median=statistics.median(ordered),
+        mean=statistics.mean(ordered),
+        p90=ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))],
+        max=ordered[-1],
+    )
+
+
+def parse_sizes(text):
+    return [tuple(int(v) for v in size.split("x")) for size in text.split(",")]
+
+
+def random_image(width, height, seed=0):
+    rng = np.random.RandomState(seed)
+    return Image.fromarray(rng.randint(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+class Suite(object):
+    def __init__(self, directory, repeat, batch_sizes, image_sizes, network_size):
+        from darknet.py.synthetic import make_network
+
+        self.repeat = repeat
+        self.batch_sizes = batch_sizes
+        self.images = {size: random_image(*size) for size in image_sizes}
+        self.results = []
+
+        width, height = network_size
+        self.detector = make_network(directory, "detector", width=width, height=height)
+        self.classifier = make_network(directory, "classifier")
+
+    def record(self, name, timings, **params):
+        self.results.append(dict(name=name, params=params, **timings))
+        print(
+            f"{name:<28} {json.dumps(params):<48} median={timings['median'] * 1e3:9.3f}ms",
+            file=sys.stderr,
+        )
+
+    def run(self):
+        from darknet.py.network import Network
+
+        config_file, weights_file, _ = self.detector
+        detector = Network(config_file, weights_file, batch_size=1)
+        config_file, weights_file, _ = self.classifier
+        classifier = Network(config_file, weights_file, batch_size=1)
+
+        self.preprocess(detector)
+        self.predict(classifier, "classifier")
+        self.predict(detector, "detector")
+        self.detect(detector)
+        self.detect_batch()
+        self.nms()
+        self.sagemaker(detector, classifier)
+        return self.results
+
+    def preprocess(self, network):
+        from darknet.py.preprocess import LetterboxPreprocessor
+        from darknet.py.util import image_to_3darray
+
+        for (width, height), image in self.images.items():
+            self.record(
+                "image_to_3darray",
+                measure(lambda: image_to_3darray(image, network.shape), self.repeat),
+                image_size=[width, height],
+                network_size=list(network.shape),
+            )
+            for batch_size in self.batch_sizes:
+                images = [image] * batch_size
+                with LetterboxPreprocessor(network.shape, batch_size) as preprocessor:
+                    self.record(
+                        "letterbox_preprocessor",
+                        measure(lambda: preprocessor(images), self.repeat),
+                        image_size=[width, height],
+                        batch_size=batch_size,
+                    )
+
+    def predict(self, network, kind):
+        from darknet.py.util import image_to_3darray
+
+        frame, _ = image_to_3darray(next(iter(self.images.values())), network.shape)
+        flat = frame.reshape(-1)
+        self.record("predict", measure(lambda: network.predict(flat), self.repeat), network=kind)
+        self.record(
+            "predict_image",
+            measure(lambda: network.predict_image(frame), self.repeat),
+            network=kind,
+        )
+
+    def detect(self, network):
+        from darknet.py.detections import detections_to_tuples
+        from darknet.py.util import image_to_3darray
+
+        for (width, height), image in self.images.items():
+            frame, frame_size = image_to_3darray(image, network.shape)
+            network.predict_image(frame)
+            for as_array in (False, True):
+                self.record(
+                    "detect",
+                    measure(lambda: network.detect(frame_size, as_array=as_array), self.repeat),
+                    image_size=[width, height],
+                    as_array=as_array,
+                )
+            # convert_detections_to_tuples is a cdef function, the python conversion of the
+            # same rows is what detect spends on top of as_array=True.
+            detections = network.detect(frame_size, as_array=True)
+            self.record(
+                "detections_to_tuples",
+                measure(lambda: detections_to_tuples(detections), self.repeat),
+                image_size=[width, height],
+                num_detections=len(detections),
+            )
+
+    def detect_batch(self):
+        from darknet.py.network import Network
+        from darknet.py.preprocess import LetterboxPreprocessor
+
+        config_file, weights_file, _ = self.detector
+        image = next(iter(self.images.values()))
+        for batch_size in self.batch_sizes:
+            network = Network(config_file, weights_file, batch_size=batch_size)
+            with LetterboxPreprocessor.for_network(network) as preprocessor:
+                frames, _ = preprocessor([image] * batch_size)
+            frames = frames.reshape(-1)
+            timings = measure(
+                lambda: network.detect_batch(frames, letterbox=0, as_array=True), self.repeat
+            )
+            self.record("detect_batch", timings, batch_size=batch_size)
+            self.record(
+                "detect_batch_per_frame",
+                {k: v / batch_size if k != "repeat" else v for k, v in timings.items()},
+                batch_size=batch_size,
+            )
+
+    def nms(self):
+        from darknet.py.detections import DETECTION_DTYPE
+        from darknet.py.nms import NMS_TYPES, non_max_suppression
+
+        # Crowded frames, the p99 case of darknet's per frame, per class NMS
+        rng = np.random.RandomState(0)
+        for batch_size in self.batch_sizes:
+            for rows_per_frame in (100, 1000):
+                detections = np.zeros(batch_size * rows_per_frame, dtype=DETECTION_DTYPE)
+                detections["frame_index"] = np.repeat(np.arange(batch_size), rows_per_frame)
+                detections["class_id"] = rng.randint(0, 80, len(detections))
+                detections["prob"] = rng.rand(len(detections))
+                for field, scale in (("x", 416), ("y", 416), ("w", 64), ("h", 64)):
+                    detections[field] = rng.rand(len(detections)) * scale
+                for nms_type in NMS_TYPES:
+                    self.record(
+                        "non_max_suppression",
+                        measure(
+                            lambda: non_max_suppression(detections, 0.45, nms_type), self.repeat
+                        ),
+                        nms_type=nms_type,
+                        batch_size=batch_size,
+                        rows_per_frame=rows_per_frame,
+                    )
+
+    def sagemaker(self, detector, classifier):
+        try:
+            from darknet.sagemaker.classifier.default_inference_handler import (
+                DefaultDarknetClassifierInferenceHandler,
+            )
+            from darknet.sagemaker.detector.default_inference_handler import (
+                DefaultDarknetDetectorInferenceHandler,
+            )
+        except ImportError:
+            print(
+                "skipping default_predict_fn, sagemaker-inference is not installed", file=sys.stderr
+            )
+            return
+
+        handlers = [
+            ("detector", DefaultDarknetDetectorInferenceHandler(), detector, self.detector),
+            ("classifier", DefaultDarknetClassifierInferenceHandler(), classifier, self.classifier),
+        ]
+        for kind, handler, network, (_, _, labels) in handlers:
+            for (width, height), image in self.images.items():
+                data = {"Image": image}
+                self.record(
+                    "default_predict_fn",
+                    measure(
+                        lambda: handler.default_predict_fn(data, (network, labels)), self.repeat
+                    ),
+                    network=kind,
+                    image_size=[width, height],
+                )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--image-sizes", default="416x416,640x480,1920x1080")
+    parser.add_argument("--network-size", default="416x416")
+    parser.add_argument("--directory", help="where the synthetic networks are written")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    from darknet.py import __version__
+
+    with tempfile.TemporaryDirectory() as tmp:
+        suite = Suite(
+            args.directory or tmp,
+            repeat=args.repeat,
+            batch_sizes=[int(b) for b in args.batch_sizes.split(",")],
+            image_sizes=parse_sizes(args.image_sizes),
+            network_size=parse_sizes(args.network_size)[0],
+        )
+        results = dict(
+            benchmark="suite",
+            version=__version__,
+            python=platform.python_version(),
+            machine=platform.machine(),
+            processor=platform.processor(),
+            results=suite.run(),
+        )
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -50,6 +50,7 @@ doc_requirements = [
 mms_requirements = [
     # fmt: off
     "future",
+    "msgpack",
     "multi-model-server",
     "retrying",
     "sagemaker-inference",
@@ -57,7 +58,9 @@ mms_requirements = [
 ]
 zoo_requirements = [
     # fmt: off
+    "dask[dataframe]",
     "intake",
+    "pandas",
     # fmt: on
 ]
 
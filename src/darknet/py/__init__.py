@@ -1,6 +1,28 @@
 """Top-level package for DarkNet OpenSource Neural Networks in Python."""
 from ._version import version as __version__  # noqa: F401
+from .aio import AsyncImageClassifier, AsyncImageDetector
+from .batching import BatchScheduler
 from .classifier import Classifier, ImageClassifier
 from .detector import ImageDetector
+from .pipeline import DetectionPipeline
+from .pool import NetworkPool
+from .preprocess import Letterbox, LetterboxPreprocessor
+from .resolution import ResolutionNetworks
+from .result_cache import ResultCache
+from .tracking import VideoDetector
 
-__all__ = ["Classifier", "ImageClassifier", "ImageDetector"]
+__all__ = [
+    "AsyncImageClassifier",
+    "AsyncImageDetector",
+    "BatchScheduler",
+    "Classifier",
+    "DetectionPipeline",
+    "ImageClassifier",
+    "ImageDetector",
+    "Letterbox",
+    "LetterboxPreprocessor",
+    "NetworkPool",
+    "ResolutionNetworks",
+    "ResultCache",
+    "VideoDetector",
+]
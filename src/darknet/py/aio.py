@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from .classifier import top_k
+from .pool import NetworkPool
+from .util import image_to_3darray
+
+
+async def _aiter(images):
+    if hasattr(images, "__aiter__"):
+        async for image in images:
+            yield image
+    else:
+        for image in images:
+            yield image
+
+
+class AsyncNetworkBase(object):
+    """Runs blocking darknet work on a bounded executor, one thread per pooled Network.
+
+    At most ``max_pending`` calls are admitted at once, later callers wait for a slot. Calls that
+    are cancelled before a thread picks them up never run. Every event loop gets its own
+    max_pending slots, an instance may be used from successive loops, e.g. asyncio.run calls.
+    """
+
+    pool: NetworkPool
+
+    def __init__(self, config_url, weights_url, pool_size: int = None, max_pending: int = None):
+        self.pool = NetworkPool(config_url, weights_url, pool_size)
+        self.max_pending = max_pending or 2 * len(self.pool)
+        self._executor = ThreadPoolExecutor(len(self.pool), thread_name_prefix="darknet")
+        # An asyncio.Semaphore is bound to the loop it was created, or first waited, in
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def _submit(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        async with semaphore:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(fn, *args, **kwargs)
+            )
+
+    async def _map(self, fn, images, **kwargs) -> AsyncIterator:
+        pending = collections.deque()
+        try:
+            async for image in _aiter(images):
+                pending.append(asyncio.ensure_future(self._submit(fn, image, **kwargs)))
+                if len(pending) >= self.max_pending:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        """Waits for the running calls, and stops the executor."""
+        self._executor.shutdown()
+
+    async def aclose(self):
+        """close, without blocking the event loop while the running calls finish."""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+class AsyncImageDetector(AsyncNetworkBase):
+    def __init__(self, labels, config_url, weights_url, **kwargs):
+        super().__init__(config_url, weights_url, **kwargs)
+        self.labels = labels
+
+    async def detect(self, image, **kwargs):
+        return await self._submit(self._detect, image, **kwargs)
+
+    def detect_many(self, images, **kwargs) -> AsyncIterator:
+        """Detects objects in a (async) iterable of images, yielding results in order."""
+        return self._map(self._detect, images, **kwargs)
+
+    def _detect(self, image, **kwargs):
+        # Decode and preprocess before borrowing a network
+        image, frame_size = image_to_3darray(image, self.pool.shape)
+        kwargs.setdefault("frame_size", frame_size)
+        detections = self.pool.detect_image(image, **kwargs)
+        return (
+            detections
+            if self.labels is None or kwargs.get("as_array", False)
+            else [(self.labels[label_idx], prob, bbox) for label_idx, prob, bbox in detections]
+        )
+
+
+class AsyncImageClassifier(AsyncNetworkBase):
+    def __init__(self, labels, config_url, weights_url, **kwargs):
+        super().__init__(config_url, weights_url, **kwargs)
+
+        output_size = self.pool.networks[0].output_size()
+        self.labels = range(output_size) if labels is None else labels
+        if len(self.labels) != output_size:
+            raise TypeError(
+                "Number of labels does not match size of network output. "
+                f"{len(self.labels)} != {output_size}"
+            )
+
+    async def classify(self, image, top: int = -1):
+        return await self._submit(self._classify, image, top)
+
+    def classify_many(self, images, top: int = -1) -> AsyncIterator:
+        """Classifies a (async) iterable of images, yielding results in order."""
+        return self._map(self._classify, images, top=top)
+
+    def _classify(self, image, top: int = -1):
+        image, _ = image_to_3darray(image, self.pool.shape)
+        probabilities = self.pool.predict_image(image)
+        return top_k(self.labels, probabilities, top)
@@ -0,0 +1,275 @@
+"""A size bounded, content addressed cache of model artifacts, shared by the processes of a host.
+
+The cache directory holds::
+
+    blobs/<sha256>        the artifact contents, named after their sha256
+    refs/<key>.json       the blob of a (url, storage options) key, its mtime is the last use
+    locks/<key>.lock      held while the url is fetched
+    eviction.lock         held while blobs are evicted
+
+Exactly one process fetches a url, the others wait on its lock and then find the blob. Open
+artifacts hold a shared lock on their blob, eviction skips those and removes the least recently
+used blobs until the cache fits its byte budget.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import fsspec
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+_CHUNK_SIZE = 1 << 20
+
+
+class ArtifactCache(object):
+    """Fetches urls into ``root``, keeping at most ``max_bytes`` of blobs, 0 is unbounded."""
+
+    def __init__(self, root: str, max_bytes: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes
+        for name in ("blobs", "refs", "locks", "tmp"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+        self._stats_lock = threading.Lock()
+        self._stats = dict(hits=0, misses=0, fetched_bytes=0, evictions=0, evicted_bytes=0)
+
+    def stats(self) -> dict:
+        """This process's hits, misses, fetched and evicted bytes, and the cache size in bytes."""
+        with self._stats_lock:
+            rv = dict(self._stats)
+        rv.update(bytes=sum(size for size, _ in self._blob_sizes().values()))
+        rv.update(max_bytes=self.max_bytes)
+        return rv
+
+    def open(
+        self,
+        urlpath: str,
+        mode="rb",
+        encoding="utf8",
+        errors=None,
+        newline=None,
+        compression=None,
+        refresh: bool = False,
+        **kwargs,
+    ):
+        """An OpenFile like object, its file is the cached blob of urlpath.
+
+        The blob keeps the raw contents, a compression, e.g. "gzip" or "infer", is decompressed
+        while reading. refresh fetches the url again, even if it is cached.
+        """
+        return ArtifactFile(
+            self, urlpath, kwargs, mode, encoding, errors, newline, compression, refresh
+        )
+
+    def fetch(self, urlpath: str, refresh: bool = False, **storage_options) -> str:
+        """The blob file of urlpath, fetched with fsspec unless it is already cached."""
+        key = artifact_key(urlpath, storage_options)
+        ref_file = os.path.join(self.root, "refs", f"{key}.json")
+        with _locked(os.path.join(self.root, "locks", f"{key}.lock")):
+            blob_file = None if refresh else self._lookup(ref_file)
+            if blob_file is not None:
+                os.utime(ref_file)
+                self._count(hits=1)
+                return blob_file
+
+            blob_file, size = self._download(urlpath, storage_options)
+            _write_json(ref_file, dict(url=urlpath, blob=os.path.basename(blob_file), size=size))
+            self._count(misses=1, fetched_bytes=size)
+
+        self.evict(keep=blob_file)
+        return blob_file
+
+    def evict(self, keep: str = None):
+        """Removes the least recently used blobs that are not open until the cache fits."""
+        if self.max_bytes <= 0:
+            return
+        with _locked(os.path.join(self.root, "eviction.lock")):
+            blobs = self._blob_sizes()
+            total = sum(size for size, _ in blobs.values())
+            for blob_file, (size, _) in sorted(blobs.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                if blob_file != keep and _remove_unused(blob_file):
+                    total -= size
+                    self._count(evictions=1, evicted_bytes=size)
+
+    def _lookup(self, ref_file):
+        try:
+            with open(ref_file) as f:
+                blob_file = os.path.join(self.root, "blobs", json.load(f)["blob"])
+        except (OSError, ValueError, KeyError):
+            return None
+        return blob_file if os.path.exists(blob_file) else None
+
+    def _download(self, urlpath, storage_options):
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as out, fsspec.open(urlpath, "rb", **storage_options) as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            blob_file = os.path.join(self.root, "blobs", digest.hexdigest())
+            # Another url with the same contents may already have the blob, it may be open
+            if not os.path.exists(blob_file):
+                os.replace(tmp_name, blob_file)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+        return blob_file, size
+
+    def _blob_sizes(self) -> dict:
+        """The (size, last use) of every blob, the last use of its most recent ref."""
+        last_use = {}
+        refs = os.path.join(self.root, "refs")
+        for name in os.listdir(refs):
+            try:
+                with open(os.path.join(refs, name)) as f:
+                    blob = json.load(f)["blob"]
+                mtime = os.path.getmtime(os.path.join(refs, name))
+            except (OSError, ValueError, KeyError):
+                continue
+            last_use[blob] = max(mtime, last_use.get(blob, 0.0))
+
+        rv = {}
+        blobs = os.path.join(self.root, "blobs")
+        for name in os.listdir(blobs):
+            blob_file = os.path.join(blobs, name)
+            try:
+                rv[blob_file] = os.path.getsize(blob_file), last_use.get(name, 0.0)
+            except OSError:
+                continue
+        return rv
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+
+class ArtifactFile(object):
+    """Opens the cached blob of a url, and keeps it from being evicted while it is open."""
+
+    def __init__(
+        self,
+        cache: ArtifactCache,
+        urlpath,
+        storage_options,
+        mode,
+        encoding,
+        errors,
+        newline,
+        compression=None,
+        refresh: bool = False,
+    ):
+        self.cache = cache
+        self.urlpath = urlpath
+        self.storage_options = storage_options
+        self.mode = mode
+        self.encoding = encoding
+        self.errors = errors
+        self.newline = newline
+        self.compression = compression
+        self.refresh = refresh
+        if compression == "infer":
+            self.compression = fsspec.utils.infer_compression(urlpath.split("::")[-1])
+        self._pin = None
+        self._file = None
+
+    def __enter__(self):
+        while True:
+            blob_file = self.cache.fetch(self.urlpath, self.refresh, **self.storage_options)
+            try:
+                self._pin = _pin(blob_file)
+                break
+            except FileNotFoundError:
+                # Evicted by another process before it was pinned, fetch it again
+                continue
+
+        if self.compression is not None:
+            self._file = fsspec.open(
+                blob_file,
+                self.mode,
+                self.compression,
+                self.encoding,
+                self.errors,
+                newline=self.newline,
+            ).open()
+        elif "b" in self.mode:
+            self._file = open(blob_file, self.mode)
+        else:
+            self._file = open(
+                blob_file,
+                self.mode,
+                encoding=self.encoding,
+                errors=self.errors,
+                newline=self.newline,
+            )
+        return self._file
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        os.close(self._pin)
+        self._file = self._pin = None
+
+
+def artifact_key(urlpath: str, storage_options: dict) -> str:
+    """The sha256 of the url and its storage options."""
+    options = json.dumps(storage_options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{urlpath}\n{options}".encode("utf-8")).hexdigest()
+
+
+def _pin(blob_file) -> int:
+    """A file descriptor with a shared lock on the blob, eviction leaves it alone."""
+    fd = os.open(blob_file, os.O_RDONLY)
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+    if os.fstat(fd).st_nlink == 0:
+        os.close(fd)
+        raise FileNotFoundError(blob_file)
+    return fd
+
+
+def _remove_unused(blob_file) -> bool:
+    try:
+        fd = os.open(blob_file, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.remove(blob_file)
+        return True
+    except OSError:
+        # Open in some process
+        return False
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _locked(lock_file):
+    with open(lock_file, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _write_json(file_name, obj):
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_name, file_name)
@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .detections import detections_to_tuples, split_frames
+from .network import Network
+from .preprocess import LetterboxPreprocessor
+
+
+class BatchScheduler(object):
+    """Groups independent single-image requests into Network.detect_batch calls.
+
+    A batch is flushed as soon as it has ``max_batch_size`` images, or ``max_wait`` seconds after
+    its first image arrived, whichever comes first. A larger ``max_wait`` trades latency for
+    fuller batches. Each caller gets the detections of its own image, in frame pixels.
+
+    The scheduler owns the network, it must not be used by anything else while the scheduler is
+    open.
+    """
+
+    network: Network
+
+    def __init__(
+        self,
+        network: Network,
+        max_batch_size: int = None,
+        max_wait: float = 0.005,
+        max_workers: int = None,
+        **detect_kwargs,
+    ):
+        for key in ("frame_size", "relative", "letterbox"):
+            if key in detect_kwargs:
+                raise TypeError(f"The {key} argument is managed by the BatchScheduler.")
+
+        self.network = network
+        self.max_batch_size = min(max_batch_size or network.batch_size, network.batch_size)
+        self.max_wait = max_wait
+        self.detect_kwargs = detect_kwargs
+
+        self._preprocessor = LetterboxPreprocessor.for_network(network, max_workers)
+        self._requests = queue.Queue()
+        self._closed = False
+        self._closing = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="darknet-batch-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, image) -> Future:
+        """Queues an image, the Future resolves to its detections."""
+        future = Future()
+        with self._closing:
+            # Nothing may be queued after the sentinel of close
+            if self._closed:
+                raise RuntimeError("The BatchScheduler is closed.")
+            self._requests.put((image, future))
+        return future
+
+    def detect(self, image, timeout: float = None):
+        return self.submit(image).result(timeout)
+
+    def close(self):
+        """Stops accepting requests, and waits until the queued ones are processed."""
+        with self._closing:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(None)
+        self._thread.join()
+        self._preprocessor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self):
+        running = True
+        while running:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    running = False
+                    break
+                batch.append(request)
+
+            batch = [
+                (image, future) for image, future in batch if future.set_running_or_notify_cancel()
+            ]
+            if batch:
+                try:
+                    self._process(batch)
+                except Exception as e:
+                    # The scheduler thread must survive, and no caller may wait forever
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _process(self, batch):
+        try:
+            frames, letterboxes = self._preprocessor([image for image, _ in batch])
+            detections = self.network.detect_batch(
+                frames.reshape(-1),
+                frame_size=self.network.shape,
+                relative=0,
+                letterbox=0,
+                **dict(self.detect_kwargs, as_array=True),
+            )
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                # Do not fail the whole batch because of one bad image
+                for request in batch:
+                    self._process([request])
+            return
+
+        as_array = self.detect_kwargs.get("as_array", False)
+        for (_, future), letterbox, frame in zip(
+            batch, letterboxes, split_frames(detections, len(batch))
+        ):
+            try:
+                frame = letterbox.map_detections(frame)
+                frame["frame_index"] = 0
+                future.set_result(frame if as_array else detections_to_tuples(frame))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,192 @@
+"""Throughput and latency sweeps of a network over batch sizes, workers, threads and resolutions.
+
+Every configuration runs in a fresh process, so its peak RSS is its own, and darknet's OpenMP
+threads can be set before darknet starts. The workers are threads, each with its own Network,
+that run batches back to back; darknet releases the GIL during the forward pass.
+
+The "network" mode feeds random network inputs to detect_batch, or predict_batch for
+classifiers. The "image" mode also letterboxes a random image of ``image_size`` for every frame
+and maps the boxes back to it.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+MODES = ("network", "image")
+
+
+class BenchConfig(NamedTuple):
+    batch_size: int = 1
+    workers: int = 1
+    threads: int = 0
+    resolution: Tuple[int, int] = None
+
+
+def network_kind(config_file: str) -> str:
+    """The kind of a cfg, a detector with yolo, region or detection layers, else a classifier."""
+    with open(config_file) as f:
+        sections = {line.strip() for line in f if line.strip().startswith("[")}
+    return "detector" if sections & {"[yolo]", "[region]", "[detection]"} else "classifier"
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """The nearest rank percentile of sorted values."""
+    return ordered[min(len(ordered) - 1, max(0, int(np.ceil(q / 100.0 * len(ordered))) - 1))]
+
+
+def peak_rss() -> int:
+    """The peak resident set size of this process, in bytes, or 0 when unknown."""
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+def run_configuration(
+    config_file: str,
+    weights_file: str,
+    config: BenchConfig,
+    iterations: int = 20,
+    warmup: int = 2,
+    mode: str = "network",
+    image_size: Tuple[int, int] = (1280, 720),
+) -> dict:
+    """Runs one configuration in this process, see sweep."""
+    from .network import Network
+    from .preprocess import LetterboxPreprocessor
+    from .util import override_net_config
+
+    if mode not in MODES:
+        raise ValueError(f"The mode {mode} is not one of {MODES}")
+    kind = network_kind(config_file)
+    if config.resolution is not None:
+        width, height = config.resolution
+        config_file = override_net_config(config_file, width=width, height=height)
+
+    networks = [
+        Network(config_file, weights_file, config.batch_size) for _ in range(config.workers)
+    ]
+    rng = np.random.RandomState(0)
+    frames = rng.random_sample(config.batch_size * networks[0].input_size()).astype(np.float32)
+    image = rng.randint(0, 256, image_size[::-1] + (3,), dtype=np.uint8)
+
+    def run_batch(network, preprocessor):
+        inputs = frames
+        if preprocessor is not None:
+            inputs, letterboxes = preprocessor([image] * config.batch_size)
+            inputs = inputs.reshape(-1)
+        if kind == "classifier":
+            return network.predict_batch(inputs)
+        detections = network.detect_batch(
+            inputs, frame_size=network.shape, letterbox=0, as_array=True
+        )
+        if preprocessor is not None:
+            for i, letterbox in enumerate(letterboxes):
+                frame = detections["frame_index"] == i
+                detections[frame] = letterbox.map_detections(detections[frame])
+        return detections
+
+    latencies = [[] for _ in networks]
+    barrier = threading.Barrier(len(networks) + 1)
+
+    def worker(index):
+        network = networks[index]
+        preprocessor = None
+        if mode == "image":
+            preprocessor = LetterboxPreprocessor.for_network(network, max_workers=1)
+        for _ in range(warmup):
+            run_batch(network, preprocessor)
+        barrier.wait()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            run_batch(network, preprocessor)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(networks))]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latency for worker_latencies in latencies for latency in worker_latencies)
+    width, height = networks[0].shape
+    return dict(
+        batch_size=config.batch_size,
+        workers=config.workers,
+        threads=config.threads,
+        resolution=f"{width}x{height}",
+        mode=mode,
+        images=len(ordered) * config.batch_size,
+        images_per_sec=len(ordered) * config.batch_size / elapsed,
+        p50_ms=percentile(ordered, 50) * 1e3,
+        p95_ms=percentile(ordered, 95) * 1e3,
+        p99_ms=percentile(ordered, 99) * 1e3,
+        peak_rss_mb=peak_rss() / (1 << 20),
+    )
+
+
+def sweep(config_file: str, weights_file: str, configs: List[BenchConfig], **kwargs):
+    """Runs every configuration in its own process, and yields their results in order.
+
+    Args:
+        config_file: the network cfg file
+        weights_file: the network weights file
+        configs: the BenchConfig of every run, threads of 0 keep the OpenMP default and a
+            resolution of None the cfg's
+        kwargs: iterations, warmup, mode and image_size, see run_configuration
+    """
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        saved = os.environ.get("OMP_NUM_THREADS")
+        if config.threads > 0:
+            # The spawned process, and darknet's OpenMP runtime, start with this environment
+            os.environ["OMP_NUM_THREADS"] = str(config.threads)
+        try:
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                future = executor.submit(
+                    run_configuration, config_file, weights_file, config, **kwargs
+                )
+                yield future.result()
+        finally:
+            if saved is None:
+                os.environ.pop("OMP_NUM_THREADS", None)
+            else:
+                os.environ["OMP_NUM_THREADS"] = saved
+
+
+TABLE_COLUMNS = (
+    ("batch_size", "batch", "{:d}"),
+    ("workers", "workers", "{:d}"),
+    ("threads", "threads", "{:d}"),
+    ("resolution", "resolution", "{}"),
+    ("images_per_sec", "images/s", "{:.1f}"),
+    ("p50_ms", "p50 ms", "{:.2f}"),
+    ("p95_ms", "p95 ms", "{:.2f}"),
+    ("p99_ms", "p99 ms", "{:.2f}"),
+    ("peak_rss_mb", "peak RSS MB", "{:.1f}"),
+)
+
+
+def format_table(results: List[dict]) -> str:
+    """The results as a right aligned text table."""
+    rows = [[title for _, title, _ in TABLE_COLUMNS]]
+    rows.extend([fmt.format(result[key]) for key, _, fmt in TABLE_COLUMNS] for result in results)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(TABLE_COLUMNS))]
+    return "\n".join(
+        "  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows
+    )
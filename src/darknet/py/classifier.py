@@ -3,15 +3,62 @@ from abc import ABC, abstractmethod
 import numpy as np
 
 from .network import Network
+from .preprocess import LetterboxPreprocessor
+from .result_cache import ResultCache, image_digest
 from .util import image_to_3darray
 
 
+def top_k_batch(labels, probabilities: np.ndarray, top: int, min_confidence: float = None):
+    """The (label, probability) pairs of every row of a (N, num_classes) probabilities array.
+
+    Args:
+        labels: the label of every class
+        probabilities: a (N, num_classes) array
+        top: if positive, the number of most probable labels kept per row, in decreasing
+            probability, otherwise all the labels, in labels order
+        min_confidence: if set, the pairs below this probability are dropped
+
+    Returns: a list of [(label, probability), ...] per row
+    """
+    probabilities = np.asarray(probabilities)
+    num_classes = probabilities.shape[1]
+    if 0 < top < num_classes:
+        # argpartition finds the top classes in linear time, only those are sorted
+        indices = np.argpartition(-probabilities, top - 1, axis=1)[:, :top]
+    else:
+        indices = np.broadcast_to(np.arange(num_classes), probabilities.shape)
+    selected = np.take_along_axis(probabilities, indices, axis=1)
+    if top > 0:
+        order = np.argsort(-selected, axis=1, kind="stable")
+        indices = np.take_along_axis(indices, order, axis=1)
+        selected = np.take_along_axis(selected, order, axis=1)
+
+    rv = []
+    for row_indices, row_probabilities in zip(indices.tolist(), selected.tolist()):
+        rv.append(
+            [
+                (labels[idx], prob)
+                for idx, prob in zip(row_indices, row_probabilities)
+                if min_confidence is None or prob >= min_confidence
+            ]
+        )
+    return rv
+
+
+def top_k(labels, probabilities, top):
+    return top_k_batch(labels, np.asarray(probabilities)[np.newaxis], top)[0]
+
+
 class ClassifierBase(ABC):
     network: Network
     labels: list
+    result_cache: ResultCache = None
 
-    def __init__(self, labels, config_url, weights_url, **kwargs):
+    def __init__(self, labels, config_url, weights_url, result_cache=None, **kwargs):
         self.network = Network.open(config_url, weights_url, **kwargs)
+        # The model identity of the result cache keys
+        self.config_url, self.weights_url = config_url, weights_url
+        self.result_cache = result_cache
 
         self.labels = range(self.network.output_size()) if labels is None else labels
         if len(self.labels) != self.network.output_size():
@@ -25,22 +72,62 @@ class ClassifierBase(ABC):
         pass
 
     def top_k(self, probabilities, top):
-        rv = zip(self.labels, probabilities)
-        if top > 0:
-            rv = sorted(rv, key=lambda x: x[1], reverse=True)[0:top]
-        else:
-            rv = list(rv)
+        return top_k(self.labels, probabilities, top)
+
+    def predict_batch(self, inputs: np.ndarray) -> np.ndarray:
+        """Runs (N, input_size) network inputs, batch_size of them per forward pass."""
+        batch_size = self.network.batch_size
+        rv = np.empty((len(inputs), self.network.output_size()), dtype=np.float32)
+        for start in range(0, len(inputs), batch_size):
+            stop = start + batch_size
+            rv[start:stop] = self.network.predict_batch(inputs[start:stop].reshape(-1))
         return rv
 
 
 class Classifier(ClassifierBase):
     def classify(self, input_ndarr: np.ndarray, top: int = -1):
-        probabilities = self.network.predict(input)
+        # predict_batch, unlike predict, reads a single input on networks of any batch size
+        input_ndarr = np.ascontiguousarray(input_ndarr, dtype=np.float32).reshape(-1)
+        probabilities = self.network.predict_batch(input_ndarr)[0]
         return self.top_k(probabilities, top)
 
+    def classify_batch(self, inputs: np.ndarray, top: int = -1, min_confidence: float = None):
+        """Classifies (N, input_size) network inputs, see top_k_batch for the results."""
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32)
+        probabilities = self.predict_batch(inputs.reshape((-1, self.network.input_size())))
+        return top_k_batch(self.labels, probabilities, top, min_confidence)
+
 
 class ImageClassifier(ClassifierBase):
+    _preprocessor: LetterboxPreprocessor = None
+
     def classify(self, image, top: int = -1):
+        key = None
+        digest = image_digest(image) if self.result_cache is not None else None
+        if digest is not None:
+            key = ResultCache.key(digest, self.config_url, self.weights_url, top=top)
+            rv = self.result_cache.get(key, self.network.name)
+            if rv is not None:
+                return rv
+
         image, _ = image_to_3darray(image, self.network.shape)
         probabilities = self.network.predict_image(image)
-        return self.top_k(probabilities, top)
+        rv = self.top_k(probabilities, top)
+        if key is not None:
+            self.result_cache.put(key, rv)
+        return rv
+
+    def classify_batch(self, images, top: int = -1, min_confidence: float = None):
+        """Classifies images, batch_size of them per forward pass, see top_k_batch."""
+        if self._preprocessor is None:
+            self._preprocessor = LetterboxPreprocessor.for_network(self.network)
+
+        images = list(images)
+        batch_size = self.network.batch_size
+        rv = []
+        for start in range(0, len(images), batch_size):
+            stop = start + batch_size
+            frames, _ = self._preprocessor(images[start:stop])
+            probabilities = self.network.predict_batch(frames.reshape(-1))
+            rv.extend(top_k_batch(self.labels, probabilities, top, min_confidence))
+        return rv
@@ -1,19 +1,418 @@
 """Console script for darknet.py."""
 
+import glob
+import hashlib
+import json
+import os
+import shutil
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import click
+from fsspec.core import get_fs_token_paths
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+@click.group()
+def py():
+    """DarkNet OpenSource Neural Networks in Python."""
+
+
+def expand_images(inputs) -> list:
+    """The image urls of directories, globs, files and fsspec urls, sorted."""
+    rv = []
+    for urlpath in inputs:
+        fs, _, paths = get_fs_token_paths(urlpath)
+        protocol = fs.protocol if isinstance(fs.protocol, str) else fs.protocol[0]
+        for path in paths:
+            if fs.isdir(path):
+                found = [p for p in fs.find(path) if p.lower().endswith(IMAGE_EXTENSIONS)]
+            else:
+                found = [path]
+            rv.extend(p if protocol in ("file", "local") else f"{protocol}://{p}" for p in found)
+    return sorted(set(rv))
+
+
+class Checkpoint(object):
+    """The number of images already written, for the exact same list of images and output.
+
+    JSON lines outputs also record their size, a resumed run drops whatever a crash left past it.
+    """
+
+    def __init__(self, file_name, images: list, output: str):
+        # Without a file name nothing is saved, e.g. for stdout
+        self.file_name = file_name
+        self.key = hashlib.sha256("\n".join([output] + images).encode("utf-8")).hexdigest()
+        self.done = 0
+        self.output_size = 0
+
+    def load(self):
+        if self.file_name is None:
+            return self
+        try:
+            with open(self.file_name) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if state.get("key") == self.key:
+            self.done, self.output_size = state["done"], state["output_size"]
+        return self
+
+    def save(self, done: int, output_size: int):
+        self.done, self.output_size = done, output_size
+        if self.file_name is None:
+            return
+        tmp_name = f"{self.file_name}.tmp"
+        with open(tmp_name, "w") as f:
+            json.dump(dict(key=self.key, done=done, output_size=output_size), f)
+        os.replace(tmp_name, self.file_name)
+
+
+def _has_size(file_name: str, size: int) -> bool:
+    """Whether a file exists with at least size bytes."""
+    try:
+        return os.path.getsize(file_name) >= size
+    except OSError:
+        return False
+
+
+class JsonLinesWriter(object):
+    def __init__(self, output: str, checkpoint: Checkpoint):
+        if output == "-":
+            self._file = sys.stdout
+            return
+        if checkpoint.done and not _has_size(output, checkpoint.output_size):
+            # The output the checkpoint counted is gone, start over
+            checkpoint.done, checkpoint.output_size = 0, 0
+        self._file = open(output, "r+" if checkpoint.done else "w")
+        self._file.truncate(checkpoint.output_size)
+        self._file.seek(checkpoint.output_size)
+
+    def write(self, frame) -> int:
+        if len(frame):
+            self._file.write(frame.to_json(orient="records", lines=True).rstrip("\n") + "\n")
+        self._file.flush()
+        return self._file.tell() if self._file is not sys.stdout else 0
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetWriter(object):
+    """A directory of parquet files, one per chunk of images."""
+
+    def __init__(self, output: str, checkpoint: Checkpoint):
+        self.output = output
+        self.part = checkpoint.output_size
+        os.makedirs(output, exist_ok=True)
+        for file_name in glob.glob(os.path.join(output, "part-*.parquet")):
+            if int(os.path.basename(file_name)[5:-8]) >= self.part:
+                os.remove(file_name)
+
+    def write(self, frame) -> int:
+        frame.to_parquet(os.path.join(self.output, f"part-{self.part:05d}.parquet"), index=False)
+        self.part += 1
+        return self.part
+
+    def close(self):
+        pass
+
+
+def run_scoring(
+    images, output, output_format, checkpoint_file, resume, workers, chunk_size, kwargs
+):
+    """Scores the images in chunks, on workers processes, and writes the results in order."""
+    try:
+        from .scoring import score_images
+    except ImportError as e:
+        raise click.ClickException(f"Scoring needs {e.name}, pip install darknet.py[zoo].")
+
+    if output_format is None:
+        output_format = "parquet" if output.endswith(".parquet") else "jsonl"
+    if output_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise click.ClickException("Parquet outputs need pyarrow, pip install pyarrow.")
+    if output == "-" and (output_format == "parquet" or resume):
+        raise click.UsageError("Parquet outputs and --resume need an --output path.")
+
+    if checkpoint_file is None and output != "-":
+        checkpoint_file = f"{output}.checkpoint"
+    checkpoint = Checkpoint(checkpoint_file, images, output)
+    if resume:
+        checkpoint.load()
+    writer = (ParquetWriter if output_format == "parquet" else JsonLinesWriter)(output, checkpoint)
+    resumed = checkpoint.done
+
+    chunks = []
+    for start in range(resumed, len(images), chunk_size):
+        stop = start + chunk_size
+        chunks.append(images[start:stop])
+
+    # Every worker process loads the network once, see darknet.py.scoring
+    score = partial(score_images, **kwargs)
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    results = executor.map(score, chunks) if executor is not None else map(score, chunks)
+
+    started = time.monotonic()
+    try:
+        with click.progressbar(
+            length=len(images),
+            label="Scoring",
+            file=sys.stderr,
+            show_pos=True,
+            item_show_func=lambda rate: rate,
+        ) as progress:
+            progress.update(resumed)
+            for chunk, frame in zip(chunks, results):
+                checkpoint.save(checkpoint.done + len(chunk), writer.write(frame))
+                rate = (checkpoint.done - resumed) / max(time.monotonic() - started, 1e-6)
+                progress.current_item = f"{rate:.1f} images/s"
+                progress.update(len(chunk))
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def scoring_options(command):
+    """The model, inputs and output options of the detect and classify commands."""
+    options = [
+        click.argument("inputs", nargs=-1, required=True),
+        click.option("--config", "-c", required=True, help="The network cfg url."),
+        click.option("--weights", "-w", required=True, help="The network weights url."),
+        click.option("--labels", "-l", default=None, help="The labels url, one per line."),
+        click.option("--batch-size", "-b", default=1, show_default=True, help="Images per batch."),
+        click.option("--workers", "-j", default=1, show_default=True, help="Worker processes."),
+        click.option(
+            "--chunk-size",
+            default=256,
+            show_default=True,
+            help="Images per worker task, and per checkpoint.",
+        ),
+        click.option(
+            "--output", "-o", default="-", show_default=True, help="The results file, - is stdout."
+        ),
+        click.option(
+            "--format",
+            "output_format",
+            type=click.Choice(["jsonl", "parquet"]),
+            default=None,
+            help="The output format, parquet for outputs ending in .parquet, otherwise jsonl. "
+            "Parquet outputs are directories of one file per chunk.",
+        ),
+        click.option(
+            "--checkpoint",
+            "checkpoint_file",
+            default=None,
+            help="The checkpoint file.  [default: <output>.checkpoint]",
+        ),
+        click.option(
+            "--resume/--no-resume",
+            default=False,
+            show_default=True,
+            help="Continue after the images of the checkpoint.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+@py.command()
+@scoring_options
+@click.option("--threshold", default=0.5, show_default=True, help="Minimum detection probability.")
+@click.option("--nms-threshold", default=0.45, show_default=True, help="NMS overlap threshold.")
+@click.option(
+    "--nms-type",
+    type=click.Choice(["sort", "obj", "greedy", "diou", "soft"]),
+    default="sort",
+    show_default=True,
+    help="darknet's sort or obj NMS, or the vectorized darknet.py.nms types.",
+)
+def detect(inputs, config, weights, labels, batch_size, workers, chunk_size, **kwargs):
+    """Detects the objects in the INPUTS images: directories, globs, files or fsspec urls.
+
+    Writes one row per detection: urlpath, class_id, label, prob and the (center x, center y,
+    width, height) box, in image pixels.
+    """
+    _score("detector", inputs, config, weights, labels, batch_size, workers, chunk_size, kwargs)
+
+
+@py.command()
+@scoring_options
+@click.option("--top", default=5, show_default=True, help="Most probable labels per image.")
+@click.option("--min-confidence", type=float, default=None, help="Minimum label probability.")
+def classify(inputs, config, weights, labels, batch_size, workers, chunk_size, **kwargs):
+    """Classifies the INPUTS images: directories, globs, files or fsspec urls.
+
+    Writes one row per label: urlpath, rank, class_id, label and prob.
+    """
+    _score("classifier", inputs, config, weights, labels, batch_size, workers, chunk_size, kwargs)
+
+
+def _score(kind, inputs, config, weights, labels, batch_size, workers, chunk_size, kwargs):
+    output = kwargs.pop("output")
+    output_format = kwargs.pop("output_format")
+    checkpoint_file = kwargs.pop("checkpoint_file")
+    resume = kwargs.pop("resume")
+
+    images = expand_images(inputs)
+    if not images:
+        raise click.UsageError(f"No images found in {' '.join(inputs)}")
+    kwargs = dict(
+        kwargs,
+        kind=kind,
+        net_config=config,
+        net_weights=weights,
+        names=labels,
+        batch_size=batch_size,
+    )
+    run_scoring(images, output, output_format, checkpoint_file, resume, workers, chunk_size, kwargs)
+
+
+def _int_list(ctx, param, value) -> list:
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise click.BadParameter(f"{value} is not a comma separated list of integers")
+
+
+def _size_list(ctx, param, value) -> list:
+    try:
+        return [tuple(int(v) for v in size.lower().split("x")) for size in value.split(",") if size]
+    except ValueError:
+        raise click.BadParameter(f"{value} is not a comma separated list of WIDTHxHEIGHT")
+
+
+@py.command()
+@click.option("--config", "-c", default=None, help="The network cfg url.")
+@click.option("--weights", "-w", default=None, help="The network weights url.")
+@click.option(
+    "--synthetic",
+    type=click.Choice(["detector", "classifier"]),
+    default=None,
+    help="Benchmark a generated network with random weights, instead of --config and --weights.",
+)
+@click.option(
+    "--batch-sizes", default="1", show_default=True, callback=_int_list, help="Images per batch."
+)
+@click.option(
+    "--workers", default="1", show_default=True, callback=_int_list, help="Concurrent networks."
+)
+@click.option(
+    "--threads",
+    default="0",
+    show_default=True,
+    callback=_int_list,
+    help="darknet's OpenMP threads, 0 is the OpenMP default.",
+)
+@click.option(
+    "--resolutions",
+    default="",
+    callback=_size_list,
+    help="Network WIDTHxHEIGHT inputs, e.g. 320x320,416x416.  [default: the cfg's]",
+)
+@click.option("--iterations", default=20, show_default=True, help="Timed batches per worker.")
+@click.option("--warmup", default=2, show_default=True, help="Untimed batches per worker.")
+@click.option(
+    "--mode",
+    type=click.Choice(["network", "image"]),
+    default="network",
+    show_default=True,
+    help="Time the network alone, or also the letterboxing of --image-size images.",
+)
+@click.option(
+    "--image-size",
+    default="1280x720",
+    show_default=True,
+    callback=lambda ctx, param, value: _size_list(ctx, param, value)[0],
+    help="The WIDTHxHEIGHT of the image mode images.",
+)
+@click.option(
+    "--json", "json_file", default=None, help="Also write the results as JSON, - is stdout."
+)
+def bench(
+    config,
+    weights,
+    synthetic,
+    batch_sizes,
+    workers,
+    threads,
+    resolutions,
+    iterations,
+    warmup,
+    mode,
+    image_size,
+    json_file,
+):
+    """Sweeps the batch sizes, workers, threads and resolutions of a network.
+
+    Reports the images/s, the p50, p95 and p99 batch latencies and the peak RSS of every
+    configuration, each run in a fresh process.
+    """
+    import itertools
+    import tempfile
+
+    from .bench import BenchConfig, format_table, sweep
+    from .util import fsspec_cache_open
+
+    if synthetic is None and (config is None or weights is None):
+        raise click.UsageError("Either --config and --weights, or --synthetic, are needed.")
+
+    with tempfile.TemporaryDirectory() as directory:
+        if synthetic is not None:
+            from .synthetic import make_network
+
+            config_file, weights_file, _ = make_network(directory, synthetic)
+        else:
+            # darknet reads local files, remote ones are fetched into the artifact cache
+            config_file, weights_file = (
+                _local_file(url, directory, fsspec_cache_open) for url in (config, weights)
+            )
+
+        configs = [
+            BenchConfig(*values)
+            for values in itertools.product(batch_sizes, workers, threads, resolutions or [None])
+        ]
+        results = []
+        runs = sweep(
+            config_file,
+            weights_file,
+            configs,
+            iterations=iterations,
+            warmup=warmup,
+            mode=mode,
+            image_size=image_size,
+        )
+        with click.progressbar(
+            runs, length=len(configs), label="Benchmarking", file=sys.stderr
+        ) as bar:
+            results.extend(bar)
+
+    # With the JSON on stdout, the table goes to stderr
+    click.echo(format_table(results), err=json_file == "-")
+    if json_file == "-":
+        click.echo(json.dumps(results, indent=2))
+    elif json_file is not None:
+        with open(json_file, "w") as f:
+            json.dump(results, f, indent=2)
 
 
-@click.command()
-def py(args=None):
-    """Console script for darknet.py."""
-    # fmt: off
-    click.echo("Replace this message by putting your code into "
-               "py.cli.main")
-    click.echo("See click documentation at https://click.palletsprojects.com/")
-    # fmt: on
-    return 0
+def _local_file(url, directory, open_file) -> str:
+    if os.path.exists(url):
+        return url
+    # Chained urls, e.g. filecache::https://..., end with the one that names the file
+    file_name = os.path.join(directory, os.path.basename(url.split("::")[-1]))
+    with open_file(url, mode="rb") as src, open(file_name, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    return file_name
 
 
 if __name__ == "__main__":
-    sys.exit(py)  # pragma: no cover
+    sys.exit(py())  # pragma: no cover
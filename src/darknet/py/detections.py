@@ -0,0 +1,52 @@
+from typing import List
+
+import numpy as np
+
+# One row per (box, class) hit, it must match the detection_t struct in network.pyx
+DETECTION_DTYPE = np.dtype(
+    [
+        ("class_id", np.int32),
+        ("prob", np.float32),
+        ("x", np.float32),
+        ("y", np.float32),
+        ("w", np.float32),
+        ("h", np.float32),
+        ("objectness", np.float32),
+        ("frame_index", np.int32),
+    ]
+)
+
+
+def sort_detections(detections: np.ndarray, top_k: int = -1) -> np.ndarray:
+    """Sorts detections by frame and decreasing probability.
+
+    Args:
+        detections: a DETECTION_DTYPE array
+        top_k: if positive, the number of detections to keep per frame
+
+    Returns: a sorted copy of detections
+    """
+    order = np.lexsort((-detections["prob"], detections["frame_index"]))
+    detections = detections[order]
+    if top_k > 0 and len(detections) > top_k:
+        frames = detections["frame_index"]
+        rank = np.arange(len(frames)) - np.searchsorted(frames, frames, side="left")
+        detections = detections[rank < top_k]
+    return detections
+
+
+def split_frames(detections: np.ndarray, num_frames: int) -> List[np.ndarray]:
+    """Splits detections sorted by frame_index into one array per frame."""
+    bounds = np.searchsorted(detections["frame_index"], np.arange(num_frames + 1))
+    return [detections[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def detections_to_tuples(detections: np.ndarray) -> list:
+    """Converts detections to the [(class_id, prob, (x, y, w, h)), ...] format."""
+    bboxes = zip(
+        detections["x"].tolist(),
+        detections["y"].tolist(),
+        detections["w"].tolist(),
+        detections["h"].tolist(),
+    )
+    return list(zip(detections["class_id"].tolist(), detections["prob"].tolist(), bboxes))
@@ -1,31 +1,99 @@
+import time
+
+from .detections import detections_to_tuples
 from .network import Network
+from .resolution import ResolutionNetworks
+from .result_cache import ResultCache, image_digest
+from .tiling import detect_tiled
 from .util import image_to_3darray
 
 
 class ImageDetector(object):
     network: Network = None
+    networks: ResolutionNetworks = None
     labels = None
+    result_cache: ResultCache = None
 
     _last_image_size = None
+    _last_network = None
 
-    def __init__(self, labels, config_url, weights_url, **kwargs):
-        self.network = Network.open(config_url, weights_url, **kwargs)
+    def __init__(
+        self, labels, config_url, weights_url, resolutions=None, result_cache=None, **kwargs
+    ):
+        """
+        Args:
+            resolutions: the other (width, height) inputs detect may run at, besides the cfg's
+            result_cache: a ResultCache of the detect results of encoded images, ndarrays and
+                PIL Images, it may be shared with other models. A hit skips load_image too, so
+                get_detections still describes the last image that missed
+            kwargs: batch_size and snapshot, see Network.open
+        """
+        self.networks = ResolutionNetworks(config_url, weights_url, resolutions, **kwargs)
+        self.network = self.networks.default
         self.labels = labels
+        self.result_cache = result_cache
+
+    def detect(self, image, resolution=None, latency_budget: float = None, **kwargs):
+        """Detects the objects of an image.
+
+        Args:
+            resolution: the (width, height) network input, the cfg's by default
+            latency_budget: seconds, picks the largest resolution expected to fit it instead
+
+        A result cache hit returns before load_image, the network and the last image size used by
+        get_detections stay those of the previous miss.
+        """
+        if resolution is None and latency_budget is not None:
+            resolution = self.networks.for_budget(latency_budget)
 
-    def detect(self, image, **kwargs):
-        self.load_image(image)
-        return self.get_detections(**kwargs)
+        key = None
+        digest = image_digest(image) if self.result_cache is not None else None
+        if digest is not None:
+            shape = self.networks.get(resolution).shape
+            key = ResultCache.key(
+                digest, self.networks.config_url, self.networks.weights_url, shape, **kwargs
+            )
+            rv = self.result_cache.get(key, self.network.name)
+            if rv is not None:
+                return rv
 
-    def load_image(self, image):
-        image, self._last_image_size = image_to_3darray(image, self.network.shape)
-        self.network.predict_image(image)
+        start = time.perf_counter()
+        self.load_image(image, resolution)
+        rv = self.get_detections(**kwargs)
+        self.networks.observe(self._last_network.shape, time.perf_counter() - start)
+        if key is not None:
+            self.result_cache.put(key, rv)
+        return rv
+
+    def detect_tiled(self, image, resolution=None, as_array: bool = False, **kwargs):
+        """Detects the objects of a large image in overlapping, network sized tiles.
+
+        The tiles keep the image's own resolution and run in full batches, so build the
+        detector with a batch_size larger than 1. See darknet.py.tiling.detect_tiled for the
+        overlap, nms_type, nms_threshold, top_k and threshold kwargs.
+        """
+        network = self.networks.get(resolution)
+        detections = detect_tiled(network, image, **kwargs)
+        if as_array:
+            return detections
+        detections = detections_to_tuples(detections)
+        return (
+            detections
+            if self.labels is None
+            else [(self.labels[label_idx], prob, bbox) for label_idx, prob, bbox in detections]
+        )
+
+    def load_image(self, image, resolution=None):
+        self._last_network = self.networks.get(resolution)
+        image, self._last_image_size = image_to_3darray(image, self._last_network.shape)
+        self._last_network.predict_image(image)
 
     def get_detections(self, **kwargs):
         if "frame_size" not in kwargs:
             kwargs["frame_size"] = self._last_image_size
-        detections = self.network.detect(**kwargs)
+        detections = (self._last_network or self.network).detect(**kwargs)
         return (
             detections
-            if self.labels is None
+            if self.labels is None or kwargs.get("as_array", False)
             else [(self.labels[label_idx], prob, bbox) for label_idx, prob, bbox in detections]
         )
@@ -1,39 +1,124 @@
+import math
 from typing import Iterable
 
-import fsspec
+import pandas as pd
+from fsspec.core import get_fs_token_paths
 from intake.source.base import DataSource, Schema
 
-from darknet.py import ImageClassifier
+from . import scoring
 
 
 class DarknetSource(DataSource):
+    """Scores a dataset of images with a darknet classifier or detector.
+
+    The images of ``urlpath``, a glob or a list of urls, are split in partitions of
+    ``partition_size`` images. Each partition is scored in batches by a network cached once per
+    process, see ``darknet.py.scoring``, into a pandas DataFrame of its classifications or
+    detections. ``to_dask()`` scores the partitions in parallel.
+
+    The zoo catalog entries describe the model, the images are given when opening them, e.g.
+    ``imagenet.darknet19(urlpath="s3://bucket/images/*.jpg").to_dask()``.
+    """
+
     name = "darknet"
-    version = "0.0.1"
-    container = "python"
-    partition_access = False
+    version = "0.1.0"
+    container = "dataframe"
+    partition_access = True
 
     def __init__(
-        self, names, net_config, net_weights, names_slice=None, storage_options=None, metadata=None
+        self,
+        names,
+        net_config,
+        net_weights,
+        names_slice=None,
+        urlpath=None,
+        kind="classifier",
+        batch_size=1,
+        partition_size=1024,
+        score_kwargs=None,
+        storage_options=None,
+        image_storage_options=None,
+        metadata=None,
     ):
-        self._names = names
+        if kind not in scoring.KINDS:
+            raise ValueError(f"The model kind {kind} is not one of {scoring.KINDS}")
         names_slice = names_slice or (-1,)
         names_slice = names_slice if isinstance(names_slice, Iterable) else (names_slice,)
-        self._names_slice = slice(*names_slice)
+        self._names = names
+        self._names_slice = tuple(names_slice)
         self._net_config = net_config
         self._net_weights = net_weights
+        self._urlpath = urlpath
+        self._kind = kind
+        self._batch_size = batch_size
+        self._partition_size = partition_size
+        self._score_kwargs = score_kwargs or {}
         self._storage_options = storage_options or {}
+        self._image_storage_options = image_storage_options or {}
+        self._urlpaths = None
         super().__init__(storage_options, metadata)
 
     def _get_schema(self):
+        if self._urlpath is None:
+            raise ValueError("The DarknetSource needs the urlpath of the images to score.")
+
+        if self._urlpaths is None:
+            fs, _, paths = get_fs_token_paths(
+                self._urlpath, storage_options=self._image_storage_options
+            )
+            # fsspec strips the protocol, the partitions may run in other processes
+            protocol = fs.protocol if isinstance(fs.protocol, str) else fs.protocol[0]
+            self._urlpaths = [
+                path if protocol == "file" else f"{protocol}://{path}" for path in paths
+            ]
+
+        meta = scoring.empty_frame(self._kind)
         return Schema(
-            datashape=None, dtype=None, shape=(None,), npartitions=0, extra_metadata=self.metadata
+            datashape=None,
+            dtype={name: str(dtype) for name, dtype in meta.dtypes.items()},
+            shape=(None, len(meta.columns)),
+            npartitions=max(1, math.ceil(len(self._urlpaths) / self._partition_size)),
+            extra_metadata=dict(num_images=len(self._urlpaths)),
         )
 
+    def _partition_kwargs(self):
+        return dict(
+            kind=self._kind,
+            net_config=self._net_config,
+            net_weights=self._net_weights,
+            names=self._names,
+            names_slice=self._names_slice,
+            batch_size=self._batch_size,
+            storage_options=self._storage_options,
+            image_storage_options=self._image_storage_options,
+            **self._score_kwargs,
+        )
+
+    def _partition_urlpaths(self, i):
+        start = i * self._partition_size
+        stop = start + self._partition_size
+        return self._urlpaths[start:stop]
+
     def _get_partition(self, i):
-        with fsspec.open(self._names, mode="rt", encoding="utf-8", **self._storage_options) as f:
-            names = [line.rstrip() for line in f.readlines()][self._names_slice]
-        with fsspec.open(
-            self._net_config, mode="rt", encoding="utf-8", **self._storage_options
-        ) as net_config:
-            with fsspec.open(self._net_weights, mode="rb", **self._storage_options) as net_weights:
-                return ImageClassifier(names, net_config.name, net_weights.name)
+        return scoring.score_images(self._partition_urlpaths(i), **self._partition_kwargs())
+
+    def read(self):
+        self._load_metadata()
+        return pd.concat(
+            [self._get_partition(i) for i in range(self.npartitions)], ignore_index=True
+        )
+
+    def to_dask(self):
+        import dask.dataframe as dd
+        from dask import delayed
+
+        self._load_metadata()
+        kwargs = self._partition_kwargs()
+        parts = [
+            delayed(scoring.score_images)(self._partition_urlpaths(i), **kwargs)
+            for i in range(self.npartitions)
+        ]
+        return dd.from_delayed(parts, meta=scoring.empty_frame(self._kind))
+
+    def _close(self):
+        self._urlpaths = None
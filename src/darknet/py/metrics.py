@@ -0,0 +1,238 @@
+"""Low overhead latency histograms of the inference stages, per stage and model.
+
+The metrics are off by default, ``enable()`` or the DARKNET_PY_METRICS=1 environment variable
+turns them on. While off, ``timer`` hands out a shared no-op timer, the instrumented code pays
+for a function call and two no-op method calls.
+
+Stages time themselves with the monotonic ``time.perf_counter``::
+
+    with metrics.timer("decode", model="yolov4"):
+        image = open_image(data)
+
+``snapshot()`` returns the histograms, ``to_prometheus()`` formats them in the Prometheus text
+exposition format. A process can also export its snapshots into a directory, and another one
+can serve the sum of them, e.g. the model server workers and their launcher.
+"""
+
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, Tuple
+
+ENABLE_ENV = "DARKNET_PY_METRICS"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, the upper bounds of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get(ENABLE_ENV, "") not in ("", "0")
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class Histogram(object):
+    """The count, sum and bucket counts of a stage's latencies."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return dict(count=self.count, sum=self.sum, buckets=list(self.buckets))
+
+
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float, model: str = ""):
+    """Records a latency, in seconds, of a stage of a model."""
+    key = (stage, model or "")
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    histogram.observe(seconds)
+
+
+class _Timer(object):
+    __slots__ = ("stage", "model", "start")
+
+    def __init__(self, stage, model):
+        self.stage = stage
+        self.model = model
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        observe(self.stage, time.perf_counter() - self.start, self.model)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage: str, model: str = ""):
+    """A context manager that records the latency of its block, while the metrics are on."""
+    return _Timer(stage, model) if _enabled else _NULL_TIMER
+
+
+def snapshot() -> dict:
+    """{"stage|model": {"count", "sum", "buckets"}} of every histogram of this process."""
+    with _histograms_lock:
+        items = list(_histograms.items())
+    return {f"{stage}|{model}": histogram.to_dict() for (stage, model), histogram in items}
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def merge(*snapshots) -> dict:
+    """The sum of several snapshots, e.g. of the model server workers."""
+    rv = {}
+    for snap in snapshots:
+        for key, value in snap.items():
+            total = rv.setdefault(key, dict(count=0, sum=0.0, buckets=[0] * (len(BUCKETS) + 1)))
+            total["count"] += value["count"]
+            total["sum"] += value["sum"]
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], value["buckets"])]
+    return rv
+
+
+def to_prometheus(snap: dict = None, name: str = "darknet_stage_seconds") -> str:
+    """A snapshot, this process's by default, in the Prometheus text exposition format."""
+    snap = snapshot() if snap is None else snap
+    lines = [
+        f"# HELP {name} Latency of the darknet.py inference stages.",
+        f"# TYPE {name} histogram",
+    ]
+    for key in sorted(snap):
+        stage, model = key.split("|", 1)
+        labels = f'stage="{stage}",model="{model}"'
+        value = snap[key]
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), value["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {value['sum']!r}")
+        lines.append(f"{name}_count{{{labels}}} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def export_snapshots(directory: str, interval: float = 5.0) -> threading.Thread:
+    """Writes this process's snapshot to ``directory`` every ``interval`` seconds.
+
+    The snapshot file is removed when the process exits, so it stops counting in read_snapshots.
+    """
+    os.makedirs(directory, exist_ok=True)
+    pid = os.getpid()
+    file_name = os.path.join(directory, f"{pid}.json")
+    stopped = threading.Event()
+    lock = threading.Lock()
+
+    def run():
+        while not stopped.wait(interval):
+            with lock:
+                if stopped.is_set():
+                    return
+                fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(snapshot(), f)
+                os.replace(tmp_name, file_name)
+
+    def remove():
+        # Forked children inherit the handler, only the exporting process owns the file
+        if os.getpid() != pid:
+            return
+        stopped.set()
+        with lock:
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+
+    atexit.register(remove)
+    thread = threading.Thread(target=run, name="darknet-metrics-export", daemon=True)
+    thread.start()
+    return thread
+
+
+def read_snapshots(directory: str) -> dict:
+    """The sum of the snapshots exported to ``directory``."""
+    snapshots = []
+    for file_name in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(file_name) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return merge(*snapshots)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(port: int, directory: str = None, host: str = "") -> HTTPServer:
+    """Serves GET /metrics from a daemon thread, the snapshots of directory, or this process's.
+
+    Returns: the server, ``shutdown()`` stops it
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            snap = snapshot() if directory is None else read_snapshots(directory)
+            body = to_prometheus(snap).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="darknet-metrics", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,445 @@
+"""Multi-process inference, frames and results travel through shared memory.
+
+Every worker process owns its own Network and a fixed set of slots in one shared memory block.
+A slot holds an input frame, letterboxed in place by the caller, and the output of the worker.
+Only the slot number and the detection parameters are pickled.
+
+Requires Python >= 3.8 (multiprocessing.shared_memory).
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from .classifier import top_k
+from .detections import DETECTION_DTYPE, detections_to_tuples
+from .network import Network
+from .preprocess import Letterbox, letterbox
+
+_READY, _DONE, _FAILED = "ready", "done", "failed"
+
+
+def _slot_arrays(buffer, num_slots, frame_shape, output_dtype, output_length):
+    frames = np.ndarray((num_slots,) + tuple(frame_shape), dtype=np.float32, buffer=buffer)
+    outputs = np.ndarray(
+        (num_slots, output_length), dtype=output_dtype, buffer=buffer, offset=frames.nbytes
+    )
+    return frames, outputs
+
+
+def _worker_main(worker_id, kind, config_url, weights_url, tasks, results):
+    # results is the write end of a pipe of this worker only, a worker killed while it writes
+    # must not hold a lock the other workers need
+    network = Network.open(config_url, weights_url)
+    width, height = network.shape
+    frame_shape = (network.depth, height, width)
+
+    # Warm start, the first forward pass allocates darknet's working memory
+    network.predict_image(np.zeros(frame_shape, dtype=np.float32))
+    results.send((_READY, worker_id, frame_shape, network.output_size()))
+
+    shm, frames, outputs = None, None, None
+    try:
+        for message in iter(tasks.get, None):
+            if message[0] == "attach":
+                _, name, num_slots, output_dtype, output_length = message
+                shm = shared_memory.SharedMemory(name)
+                frames, outputs = _slot_arrays(
+                    shm.buf, num_slots, frame_shape, output_dtype, output_length
+                )
+                continue
+
+            _, slot, sequence, kwargs = message
+            try:
+                if kind == "detector":
+                    network.predict_image(frames[slot])
+                    kwargs.update(frame_size=network.shape, relative=0, letterbox=0, as_array=True)
+                    detections = network.detect(**kwargs)
+                    num_rows = min(len(detections), outputs.shape[1])
+                    outputs[slot, :num_rows] = detections[:num_rows]
+                    results.send((_DONE, worker_id, slot, sequence, num_rows))
+                else:
+                    outputs[slot] = network.predict_image(frames[slot])
+                    results.send((_DONE, worker_id, slot, sequence, outputs.shape[1]))
+            except Exception as e:
+                results.send((_FAILED, worker_id, slot, sequence, f"{type(e).__name__}: {e}"))
+    finally:
+        del frames, outputs
+        if shm is not None:
+            shm.close()
+
+
+class _Task(object):
+    __slots__ = ("future", "letterbox", "sequence", "kwargs", "attempts")
+
+    def __init__(self, future: Future, box: Letterbox, sequence: int, kwargs: dict):
+        self.future = future
+        self.letterbox = box
+        self.sequence = sequence
+        self.kwargs = kwargs
+        self.attempts = 0
+
+
+class ProcessEngineBase(object):
+    """A pool of warm worker processes, each with its own Network.
+
+    Calls block while all the slots are busy. A worker that dies is restarted and its in-flight
+    frames are resubmitted, a frame that crashes ``max_retries + 1`` workers fails instead. A
+    worker that dies ``max_restarts`` times in a row without getting ready again is given up,
+    its frames fail, and once every worker is given up so do new calls.
+    """
+
+    kind: str = None
+
+    def __init__(
+        self,
+        config_url,
+        weights_url,
+        num_workers: int = None,
+        slots_per_worker: int = 2,
+        max_retries: int = 1,
+        max_restarts: int = 3,
+        start_timeout: float = 600.0,
+        monitor_interval: float = 0.5,
+    ):
+        self.config_url = config_url
+        self.weights_url = weights_url
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.slots_per_worker = slots_per_worker
+        self.max_retries = max_retries
+        self.max_restarts = max_restarts
+        self.monitor_interval = monitor_interval
+
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+        self._inflight = {}
+        self._sequence = 0
+        self._free_slots = queue.Queue()
+        self._workers = [None] * self.num_workers
+        self._tasks = [None] * self.num_workers
+        # The read end of the results pipe of every worker process, dead ones included
+        self._results = {}
+        # The restarts of each worker since it was last ready, None once it is given up
+        self._restarts = [0] * self.num_workers
+        self._shm = None
+
+        try:
+            for worker_id in range(self.num_workers):
+                self._start_worker(worker_id)
+            for worker_id in range(self.num_workers):
+                _, _, self.frame_shape, self.output_size = self._wait_ready(
+                    worker_id, start_timeout
+                )
+            self._allocate()
+        except BaseException:
+            self._shutdown_workers(timeout=0)
+            self._release()
+            raise
+
+        self._collector = threading.Thread(target=self._collect, name="darknet-collector")
+        self._collector.daemon = True
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._watch, name="darknet-monitor")
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    @property
+    def shape(self):
+        return self.frame_shape[2], self.frame_shape[1]
+
+    @property
+    def num_slots(self):
+        return self.num_workers * self.slots_per_worker
+
+    def _output_layout(self):
+        raise NotImplementedError()
+
+    def _result(self, output, task: _Task):
+        raise NotImplementedError()
+
+    def _start_worker(self, worker_id):
+        self._tasks[worker_id] = self._context.Queue()
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                self.kind,
+                self.config_url,
+                self.weights_url,
+                self._tasks[worker_id],
+                writer,
+            ),
+            name=f"darknet-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # The reader sees EOF once the process is gone
+        writer.close()
+        self._results[reader] = worker_id
+        self._workers[worker_id] = process
+
+    def _wait_ready(self, worker_id, timeout):
+        reader = next(r for r, w in self._results.items() if w == worker_id)
+        while not reader.poll(min(timeout, 1.0)):
+            timeout -= 1.0
+            if not self._workers[worker_id].is_alive():
+                raise RuntimeError("A darknet worker died while loading its network.")
+            if timeout <= 0:
+                raise TimeoutError("The darknet workers did not start in time.")
+        return reader.recv()
+
+    def _allocate(self):
+        output_dtype, output_length = self._output_layout()
+        frame_bytes = int(np.prod(self.frame_shape)) * np.dtype(np.float32).itemsize
+        output_bytes = output_length * np.dtype(output_dtype).itemsize
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self.num_slots * (frame_bytes + output_bytes)
+        )
+        self._frames, self._outputs = _slot_arrays(
+            self._shm.buf, self.num_slots, self.frame_shape, output_dtype, output_length
+        )
+        for worker_id in range(self.num_workers):
+            self._attach(worker_id)
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+
+    def _attach(self, worker_id):
+        output_dtype, output_length = self._output_layout()
+        self._tasks[worker_id].put(
+            ("attach", self._shm.name, self.num_slots, output_dtype, output_length)
+        )
+
+    def _submit(self, image, kwargs) -> Future:
+        slot = self._acquire_slot()
+        try:
+            box = letterbox(image, self._frames[slot])
+        except BaseException:
+            self._free_slots.put(slot)
+            raise
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._stopping.is_set():
+                self._free_slots.put(slot)
+                raise RuntimeError("The engine is closed.")
+            self._sequence += 1
+            self._inflight[slot] = _Task(future, box, self._sequence, kwargs)
+            self._send(slot)
+        return future
+
+    def _acquire_slot(self) -> int:
+        """A free slot of a live worker, it waits for one until the engine closes."""
+        while True:
+            if self._stopping.is_set():
+                raise RuntimeError("The engine is closed.")
+            if all(restarts is None for restarts in self._restarts):
+                raise RuntimeError("Every darknet worker kept dying, the engine gave up.")
+            try:
+                slot = self._free_slots.get(timeout=self.monitor_interval)
+            except queue.Empty:
+                continue
+            if self._restarts[slot // self.slots_per_worker] is not None:
+                return slot
+            # The slots of a given up worker leave the rotation
+
+    def _send(self, slot):
+        task = self._inflight[slot]
+        self._tasks[slot // self.slots_per_worker].put(("run", slot, task.sequence, task.kwargs))
+
+    def _collect(self):
+        while True:
+            # Once the workers are shut down, drain what they wrote before leaving
+            stopped = self._stopped.is_set()
+            with self._lock:
+                readers = list(self._results)
+            ready = wait(readers, timeout=0 if stopped else self.monitor_interval)
+            if stopped and not ready:
+                return
+            for reader in ready:
+                try:
+                    message = reader.recv()
+                except (EOFError, OSError):
+                    # A dead worker, the monitor restarts it
+                    with self._lock:
+                        del self._results[reader]
+                    reader.close()
+                    continue
+                self._handle(message)
+
+    def _handle(self, message):
+        status, worker_id = message[0], message[1]
+        if status == _READY:
+            # A restarted worker, give it the slots and its unfinished frames again
+            with self._lock:
+                if self._restarts[worker_id] is None:
+                    return
+                self._restarts[worker_id] = 0
+                self._attach(worker_id)
+                for slot in self._inflight:
+                    if slot // self.slots_per_worker == worker_id:
+                        self._send(slot)
+            return
+
+        _, _, slot, sequence, payload = message
+        with self._lock:
+            task = self._inflight.get(slot)
+            if task is None or task.sequence != sequence:
+                return
+            del self._inflight[slot]
+
+        try:
+            if status == _DONE:
+                task.future.set_result(self._result(self._outputs[slot, :payload], task))
+            else:
+                task.future.set_exception(RuntimeError(payload))
+        except Exception as e:
+            task.future.set_exception(e)
+        finally:
+            self._free_slots.put(slot)
+
+    def _watch(self):
+        while not self._stopping.wait(self.monitor_interval):
+            for worker_id, process in enumerate(self._workers):
+                if self._restarts[worker_id] is None or self._stopping.is_set():
+                    continue
+                if not process.is_alive():
+                    self._restart(worker_id)
+
+    def _restart(self, worker_id):
+        with self._lock:
+            self._restarts[worker_id] += 1
+            given_up = self._restarts[worker_id] > self.max_restarts
+            for slot, task in list(self._inflight.items()):
+                if slot // self.slots_per_worker != worker_id:
+                    continue
+                task.attempts += 1
+                if given_up or task.attempts > self.max_retries:
+                    del self._inflight[slot]
+                    reason = "kept dying" if given_up else "crashed on this frame"
+                    task.future.set_exception(
+                        RuntimeError(f"The darknet worker {worker_id} {reason}.")
+                    )
+                    self._free_slots.put(slot)
+            self._tasks[worker_id].cancel_join_thread()
+            if given_up:
+                self._restarts[worker_id] = None
+            else:
+                self._start_worker(worker_id)
+
+    def _shutdown_workers(self, timeout):
+        for worker_id, process in enumerate(self._workers):
+            if process is not None and process.is_alive():
+                self._tasks[worker_id].put(None)
+        for process in self._workers:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+        for tasks in self._tasks:
+            if tasks is not None:
+                # Frames never read by a dead worker must not block the exit
+                tasks.cancel_join_thread()
+
+    def _release(self):
+        for reader in self._results:
+            reader.close()
+        self._results.clear()
+        if self._shm is not None:
+            del self._frames, self._outputs
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self, timeout: float = 10.0):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._monitor.join()
+        self._shutdown_workers(timeout)
+        self._stopped.set()
+        self._collector.join()
+        for task in self._inflight.values():
+            task.future.set_exception(RuntimeError("The engine was closed."))
+        self._inflight.clear()
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ProcessImageDetector(ProcessEngineBase):
+    """The ImageDetector surface, on a pool of worker processes.
+
+    At most ``max_detections`` detections, the most probable ones, are returned per image.
+    """
+
+    kind = "detector"
+
+    def __init__(self, labels, config_url, weights_url, max_detections: int = 1024, **kwargs):
+        self.labels = labels
+        self.max_detections = max_detections
+        super().__init__(config_url, weights_url, **kwargs)
+
+    def _output_layout(self):
+        return DETECTION_DTYPE, self.max_detections
+
+    def submit(self, image, **kwargs) -> Future:
+        for key in ("frame_size", "relative", "letterbox"):
+            if key in kwargs:
+                raise TypeError(f"The {key} argument is managed by the {type(self).__name__}.")
+        return self._submit(image, kwargs)
+
+    def detect(self, image, **kwargs):
+        return self.submit(image, **kwargs).result()
+
+    def _result(self, output, task: _Task):
+        detections = task.letterbox.map_detections(output.copy())
+        if task.kwargs.get("as_array", False):
+            return detections
+        detections = detections_to_tuples(detections)
+        return (
+            detections
+            if self.labels is None
+            else [(self.labels[label_idx], prob, bbox) for label_idx, prob, bbox in detections]
+        )
+
+
+class ProcessImageClassifier(ProcessEngineBase):
+    """The ImageClassifier surface, on a pool of worker processes."""
+
+    kind = "classifier"
+
+    def __init__(self, labels, config_url, weights_url, **kwargs):
+        super().__init__(config_url, weights_url, **kwargs)
+        self.labels = range(self.output_size) if labels is None else labels
+        if len(self.labels) != self.output_size:
+            self.close()
+            raise TypeError(
+                "Number of labels does not match size of network output. "
+                f"{len(self.labels)} != {self.output_size}"
+            )
+
+    def _output_layout(self):
+        return np.float32, self.output_size
+
+    def submit(self, image, top: int = -1) -> Future:
+        return self._submit(image, dict(top=top))
+
+    def classify(self, image, top: int = -1):
+        return self.submit(image, top).result()
+
+    def _result(self, output, task: _Task):
+        return top_k(self.labels, output.copy(), task.kwargs["top"])
@@ -1,33 +1,133 @@
 # network.pyx
+import os
 from copy import deepcopy
+from time import perf_counter
 
 import numpy as np
+cimport cython
 cimport numpy as np
 cimport libdarknet as dn
 
 from libc.stdlib cimport free
-from .util import fsspec_cache_open
+from . import metrics
+from .detections import DETECTION_DTYPE, detections_to_tuples, sort_detections, split_frames
+from .nms import DEFAULT_PRE_NMS_TOP_K, NMS_TYPES, non_max_suppression
+from .snapshot import resolve_snapshot
+from .util import fsspec_cache_open, override_net_config
 
 np.import_array()
 
-cdef convert_detections_to_tuples(dn.detection* detections, int num_dets, str nms_type, float nms_threshold):
+cdef packed struct detection_t:
+    # It must match darknet.py.detections.DETECTION_DTYPE
+    np.int32_t class_id
+    np.float32_t prob
+    np.float32_t x
+    np.float32_t y
+    np.float32_t w
+    np.float32_t h
+    np.float32_t objectness
+    np.int32_t frame_index
+
+
+cdef apply_nms(dn.detection* detections, int num_dets, str nms_type, float nms_threshold):
     if nms_threshold > 0 and num_dets > 0:
         if nms_type == "obj":
-            dn.do_nms_obj(detections, num_dets, detections[0].classes, nms_threshold)
+            with nogil:
+                dn.do_nms_obj(detections, num_dets, detections[0].classes, nms_threshold)
         elif nms_type == "sort":
-            dn.do_nms_sort(detections, num_dets, detections[0].classes, nms_threshold)
+            with nogil:
+                dn.do_nms_sort(detections, num_dets, detections[0].classes, nms_threshold)
         else:
-            raise ValueError(f"non-maximum-suppression type {nms_type} is not one of {['obj', 'sort']}")
-    rv = [
-        (j,
-         detections[i].prob[j],
-         (detections[i].bbox.x, detections[i].bbox.y, detections[i].bbox.w, detections[i].bbox.h)
-        )
-        for i in range(num_dets)
-        for j in range(detections[i].classes)
-        if detections[i].prob[j] > 0
-    ]
-    return sorted(rv, key=lambda x: x[1], reverse=True)
+            raise ValueError(f"non-maximum-suppression type {nms_type} is not one of "
+                             f"{('obj', 'sort') + NMS_TYPES}")
+
+
+cdef Py_ssize_t count_detections(dn.detection* detections, int num_dets) nogil:
+    cdef Py_ssize_t rv = 0
+    cdef int i, j
+    for i in range(num_dets):
+        for j in range(detections[i].classes):
+            if detections[i].prob[j] > 0:
+                rv += 1
+    return rv
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t fill_detections(detection_t[::1] out,
+                                Py_ssize_t offset,
+                                dn.detection* detections,
+                                int num_dets,
+                                int frame_index) nogil:
+    cdef int i, j
+    for i in range(num_dets):
+        for j in range(detections[i].classes):
+            if detections[i].prob[j] > 0:
+                out[offset].class_id = j
+                out[offset].prob = detections[i].prob[j]
+                out[offset].x = detections[i].bbox.x
+                out[offset].y = detections[i].bbox.y
+                out[offset].w = detections[i].bbox.w
+                out[offset].h = detections[i].bbox.h
+                out[offset].objectness = detections[i].objectness
+                out[offset].frame_index = frame_index
+                offset += 1
+    return offset
+
+
+cdef convert_batch_detections_to_array(dn.det_num_pair* batch_detections,
+                                       int num_frames,
+                                       str nms_type,
+                                       float nms_threshold,
+                                       int top_k,
+                                       int pre_nms_top_k,
+                                       str model=""):
+    # The NMS_TYPES run vectorized over the whole batch, once the detections are in an array
+    cdef bint vectorized = nms_type in NMS_TYPES
+    cdef int b
+    # darknet's NMS and the sort of the rows are one "nms" observation, around the conversion
+    cdef double start = perf_counter()
+    if not vectorized:
+        for b in range(num_frames):
+            apply_nms(batch_detections[b].dets, batch_detections[b].num, nms_type, nms_threshold)
+    cdef double nms_seconds = perf_counter() - start
+
+    cdef Py_ssize_t num_rows = 0
+    cdef Py_ssize_t offset = 0
+    cdef detection_t[::1] out
+    with metrics.timer("convert", model):
+        with nogil:
+            for b in range(num_frames):
+                num_rows += count_detections(batch_detections[b].dets, batch_detections[b].num)
+
+        rv = np.empty(num_rows, dtype=DETECTION_DTYPE)
+        out = rv
+        with nogil:
+            for b in range(num_frames):
+                offset = fill_detections(out, offset, batch_detections[b].dets, batch_detections[b].num, b)
+
+    start = perf_counter()
+    if vectorized:
+        rv = non_max_suppression(rv, nms_threshold, nms_type, pre_nms_top_k, top_k)
+    else:
+        rv = sort_detections(rv, top_k)
+    if metrics.enabled():
+        metrics.observe("nms", nms_seconds + perf_counter() - start, model)
+    return rv
+
+
+cdef convert_detections_to_array(dn.detection* detections,
+                                 int num_dets,
+                                 str nms_type,
+                                 float nms_threshold,
+                                 int top_k,
+                                 int pre_nms_top_k,
+                                 str model=""):
+    cdef dn.det_num_pair frame
+    frame.num = num_dets
+    frame.dets = detections
+    return convert_batch_detections_to_array(&frame, 1, nms_type, nms_threshold, top_k, pre_nms_top_k,
+                                             model)
 
 
 cdef class Metadata:
@@ -44,20 +144,43 @@ cdef class Metadata:
 
 cdef class Network:
     cdef dn.network* _c_network
+    cdef int _batch_size
+    # The model label of the metrics, the cfg file name without its extension
+    cdef public str name
 
     @staticmethod
-    def open(config_url, weights_url, batch_size=1):
+    def open(config_url, weights_url, batch_size=1, snapshot=False, resolution=None):
+        """Loads a network, at the cfg's (width, height) resolution unless one is given."""
+        if snapshot:
+            snapshot = resolve_snapshot(config_url, weights_url)
+            config_file = snapshot.config_file
+            if resolution is not None:
+                config_file = override_net_config(config_file, width=resolution[0], height=resolution[1])
+            network = Network(config_file, snapshot.weights_file, batch_size)
+            network.name = os.path.splitext(os.path.basename(config_url))[0]
+            return network
+
         with fsspec_cache_open(config_url, mode="rt") as config:
+            config_file = config.name
+            if resolution is not None:
+                config_file = override_net_config(config_file, width=resolution[0], height=resolution[1])
             with fsspec_cache_open(weights_url, mode="rb") as weights:
-                return Network(config.name, weights.name, batch_size)
+                network = Network(config_file, weights.name, batch_size)
+        # The cached files are named after their contents, the url names the model
+        network.name = os.path.splitext(os.path.basename(config_url))[0]
+        return network
 
     def __cinit__(self, str config_file, str weights_file, int batch_size, bint clear=True):
-        self._c_network = dn.load_network_custom(config_file.encode(),
-                                                 weights_file.encode(),
-                                                 clear,
-                                                 batch_size)
+        cdef bytes c_config_file = config_file.encode()
+        cdef bytes c_weights_file = weights_file.encode()
+        cdef char* c_config = c_config_file
+        cdef char* c_weights = c_weights_file
+        with nogil:
+            self._c_network = dn.load_network_custom(c_config, c_weights, clear, batch_size)
         if self._c_network is NULL:
             raise RuntimeError("Failed to create the DarkNet Network...")
+        self._batch_size = batch_size
+        self.name = os.path.splitext(os.path.basename(config_file))[0]
 
     def __dealloc__(self):
         if self._c_network is not NULL:
@@ -66,7 +189,31 @@ cdef class Network:
 
     @property
     def batch_size(self):
-        return dn.network_batch_size(self._c_network)
+        # The configured batch size, predict_image sets darknet's own to 1
+        return self._batch_size
+
+    cdef int _num_frames(self, np.ndarray frames) except -1:
+        if frames.size % self.input_size() != 0:
+            raise TypeError("The frames array is not divisible by network input size. "
+                            f"({frames.size} % {self.input_size()} != 0)")
+
+        cdef int num_frames = frames.size // self.input_size()
+        if num_frames > self._batch_size:
+            raise TypeError("There are more frames than the configured batch size. "
+                            f"({num_frames} > {self._batch_size})")
+        return num_frames
+
+    cdef np.ndarray _full_batch(self, np.ndarray frames, int num_frames):
+        # darknet always reads batch_size network inputs, a partial batch is padded with zeros
+        if num_frames == self._batch_size:
+            return frames
+        batch = np.zeros(self._batch_size * self.input_size(), dtype=np.float32)
+        batch[:frames.size] = frames
+        return batch
+
+    cdef void _restore_batch_size(self) nogil:
+        if dn.network_batch_size(self._c_network) != self._batch_size:
+            dn.set_batch_network(self._c_network, self._batch_size)
 
     @property
     def shape(self):
@@ -98,12 +245,32 @@ cdef class Network:
                             f"({input.size} != {input_size})")
 
         cdef float* output
-        output = dn.network_predict(self._c_network[0], <float *>input.data)
+        with metrics.timer("predict", self.name), nogil:
+            output = dn.network_predict(self._c_network[0], <float *>input.data)
 
         cdef np.npy_intp output_shape[1]
         output_shape[0] = self.output_size()
         return np.PyArray_SimpleNewFromData(1, output_shape, np.NPY_FLOAT32, output)
 
+    def predict_batch(self, np.ndarray[dtype=np.float32_t, ndim=1, mode="c"] frames) -> np.ndarray:
+        """Runs up to batch_size network inputs in one forward pass.
+
+        Returns: a (num_frames, output_size) copy of the network outputs
+        """
+        cdef int num_frames = self._num_frames(frames)
+        cdef np.ndarray[dtype=np.float32_t, ndim=1, mode="c"] batch = self._full_batch(frames, num_frames)
+
+        cdef float* output
+        with metrics.timer("predict", self.name), nogil:
+            self._restore_batch_size()
+            output = dn.network_predict(self._c_network[0], <float *>batch.data)
+
+        cdef np.npy_intp output_shape[2]
+        output_shape[0] = self._batch_size
+        output_shape[1] = self.output_size()
+        rv = np.PyArray_SimpleNewFromData(2, output_shape, np.NPY_FLOAT32, output)
+        return rv[:num_frames].copy()
+
     def predict_image(self, np.ndarray[dtype=np.float32_t, ndim=3, mode="c"] img) -> np.ndarray:
         cdef dn.image imr
         imr.c = img.shape[0]
@@ -112,7 +279,8 @@ cdef class Network:
         imr.data = <float *> img.data
 
         cdef float* output
-        output = dn.network_predict_image(self._c_network, imr)
+        with metrics.timer("predict", self.name), nogil:
+            output = dn.network_predict_image(self._c_network, imr)
 
         cdef np.npy_intp output_shape[1]
         output_shape[0] = self.output_size()
@@ -126,24 +294,36 @@ cdef class Network:
                int letterbox=1,
                str nms_type="sort",
                float nms_threshold=.45,
+               bint as_array=False,
+               int top_k=-1,
+               int pre_nms_top_k=DEFAULT_PRE_NMS_TOP_K,
                ):
+        cdef int pred_width, pred_height
         pred_width, pred_height =  self.shape if frame_size is None else frame_size
 
         cdef int num_dets = 0
         cdef dn.detection* detections
-        detections = dn.get_network_boxes(self._c_network,
-                                          pred_width,
-                                          pred_height,
-                                          threshold,
-                                          hierarchical_threshold,
-                                          <int*>0,
-                                          relative,
-                                          &num_dets,
-                                          letterbox)
-        rv = convert_detections_to_tuples(detections, num_dets, nms_type, nms_threshold)
-        dn.free_detections(detections, num_dets)
-
-        return rv
+        with metrics.timer("boxes", self.name), nogil:
+            detections = dn.get_network_boxes(self._c_network,
+                                              pred_width,
+                                              pred_height,
+                                              threshold,
+                                              hierarchical_threshold,
+                                              <int*>0,
+                                              relative,
+                                              &num_dets,
+                                              letterbox)
+        try:
+            rv = convert_detections_to_array(detections, num_dets, nms_type, nms_threshold, top_k,
+                                             pre_nms_top_k, self.name)
+        finally:
+            dn.free_detections(detections, num_dets)
+
+        if as_array:
+            return rv
+        # convert_*_to_array observed "convert", the tuples are a stage of their own
+        with metrics.timer("tuples", self.name):
+            return detections_to_tuples(rv)
 
     def detect_batch(self,
                      np.ndarray[dtype=np.float32_t, ndim=1, mode="c"] frames,
@@ -153,44 +333,49 @@ cdef class Network:
                      int relative=0,
                      int letterbox=1,
                      str nms_type="sort",
-                     float nms_threshold=.45
+                     float nms_threshold=.45,
+                     bint as_array=False,
+                     int top_k=-1,
+                     int pre_nms_top_k=DEFAULT_PRE_NMS_TOP_K,
                      ):
+        cdef int pred_width, pred_height
         pred_width, pred_height = self.shape if frame_size is None else frame_size
 
+        cdef int num_frames = self._num_frames(frames)
+        cdef np.ndarray[dtype=np.float32_t, ndim=1, mode="c"] batch = self._full_batch(frames, num_frames)
+
         cdef dn.image imr
         # This looks awkward, but the batch predict *does not* use c, w, h.
         imr.c = 0
         imr.w = 0
         imr.h = 0
-        imr.data = <float *> frames.data
-
-        if frames.size % self.input_size() != 0:
-            raise TypeError("The frames array is not divisible by network input size. "
-                            f"({frames.size} % {self.input_size()} != 0)")
-
-        num_frames = frames.size // self.input_size()
-        if num_frames > self.batch_size:
-            raise TypeError("There are more frames than the configured batch size. "
-                            f"({num_frames} > {self.batch_size})")
+        imr.data = <float *> batch.data
 
         cdef dn.det_num_pair* batch_detections
-        batch_detections = dn.network_predict_batch(
-            self._c_network,
-            imr,
-            num_frames,
-            pred_width,
-            pred_height,
-            threshold,
-            hierarchical_threshold,
-            <int*>0,
-            relative,
-            letterbox
-        )
-        rv = [
-            convert_detections_to_tuples(batch_detections[b].dets, batch_detections[b].num, nms_type, nms_threshold)
-            for b in range(num_frames)
-        ]
-        dn.free_batch_detections(batch_detections, num_frames)
-        return rv
+        # darknet predicts and gets the boxes of the batch in one call
+        with metrics.timer("predict_batch", self.name), nogil:
+            self._restore_batch_size()
+            batch_detections = dn.network_predict_batch(
+                self._c_network,
+                imr,
+                num_frames,
+                pred_width,
+                pred_height,
+                threshold,
+                hierarchical_threshold,
+                <int*>0,
+                relative,
+                letterbox
+            )
+        try:
+            rv = convert_batch_detections_to_array(batch_detections, num_frames, nms_type, nms_threshold,
+                                                   top_k, pre_nms_top_k, self.name)
+        finally:
+            dn.free_batch_detections(batch_detections, num_frames)
+
+        if as_array:
+            return rv
+        with metrics.timer("tuples", self.name):
+            return [detections_to_tuples(frame) for frame in split_frames(rv, num_frames)]
 
 
@@ -0,0 +1,123 @@
+"""Class aware non-maximum suppression over a whole batch of DETECTION_DTYPE rows.
+
+darknet's do_nms_sort and do_nms_obj compare every pair of boxes, for every class, one frame at
+a time. Here the columns of the whole batch are suppressed together, and a box is only ever
+compared with the boxes of its own frame and class.
+
+A group of n boxes of one frame and class, of which k are kept, costs k passes over the remaining
+boxes, O(k * n). In the worst case, no overlaps or soft-NMS with a low min_prob, every box is
+kept and it is O(n ** 2). ``pre_nms_top_k`` bounds n, to DEFAULT_PRE_NMS_TOP_K boxes per frame
+unless it is disabled with -1.
+"""
+
+import numpy as np
+
+from .detections import sort_detections
+
+NMS_TYPES = ("greedy", "diou", "soft")
+DEFAULT_PRE_NMS_TOP_K = 1000
+
+
+def non_max_suppression(
+    detections: np.ndarray,
+    threshold: float = 0.45,
+    nms_type: str = "greedy",
+    pre_nms_top_k: int = DEFAULT_PRE_NMS_TOP_K,
+    top_k: int = -1,
+    sigma: float = 0.5,
+    min_prob: float = 0.001,
+) -> np.ndarray:
+    """Suppresses overlapping detections of the same class in the same frame.
+
+    Args:
+        detections: a DETECTION_DTYPE array
+        threshold: the IoU (DIoU for "diou") above which the less probable box is dropped,
+            0 disables the suppression. soft-NMS decays the probabilities instead.
+        nms_type: one of NMS_TYPES
+        pre_nms_top_k: if positive, the number of most probable detections per frame that go
+            through the suppression, it bounds the cost on crowded frames. -1 keeps them all
+        top_k: if positive, the number of detections to keep per frame
+        sigma: the soft-NMS gaussian decay, prob *= exp(-iou ** 2 / sigma)
+        min_prob: soft-NMS drops the detections that decay below this probability
+
+    Returns: the kept detections, sorted by frame and decreasing probability
+    """
+    if nms_type not in NMS_TYPES:
+        raise ValueError(f"non-maximum-suppression type {nms_type} is not one of {NMS_TYPES}")
+
+    detections = sort_detections(detections, pre_nms_top_k)
+    if threshold <= 0 or len(detections) < 2:
+        return sort_detections(detections, top_k)
+
+    order = np.lexsort((-detections["prob"], detections["class_id"], detections["frame_index"]))
+    detections = detections[order]
+    keep, probs = _suppress(detections, threshold, nms_type, sigma, min_prob)
+    detections = detections[keep]
+    detections["prob"] = probs
+    return sort_detections(detections, top_k)
+
+
+def _corners(detections):
+    x, y = detections["x"].astype(np.float64), detections["y"].astype(np.float64)
+    half_w, half_h = detections["w"] / 2.0, detections["h"] / 2.0
+    return np.stack([x - half_w, y - half_h, x + half_w, y + half_h])
+
+
+def _overlaps(a, b, diou):
+    """The element wise IoU, or DIoU, of two (4, n) arrays of box corners."""
+    x1, y1, x2, y2 = a
+    bx1, by1, bx2, by2 = b
+    inter = np.clip(np.minimum(x2, bx2) - np.maximum(x1, bx1), 0, None) * np.clip(
+        np.minimum(y2, by2) - np.maximum(y1, by1), 0, None
+    )
+    union = (x2 - x1) * (y2 - y1) + (bx2 - bx1) * (by2 - by1) - inter
+    iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+    if not diou:
+        return iou
+
+    # DIoU, the IoU minus the squared center distance over the enclosing box diagonal
+    distance = ((x1 + x2) - (bx1 + bx2)) ** 2 / 4 + ((y1 + y2) - (by1 + by2)) ** 2 / 4
+    diagonal = (np.maximum(x2, bx2) - np.minimum(x1, bx1)) ** 2 + (
+        np.maximum(y2, by2) - np.minimum(y1, by1)
+    ) ** 2
+    return iou - np.divide(distance, diagonal, out=np.zeros_like(inter), where=diagonal > 0)
+
+
+def _suppress(detections, threshold, nms_type, sigma, min_prob):
+    """Greedy or soft suppression, every group takes a step at the same time.
+
+    The detections are sorted by group, a (frame_index, class_id) pair, and decreasing
+    probability. On each step every group keeps its most probable remaining box, then drops, or
+    decays, the remaining boxes of the group that overlap it. It takes as many steps as the
+    largest number of boxes kept in one group, and each step is one pass over the remaining rows.
+    """
+    boxes = _corners(detections)
+    probs = detections["prob"].astype(np.float64)
+    groups = detections["frame_index"].astype(np.int64) << 32 | detections["class_id"]
+
+    remaining = np.arange(len(detections))
+    keep = []
+    while remaining.size:
+        group = groups[remaining]
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        segment = np.cumsum(np.r_[True, group[1:] != group[:-1]]) - 1
+        if nms_type == "soft":
+            # The decayed probabilities are no longer sorted, find the maximum of each group
+            best = np.maximum.reduceat(probs[remaining], starts)
+            is_best = np.flatnonzero(probs[remaining] == best[segment])
+            starts = is_best[np.unique(segment[is_best], return_index=True)[1]]
+        picks = remaining[starts]
+        keep.append(picks)
+
+        others = np.ones(remaining.size, dtype=bool)
+        others[starts] = False
+        remaining, segment = remaining[others], segment[others]
+        overlaps = _overlaps(boxes[:, remaining], boxes[:, picks[segment]], nms_type == "diou")
+        if nms_type == "soft":
+            probs[remaining] *= np.exp(-(overlaps**2) / sigma)
+            remaining = remaining[probs[remaining] >= min_prob]
+        else:
+            remaining = remaining[overlaps <= threshold]
+
+    keep = np.concatenate(keep)
+    return keep, probs[keep].astype(np.float32)
@@ -0,0 +1,211 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import numpy as np
+from PIL import Image
+
+from .detections import detections_to_tuples, split_frames
+from .network import Network
+from .preprocess import letterbox, load_image
+
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _unwrap(item):
+    if isinstance(item, _Failure):
+        raise item.exception
+    return item
+
+
+class DetectionPipeline(object):
+    """Streams frames through overlapping decode, preprocess, infer and postprocess stages.
+
+    The stages run on their own threads and talk through bounded queues, so the forward pass of
+    one batch overlaps with decoding and letterboxing the next ones. Frames can be file names or
+    urls, encoded bytes, PIL Images or (height, width, channels) ndarrays, and their detections
+    are yielded in order, in frame pixels.
+
+    The infer stage groups whatever preprocessed frames are ready, up to the network batch size,
+    into one Network.detect_batch call. The pipeline owns the network while it runs.
+    """
+
+    network: Network
+
+    def __init__(
+        self,
+        network: Network,
+        labels=None,
+        decode_workers: int = None,
+        queue_size: int = None,
+        num_buffers: int = 2,
+        **detect_kwargs,
+    ):
+        for key in ("frame_size", "relative", "letterbox"):
+            if key in detect_kwargs:
+                raise TypeError(f"The {key} argument is managed by the DetectionPipeline.")
+
+        self.network = network
+        self.labels = labels
+        self.decode_workers = decode_workers
+        self.queue_size = queue_size or 4 * network.batch_size
+        self.num_buffers = num_buffers
+        self.detect_kwargs = detect_kwargs
+        self._queues = {}
+
+    def queue_depths(self) -> dict:
+        """The number of items waiting in front of each stage of the running pipeline."""
+        return {stage: q.qsize() for stage, q in self._queues.items()}
+
+    def run(self, frames: Iterable) -> Iterator:
+        width, height = self.network.shape
+        batch_size = self.network.batch_size
+        buffers = queue.Queue()
+        for _ in range(self.num_buffers):
+            buffers.put(np.zeros((batch_size, self.network.depth, height, width), np.float32))
+
+        self._queues = dict(
+            preprocess=queue.Queue(self.queue_size),
+            infer=queue.Queue(self.num_buffers),
+            postprocess=queue.Queue(self.num_buffers),
+            output=queue.Queue(self.queue_size),
+        )
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(self.decode_workers, thread_name_prefix="darknet-decode")
+        stages = [
+            (self._decode, "preprocess", (frames, executor)),
+            (self._preprocess, "infer", (executor, buffers, batch_size)),
+            (self._infer, "postprocess", (buffers,)),
+            (self._postprocess, "output", ()),
+        ]
+        threads = [
+            threading.Thread(target=self._stage, args=(stage, output, stop) + args, daemon=True)
+            for stage, output, args in stages
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = _unwrap(self._queues["output"].get())
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            # A stage blocked on the frames iterator notices the stop on its next frame
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=1.0)
+            executor.shutdown(wait=False)
+
+    def _stage(self, stage, output, stop, *args):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    self._queues[output].put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            stage(put, stop, *args)
+            put(_DONE)
+        except Exception as e:
+            put(_Failure(e))
+
+    def _get(self, stage, stop):
+        while not stop.is_set():
+            try:
+                return _unwrap(self._queues[stage].get(timeout=0.1))
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _decode(self, put, stop, frames, executor):
+        for frame in frames:
+            if not put(executor.submit(_decode_frame, frame)):
+                return
+
+    def _preprocess(self, put, stop, executor, buffers, batch_size):
+        done = False
+        while not done:
+            batch = [self._get("preprocess", stop)]
+            if batch[0] is _DONE:
+                return
+            # Batch whatever is already decoded, but never wait for a full batch
+            while len(batch) < batch_size:
+                try:
+                    item = _unwrap(self._queues["preprocess"].get_nowait())
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            images = [future.result() for future in batch]
+            buffer = self._get_buffer(buffers, stop)
+            if buffer is None:
+                return
+            letterboxes = list(executor.map(letterbox, images, buffer))
+            if not put((buffer, letterboxes)):
+                return
+
+    @staticmethod
+    def _get_buffer(buffers, stop):
+        while not stop.is_set():
+            try:
+                return buffers.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _infer(self, put, stop, buffers):
+        while True:
+            item = self._get("infer", stop)
+            if item is _DONE:
+                return
+            buffer, letterboxes = item
+            try:
+                detections = self.network.detect_batch(
+                    buffer[: len(letterboxes)].reshape(-1),
+                    frame_size=self.network.shape,
+                    relative=0,
+                    letterbox=0,
+                    **dict(self.detect_kwargs, as_array=True),
+                )
+            finally:
+                buffers.put(buffer)
+            if not put((detections, letterboxes)):
+                return
+
+    def _postprocess(self, put, stop):
+        as_array = self.detect_kwargs.get("as_array", False)
+        while True:
+            item = self._get("postprocess", stop)
+            if item is _DONE:
+                return
+            detections, letterboxes = item
+            for box, frame in zip(letterboxes, split_frames(detections, len(letterboxes))):
+                frame = box.map_detections(frame)
+                frame["frame_index"] = 0
+                if not as_array:
+                    frame = detections_to_tuples(frame)
+                    if self.labels is not None:
+                        frame = [(self.labels[idx], prob, bbox) for idx, prob, bbox in frame]
+                if not put(frame):
+                    return
+
+
+def _decode_frame(frame):
+    image = load_image(frame)
+    if isinstance(image, Image.Image):
+        image.load()
+    return image
@@ -0,0 +1,83 @@
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List
+
+import numpy as np
+
+from .network import Network
+from .util import fsspec_cache_open
+
+
+class NetworkPool(object):
+    """A fixed set of independent Networks, each used by at most one thread at a time.
+
+    A Network keeps the state of its last forward pass, e.g. ``predict_image`` followed by
+    ``detect``, so it is checked out for the whole sequence of calls. The convenience methods
+    copy the network outputs before returning the Network to the pool.
+    """
+
+    networks: List[Network]
+
+    def __init__(self, config_url, weights_url, size: int = None, batch_size: int = 1):
+        size = size or os.cpu_count() or 1
+        with fsspec_cache_open(config_url, mode="rt") as config:
+            with fsspec_cache_open(weights_url, mode="rb") as weights:
+                # Network loading releases the GIL
+                with ThreadPoolExecutor(size) as executor:
+                    self.networks = list(
+                        executor.map(
+                            lambda _: Network(config.name, weights.name, batch_size), range(size)
+                        )
+                    )
+        # The cached files are named after their contents, the url names the model
+        name = os.path.splitext(os.path.basename(config_url))[0]
+        for network in self.networks:
+            network.name = name
+
+        # LIFO hands out the most recently used network, its buffers are still in the CPU caches
+        self._available = queue.LifoQueue()
+        for network in self.networks:
+            self._available.put(network)
+
+    def __len__(self):
+        return len(self.networks)
+
+    @property
+    def shape(self):
+        return self.networks[0].shape
+
+    @property
+    def batch_size(self):
+        return self.networks[0].batch_size
+
+    @contextmanager
+    def checkout(self, timeout: float = None):
+        """Borrows a Network for the duration of the with block."""
+        try:
+            network = self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No network became available within {timeout} seconds.")
+        try:
+            yield network
+        finally:
+            self._available.put(network)
+
+    def predict(self, input_ndarr: np.ndarray) -> np.ndarray:
+        with self.checkout() as network:
+            return network.predict(input_ndarr).copy()
+
+    def predict_image(self, image: np.ndarray) -> np.ndarray:
+        with self.checkout() as network:
+            return network.predict_image(image).copy()
+
+    def detect_image(self, image: np.ndarray, **kwargs):
+        """Runs predict_image followed by detect on the same Network."""
+        with self.checkout() as network:
+            network.predict_image(image)
+            return network.detect(**kwargs)
+
+    def detect_batch(self, frames: np.ndarray, **kwargs):
+        with self.checkout() as network:
+            return network.detect_batch(frames, **kwargs)
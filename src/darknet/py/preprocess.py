@@ -0,0 +1,193 @@
+import io
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Tuple
+
+import fsspec
+import numpy as np
+from PIL import Image
+
+from . import metrics
+
+
+class Letterbox(NamedTuple):
+    """Placement of a frame inside the network input.
+
+    ``scale`` maps frame pixels to network pixels, and ``pad`` is the (left, top) offset of the
+    scaled frame inside the network input.
+    """
+
+    frame_size: Tuple[int, int]
+    scale: float
+    pad: Tuple[int, int]
+
+    def to_frame(self, x, y, w, h):
+        """Maps (center x, center y, width, height) boxes from network to frame pixels."""
+        return (
+            (x - self.pad[0]) / self.scale,
+            (y - self.pad[1]) / self.scale,
+            w / self.scale,
+            h / self.scale,
+        )
+
+    def map_detections(self, detections):
+        """Maps a DETECTION_DTYPE array from network to frame pixels, in place."""
+        detections["x"], detections["y"], detections["w"], detections["h"] = self.to_frame(
+            detections["x"], detections["y"], detections["w"], detections["h"]
+        )
+        return detections
+
+    def scaled_to(self, frame_size):
+        """The same placement, for the frame the image was resized from, e.g. by open_image."""
+        frame_size = tuple(frame_size)
+        return self._replace(
+            frame_size=frame_size, scale=self.scale * self.frame_size[0] / frame_size[0]
+        )
+
+    def to_network(self, x, y, w, h):
+        """Maps (center x, center y, width, height) boxes from frame to network pixels."""
+        return (
+            x * self.scale + self.pad[0],
+            y * self.scale + self.pad[1],
+            w * self.scale,
+            h * self.scale,
+        )
+
+
+def load_image(image):
+    """Opens file names, urls and encoded bytes, PIL Images and ndarrays are returned as-is."""
+    if isinstance(image, str):
+        with fsspec.open(image, mode="rb") as f:
+            image = Image.open(f)
+            image.load()
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+    return image
+
+
+def open_image(data: bytes, shape=None) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Opens an encoded image, JPEGs are decoded at a reduced size when it is enough.
+
+    With a (width, height) network shape, the JPEG decoder scales the image down by a power of
+    two, to the smallest size that still covers its letterboxed size. Most of the decode work of
+    a large photo is skipped.
+
+    Returns: the image and its original (width, height)
+    """
+    image = Image.open(io.BytesIO(data))
+    frame_size = image.size
+    if shape is not None:
+        width, height = shape
+        scale = min(width / image.width, height / image.height)
+        if scale < 1:
+            image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    return image, frame_size
+
+
+def letterbox(image, out: np.ndarray) -> Letterbox:
+    """Scales and pads an image straight into a (channels, height, width) float32 array.
+
+    The image keeps its aspect ratio, is centered, and the padding is filled with zeros.
+    Pixel values are scaled to [0, 1].
+
+    Args:
+        image: a file name or url, encoded bytes, a PIL Image, or a (height, width, channels)
+            ndarray.
+        out: the destination array, usually a frame of a LetterboxPreprocessor buffer.
+
+    Returns: the Letterbox needed to map the network boxes back to the original frame.
+    """
+    channels, height, width = out.shape
+    image = load_image(image)
+
+    if isinstance(image, np.ndarray):
+        if image.shape[0:2] == (height, width):
+            np.divide(image.transpose((2, 0, 1)), np.float32(255), out=out, casting="unsafe")
+            return Letterbox((width, height), 1.0, (0, 0))
+        image = Image.fromarray(image)
+
+    mode = "L" if channels == 1 else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+
+    frame_size = image.size
+    scale = min(width / image.width, height / image.height)
+    scaled_size = (
+        max(1, min(width, round(image.width * scale))),
+        max(1, min(height, round(image.height * scale))),
+    )
+    if scaled_size != image.size:
+        image = image.resize(scaled_size, Image.BILINEAR)
+
+    left, top = (width - image.width) // 2, (height - image.height) // 2
+    right, bottom = left + image.width, top + image.height
+
+    # Only the padding bands need to be cleared, the rest is overwritten below
+    out[:, :top] = 0
+    out[:, bottom:] = 0
+    out[:, top:bottom, :left] = 0
+    out[:, top:bottom, right:] = 0
+
+    pixels = np.asarray(image).reshape((image.height, image.width, channels))
+    np.divide(pixels.transpose((2, 0, 1)), np.float32(255), out=out[:, top:bottom, left:right])
+    return Letterbox(frame_size, scale, (left, top))
+
+
+class LetterboxPreprocessor(object):
+    """Letterboxes batches of images into one reusable, network shaped float32 buffer.
+
+    The frames returned by each call are views into the buffer, so they are only valid until the
+    next call. A single frame can be fed to ``Network.predict_image``, and the flattened frames,
+    ``frames.reshape(-1)``, to ``Network.detect_batch``.
+    """
+
+    buffer: np.ndarray
+
+    def __init__(self, shape, batch_size: int = 1, channels: int = 3, max_workers: int = None):
+        width, height = shape
+        self.buffer = np.zeros((batch_size, channels, height, width), dtype=np.float32)
+        self.max_workers = min(batch_size, max_workers or os.cpu_count() or 1)
+        self._executor = None
+
+    @classmethod
+    def for_network(cls, network, max_workers: int = None):
+        return cls(network.shape, network.batch_size, network.depth, max_workers)
+
+    @property
+    def shape(self):
+        return self.buffer.shape[3], self.buffer.shape[2]
+
+    @property
+    def batch_size(self):
+        return self.buffer.shape[0]
+
+    def __call__(self, images) -> Tuple[np.ndarray, List[Letterbox]]:
+        images = list(images)
+        num_images = len(images)
+        if num_images > self.batch_size:
+            raise ValueError(
+                "There are more images than the configured batch size. "
+                f"({num_images} > {self.batch_size})"
+            )
+
+        frames = self.buffer[:num_images]
+        with metrics.timer("preprocess"):
+            if num_images > 1 and self.max_workers > 1:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers)
+                letterboxes = list(self._executor.map(letterbox, images, frames))
+            else:
+                letterboxes = [letterbox(image, frame) for image, frame in zip(images, frames)]
+        return frames, letterboxes
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,109 @@
+"""The same cfg and weights at several input resolutions, e.g. 320x320 for triage and 608x608
+for hard frames.
+
+Darknet fixes a network's width and height when it parses the cfg, so every resolution is a
+Network of its own, loaded from a copy of the cfg with the [net] width and height replaced.
+The weights are fetched once, into the artifact cache, and every resolution parses the same
+local file.
+"""
+
+import threading
+from typing import Dict, List, Tuple
+
+from .network import Network
+
+Resolution = Tuple[int, int]
+
+
+class ResolutionNetworks(object):
+    """Builds the Network of each (width, height) resolution once, on its first use.
+
+    It also keeps a moving average of the latency of every resolution, ``for_budget`` picks the
+    largest resolution expected to fit a latency budget.
+    """
+
+    def __init__(
+        self,
+        config_url,
+        weights_url,
+        resolutions: List[Resolution] = None,
+        batch_size: int = 1,
+        snapshot: bool = False,
+        smoothing: float = 0.2,
+    ):
+        self.config_url = config_url
+        self.weights_url = weights_url
+        self.batch_size = batch_size
+        self.snapshot = snapshot
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._networks: Dict[Resolution, Network] = {}
+        self._latencies: Dict[Resolution, float] = {}
+
+        self.default = Network.open(config_url, weights_url, batch_size, snapshot)
+        self._networks[self.default.shape] = self.default
+        self._resolutions = {self.default.shape}
+        self._resolutions.update(tuple(resolution) for resolution in resolutions or [])
+
+    @property
+    def resolutions(self) -> List[Resolution]:
+        """The configured resolutions, and those built since, from the fewest pixels up."""
+        with self._lock:
+            return sorted(self._resolutions, key=_pixels)
+
+    def get(self, resolution: Resolution = None) -> Network:
+        """The Network of a (width, height) resolution, None is the cfg's."""
+        if resolution is None:
+            return self.default
+        resolution = tuple(resolution)
+        network = self._networks.get(resolution)
+        if network is not None:
+            return network
+        with self._lock:
+            network = self._networks.get(resolution)
+            if network is None:
+                network = Network.open(
+                    self.config_url, self.weights_url, self.batch_size, self.snapshot, resolution
+                )
+                self._networks[resolution] = network
+                self._resolutions.add(resolution)
+        return network
+
+    def observe(self, resolution: Resolution, seconds: float):
+        """Records the latency of a call at a resolution."""
+        resolution = tuple(resolution)
+        with self._lock:
+            latency = self._latencies.get(resolution)
+            self._latencies[resolution] = (
+                seconds if latency is None else latency + self.smoothing * (seconds - latency)
+            )
+
+    def estimate(self, resolution: Resolution) -> float:
+        """The expected latency of a resolution, or None before any latency was observed.
+
+        Resolutions without observations are estimated from the closest observed one, assuming
+        the latency grows with the number of pixels.
+        """
+        resolution = tuple(resolution)
+        with self._lock:
+            latencies = dict(self._latencies)
+        if resolution in latencies:
+            return latencies[resolution]
+        if not latencies:
+            return None
+        closest = min(latencies, key=lambda r: abs(_pixels(r) - _pixels(resolution)))
+        return latencies[closest] * _pixels(resolution) / _pixels(closest)
+
+    def for_budget(self, seconds: float) -> Resolution:
+        """The largest resolution expected to run within seconds, or else the smallest one."""
+        resolutions = self.resolutions
+        rv = resolutions[0]
+        for resolution in resolutions:
+            latency = self.estimate(resolution)
+            if latency is not None and latency <= seconds:
+                rv = resolution
+        return rv
+
+
+def _pixels(resolution: Resolution) -> int:
+    return resolution[0] * resolution[1]
@@ -0,0 +1,159 @@
+"""An in memory LRU cache of inference results, keyed by the content of the input.
+
+Retries, shared thumbnails and re-crawls resubmit identical images. The key is the sha256 of
+the raw payload, encoded bytes or pixels, with the model identity and the parameters of the
+call, so a hit skips the decoding, the preprocessing, the forward pass and the NMS::
+
+    cache = ResultCache(max_entries=10000, max_bytes=64 << 20, ttl=3600)
+    detector = ImageDetector(labels, config_url, weights_url, result_cache=cache)
+
+Lookups are recorded as the cache_hit and cache_miss metrics stages, the counts of their
+histograms give the hit rate, ``stats()`` gives it for this process.
+"""
+
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+
+
+def payload_digest(*parts) -> str:
+    """The sha256 of raw payloads, bytes like objects or str, e.g. a request body and its type."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def image_digest(image) -> str:
+    """The payload_digest of encoded image bytes, an ndarray or a PIL Image, else None.
+
+    File names and urls are not digested, their contents may change.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return payload_digest(image)
+    if isinstance(image, np.ndarray):
+        image = np.ascontiguousarray(image)
+        return payload_digest(f"{image.dtype.str}{image.shape}", memoryview(image).cast("B"))
+    if isinstance(image, Image.Image):
+        return payload_digest(f"{image.mode}{image.size}", image.tobytes())
+    return None
+
+
+def sizeof(value) -> int:
+    """The approximate bytes of a result, ndarrays count their buffer."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    """A copy of the ndarrays and lists of a result, tuples and NamedTuples included."""
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    if isinstance(value, tuple):
+        items = (_copy(v) for v in value)
+        return type(value)._make(items) if hasattr(value, "_make") else tuple(items)
+    return value
+
+
+class ResultCache(object):
+    """A thread safe LRU of results, bounded by entries and bytes, with an optional TTL.
+
+    ndarrays and lists, also inside tuples, are copied in and out, callers may modify the
+    results they get.
+
+    Args:
+        max_entries: the most results kept, 0 is unbounded
+        max_bytes: the most bytes of results kept, see sizeof, 0 is unbounded
+        ttl: seconds a result stays valid, 0 or None never expire
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 << 20, ttl: float = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict(hits=0, misses=0, evictions=0, expirations=0)
+
+    @staticmethod
+    def key(digest: str, *model, **params) -> str:
+        """The key of a payload digest, the model identity, e.g. its urls, and call parameters."""
+        text = json.dumps([digest, model, params], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str, model: str = ""):
+        """The result of a key, or None."""
+        start = time.perf_counter()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and entry[2] <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+        if metrics.enabled():
+            stage = "cache_miss" if entry is None else "cache_hit"
+            metrics.observe(stage, time.perf_counter() - start, model)
+        return None if entry is None else _copy(entry[0])
+
+    def put(self, key: str, value, size: int = None):
+        """Caches a result, evicting the least recently used ones to stay within budget.
+
+        Args:
+            size: the bytes of value, sizeof(value) by default
+        """
+        size = sizeof(value) if size is None else size
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (_copy(value), size, expires)
+            self._bytes += size
+            while (self.max_entries and len(self._entries) > self.max_entries) or (
+                self.max_bytes and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """The hits, misses, hit rate, evictions and expirations, and the entries and bytes."""
+        with self._lock:
+            rv = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        lookups = rv["hits"] + rv["misses"]
+        rv["hit_rate"] = rv["hits"] / lookups if lookups else 0.0
+        return rv
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
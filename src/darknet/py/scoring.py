@@ -0,0 +1,254 @@
+"""Batched scoring of image datasets, one cached network per process.
+
+A worker that scores many partitions of a dataset loads each network once, on first use, and
+keeps it for the life of the process. A network runs one batch at a time, concurrent partitions
+of the same model take turns.
+
+The results are long format pandas DataFrames, one row per classification or detection::
+
+    classifier  urlpath, rank, class_id, label, prob
+    detector    urlpath, class_id, label, prob, x, y, w, h
+
+Detection boxes are (center x, center y, width, height) in frame pixels.
+
+score_bag and score_dataframe map score_images over the partitions of a dask bag, or DataFrame
+column, of image urls. With a dask.distributed cluster, each worker process keeps its own
+networks between tasks.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple
+
+import fsspec
+import numpy as np
+import pandas as pd
+
+from .classifier import top_k_batch
+from .detections import split_frames
+from .network import Network
+from .preprocess import LetterboxPreprocessor, open_image
+from .util import fsspec_cache_open
+
+KINDS = ("classifier", "detector")
+
+CLASSIFICATION_COLUMNS = {
+    "urlpath": "object",
+    "rank": "int32",
+    "class_id": "int32",
+    "label": "object",
+    "prob": "float32",
+}
+
+DETECTION_COLUMNS = {
+    "urlpath": "object",
+    "class_id": "int32",
+    "label": "object",
+    "prob": "float32",
+    "x": "float32",
+    "y": "float32",
+    "w": "float32",
+    "h": "float32",
+}
+
+
+class CachedNetwork(NamedTuple):
+    network: Network
+    lock: threading.Lock
+    preprocessor: LetterboxPreprocessor
+
+
+_networks = {}
+_networks_lock = threading.Lock()
+
+
+def cached_network(
+    net_config: str, net_weights: str, batch_size: int = 1, storage_options: dict = None
+) -> CachedNetwork:
+    """The process wide network of (net_config, net_weights, batch_size), loaded on first use.
+
+    Hold its lock while the network, or its preprocessor, is in use.
+    """
+    key = (net_config, net_weights, batch_size)
+    with _networks_lock:
+        cached = _networks.get(key)
+        if cached is None:
+            storage_options = storage_options or {}
+            with fsspec_cache_open(net_config, mode="rt", **storage_options) as config:
+                with fsspec_cache_open(net_weights, mode="rb", **storage_options) as weights:
+                    network = Network(config.name, weights.name, batch_size)
+            preprocessor = LetterboxPreprocessor.for_network(network)
+            cached = _networks[key] = CachedNetwork(network, threading.Lock(), preprocessor)
+    return cached
+
+
+def clear_cache():
+    """Drops the cached networks, they are freed once no longer in use."""
+    with _networks_lock:
+        for cached in _networks.values():
+            cached.preprocessor.close()
+        _networks.clear()
+
+
+def read_labels(names: str, names_slice=None, storage_options: dict = None) -> List[str]:
+    """The labels of a names file, one per line, optionally sliced by a (start, stop) tuple."""
+    names_slice = names_slice or (None,)
+    names_slice = names_slice if isinstance(names_slice, (list, tuple)) else (names_slice,)
+    with fsspec.open(names, mode="rt", encoding="utf-8", **(storage_options or {})) as f:
+        return [line.rstrip() for line in f.readlines()][slice(*names_slice)]
+
+
+def empty_frame(kind: str) -> pd.DataFrame:
+    """The empty results DataFrame of a kind of model, e.g. the meta of a dask DataFrame."""
+    columns = CLASSIFICATION_COLUMNS if kind == "classifier" else DETECTION_COLUMNS
+    return pd.DataFrame({name: pd.Series([], dtype=dtype) for name, dtype in columns.items()})
+
+
+def score_images(
+    urlpaths: List[str],
+    kind: str,
+    net_config: str,
+    net_weights: str,
+    names: str = None,
+    names_slice=None,
+    batch_size: int = 1,
+    storage_options: dict = None,
+    image_storage_options: dict = None,
+    top: int = 5,
+    min_confidence: float = None,
+    threshold: float = 0.5,
+    read_workers: int = None,
+    **detect_kwargs,
+) -> pd.DataFrame:
+    """Classifies, or detects objects in, the images of urlpaths.
+
+    Args:
+        urlpaths: the images, decoded with PIL
+        kind: one of KINDS
+        net_config: the network cfg url
+        net_weights: the network weights url
+        names: the labels url, without them the labels are the class ids
+        names_slice: the (start, stop) of the labels in the names file
+        batch_size: the number of images per forward pass
+        storage_options: the fsspec options of the model files
+        image_storage_options: the fsspec options of the images
+        top: the number of most probable labels per image of a classifier
+        min_confidence: the minimum probability of a classification
+        threshold: the minimum probability of a detection
+        read_workers: the threads that read and decode images
+        detect_kwargs: passed to Network.detect_batch
+
+    Returns: a DataFrame of the columns in CLASSIFICATION_COLUMNS or DETECTION_COLUMNS
+    """
+    if kind not in KINDS:
+        raise ValueError(f"The model kind {kind} is not one of {KINDS}")
+    for key in ("frame_size", "relative", "letterbox", "as_array"):
+        if key in detect_kwargs:
+            raise TypeError(f"The {key} argument is managed by score_images.")
+
+    cached = cached_network(net_config, net_weights, batch_size, storage_options)
+    labels = None if names is None else read_labels(names, names_slice, storage_options)
+    shape = cached.network.shape
+
+    def read(urlpath):
+        with fsspec.open(urlpath, mode="rb", **(image_storage_options or {})) as f:
+            return open_image(f.read(), shape)
+
+    frames = []
+    with ThreadPoolExecutor(read_workers, thread_name_prefix="darknet-read") as executor:
+        for start in range(0, len(urlpaths), batch_size):
+            stop = start + batch_size
+            batch = urlpaths[start:stop]
+            images, frame_sizes = zip(*executor.map(read, batch))
+            with cached.lock:
+                if kind == "classifier":
+                    frame = _classify(cached, images, labels, top, min_confidence)
+                else:
+                    frame = _detect(cached, images, frame_sizes, labels, threshold, detect_kwargs)
+            frame.insert(0, "urlpath", np.asarray(batch, dtype=object)[frame.pop("index")])
+            frames.append(frame)
+
+    if not frames:
+        return empty_frame(kind)
+    rv = pd.concat(frames, ignore_index=True)
+    return rv.astype(CLASSIFICATION_COLUMNS if kind == "classifier" else DETECTION_COLUMNS)
+
+
+def score_bag(urlpaths, kind: str, net_config: str, net_weights: str, **kwargs):
+    """Scores a dask Bag of image urls, see score_images.
+
+    Returns: a dask DataFrame, one partition per partition of the bag
+    """
+    import dask
+    import dask.dataframe as dd
+
+    kwargs = dict(kwargs, kind=kind, net_config=net_config, net_weights=net_weights)
+    parts = [dask.delayed(score_images)(part, **kwargs) for part in urlpaths.to_delayed()]
+    return dd.from_delayed(parts, meta=empty_frame(kind))
+
+
+def score_dataframe(
+    df, kind: str, net_config: str, net_weights: str, column: str = "urlpath", **kwargs
+):
+    """Scores the image urls of a dask DataFrame column, see score_images.
+
+    Returns: a dask DataFrame, one partition per partition of df
+    """
+    kwargs = dict(kwargs, kind=kind, net_config=net_config, net_weights=net_weights)
+    return df[column].map_partitions(_score_series, meta=empty_frame(kind), **kwargs)
+
+
+def _score_series(urlpaths: pd.Series, **kwargs) -> pd.DataFrame:
+    return score_images(urlpaths.tolist(), **kwargs)
+
+
+def _label_column(labels, class_ids: np.ndarray) -> np.ndarray:
+    if labels is None:
+        return class_ids.astype(str).astype(object)
+    return np.asarray(labels, dtype=object)[class_ids]
+
+
+def _classify(cached: CachedNetwork, images, labels, top, min_confidence) -> pd.DataFrame:
+    frames, _ = cached.preprocessor(images)
+    probabilities = cached.network.predict_batch(frames.reshape(-1))
+    rows = top_k_batch(range(probabilities.shape[1]), probabilities, top, min_confidence)
+    index = np.repeat(np.arange(len(rows)), [len(row) for row in rows])
+    class_id = np.array([class_id for row in rows for class_id, _ in row], dtype=np.int32)
+    return pd.DataFrame(
+        {
+            "index": index,
+            "rank": np.arange(len(index)) - np.searchsorted(index, index),
+            "class_id": class_id,
+            "label": _label_column(labels, class_id),
+            "prob": np.array([prob for row in rows for _, prob in row], dtype=np.float32),
+        }
+    )
+
+
+def _detect(cached: CachedNetwork, images, frame_sizes, labels, threshold, detect_kwargs):
+    network = cached.network
+    frames, letterboxes = cached.preprocessor(images)
+    detections = network.detect_batch(
+        frames.reshape(-1),
+        frame_size=network.shape,
+        threshold=threshold,
+        relative=0,
+        letterbox=0,
+        as_array=True,
+        **detect_kwargs,
+    )
+    for box, size, frame in zip(letterboxes, frame_sizes, split_frames(detections, len(frames))):
+        # Boxes go back to the original frame, not to the reduced size decoded image
+        box.scaled_to(size).map_detections(frame)
+    return pd.DataFrame(
+        {
+            "index": detections["frame_index"].astype(np.intp),
+            "class_id": detections["class_id"],
+            "label": _label_column(labels, detections["class_id"]),
+            "prob": detections["prob"],
+            "x": detections["x"],
+            "y": detections["y"],
+            "w": detections["w"],
+            "h": detections["h"],
+        }
+    )
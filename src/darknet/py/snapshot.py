@@ -0,0 +1,208 @@
+"""Local, content addressed snapshots of a network's cfg and weights.
+
+A snapshot is a directory named after the sha256 of the cfg and weights contents. It holds
+``network.cfg``, ``network.weights`` and a ``manifest.json``. An index keyed by the
+(config_url, weights_url) pair points at the snapshot, so later process starts resolve a model
+without fetching or hashing the weights again. The index also records the size and the ETag or
+modification time of both urls, a url whose metadata changed is snapshotted again.
+
+Darknet reads the weights with plain file I/O, so a warm snapshot is read from the OS page
+cache, which every process on the host shares. Loading a snapshot also asks the OS to read
+ahead the whole weights file before darknet starts parsing.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import NamedTuple
+
+import fsspec
+
+from .util import darknet_cache_dir, fsspec_cache_open, fsspec_split_github_url
+
+_CHUNK_SIZE = 1 << 20
+# The fsspec info fields that change with the contents, across filesystems
+_VALIDATOR_FIELDS = ("size", "ETag", "etag", "md5Hash", "mtime", "LastModified", "updated")
+
+
+class Snapshot(NamedTuple):
+    key: str
+    path: str
+
+    @property
+    def config_file(self) -> str:
+        return os.path.join(self.path, "network.cfg")
+
+    @property
+    def weights_file(self) -> str:
+        return os.path.join(self.path, "network.weights")
+
+    @property
+    def manifest_file(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def is_complete(self) -> bool:
+        try:
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            sizes = os.path.getsize(self.config_file), os.path.getsize(self.weights_file)
+            return sizes == (manifest["config_size"], manifest["weights_size"])
+        except (OSError, ValueError, KeyError):
+            return False
+
+
+def snapshot_key(config_file: str, weights_file: str) -> str:
+    """The sha256 of the cfg and weights contents."""
+    digest = hashlib.sha256()
+    for file_name in (config_file, weights_file):
+        digest.update(os.path.getsize(file_name).to_bytes(8, "little"))
+        with open(file_name, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def url_validator(urlpath: str):
+    """The size, and the ETag or modification time, of a url as fsspec reports them.
+
+    Returns: a dict of str, or None when the url cannot be reached
+    """
+    kwargs = {}
+    if urlpath.startswith("github"):
+        urlpath, kwargs = fsspec_split_github_url(urlpath, kwargs)
+    try:
+        of = fsspec.open(urlpath, **kwargs)
+        info = of.fs.info(of.path)
+    except Exception:
+        return None
+    return {name: str(info[name]) for name in _VALIDATOR_FIELDS if info.get(name) is not None}
+
+
+def create_snapshot(
+    config_url: str, weights_url: str, root: str = None, refresh: bool = False
+) -> Snapshot:
+    """Resolves the urls with fsspec_cache_open and stores their contents as a snapshot.
+
+    Args:
+        refresh: fetches remote urls again, instead of using the artifact cache
+    """
+    root = root or darknet_cache_dir("snapshots")
+    os.makedirs(root, exist_ok=True)
+
+    validators = [url_validator(config_url), url_validator(weights_url)]
+    with fsspec_cache_open(config_url, mode="rt", refresh=refresh) as config:
+        with fsspec_cache_open(weights_url, mode="rb", refresh=refresh) as weights:
+            key = snapshot_key(config.name, weights.name)
+            snapshot = Snapshot(key, os.path.join(root, key))
+            if not snapshot.is_complete():
+                _write_snapshot(snapshot, config.name, weights.name, config_url, weights_url)
+
+    _write_json(_index_file(root, config_url, weights_url), dict(key=key, validators=validators))
+    return snapshot
+
+
+def find_snapshot(config_url: str, weights_url: str, root: str = None, revalidate: bool = True):
+    """Returns the Snapshot indexed for the urls, or None.
+
+    Args:
+        revalidate: also None when the size, ETag or modification time of a url changed since
+            the snapshot, urls that cannot be reached are assumed unchanged
+    """
+    snapshot, changed = _find(config_url, weights_url, root, revalidate)
+    return None if changed else snapshot
+
+
+def resolve_snapshot(
+    config_url: str, weights_url: str, root: str = None, refresh: bool = False
+) -> Snapshot:
+    """Finds, or creates, the snapshot for the urls and reads its weights ahead.
+
+    A url that changed since its snapshot is fetched again, as with refresh.
+    """
+    snapshot, changed = None, False
+    if not refresh:
+        snapshot, changed = _find(config_url, weights_url, root, True)
+    if snapshot is None or changed:
+        snapshot = create_snapshot(config_url, weights_url, root, refresh or changed)
+    _read_ahead(snapshot.weights_file)
+    return snapshot
+
+
+def _find(config_url, weights_url, root, revalidate):
+    """The complete Snapshot indexed for the urls, or None, and whether a url changed since."""
+    root = root or darknet_cache_dir("snapshots")
+    try:
+        with open(_index_file(root, config_url, weights_url)) as f:
+            index = json.load(f)
+        snapshot = Snapshot(index["key"], os.path.join(root, index["key"]))
+    except (OSError, ValueError, KeyError):
+        return None, False
+    changed = revalidate and _changed(index.get("validators"), config_url, weights_url)
+    return (snapshot if snapshot.is_complete() else None), changed
+
+
+def _changed(validators, config_url, weights_url) -> bool:
+    if not validators:
+        return False
+    for recorded, url in zip(validators, (config_url, weights_url)):
+        current = url_validator(url)
+        if recorded is not None and current is not None and recorded != current:
+            return True
+    return False
+
+
+def _index_file(root, config_url, weights_url):
+    digest = hashlib.sha256(f"{config_url}\n{weights_url}".encode("utf-8")).hexdigest()
+    return os.path.join(root, "index", f"{digest}.json")
+
+
+def _write_json(file_name, obj):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_name, file_name)
+
+
+def _write_snapshot(snapshot: Snapshot, config_file, weights_file, config_url, weights_url):
+    # Several processes may race to create the same snapshot, the first rename wins
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(snapshot.path), prefix=".tmp-")
+    tmp = Snapshot(snapshot.key, tmp_path)
+    try:
+        shutil.copyfile(config_file, tmp.config_file)
+        try:
+            os.link(weights_file, tmp.weights_file)
+        except OSError:
+            shutil.copyfile(weights_file, tmp.weights_file)
+        _write_json(
+            tmp.manifest_file,
+            dict(
+                key=snapshot.key,
+                config_url=config_url,
+                weights_url=weights_url,
+                config_size=os.path.getsize(tmp.config_file),
+                weights_size=os.path.getsize(tmp.weights_file),
+            ),
+        )
+        # Another process may be loading a complete snapshot, only a broken one is replaced
+        if snapshot.is_complete():
+            return
+        if os.path.isdir(snapshot.path):
+            shutil.rmtree(snapshot.path, ignore_errors=True)
+        os.rename(tmp_path, snapshot.path)
+    except OSError:
+        if not snapshot.is_complete():
+            raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _read_ahead(file_name):
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(file_name, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
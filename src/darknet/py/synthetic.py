@@ -0,0 +1,187 @@
+"""Small darknet networks with random weights, for tests and benchmarks.
+
+The networks are not trained, but they have the shapes, layers and cost profile of the real
+ones, so they can be generated offline wherever a benchmark has to run.
+"""
+
+import os
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+Section = Tuple[str, dict]
+
+_YOLO_ANCHORS = "10,14, 23,27, 37,58, 81,82, 135,169, 344,319"
+
+
+def _conv(filters, size=3, stride=1, batch_normalize=True, activation="leaky") -> Section:
+    options = dict(filters=filters, size=size, stride=stride, pad=1, activation=activation)
+    if batch_normalize:
+        options = dict(batch_normalize=1, **options)
+    return "convolutional", options
+
+
+def tiny_classifier(width=64, height=64, channels=3, classes=10) -> List[Section]:
+    """A darknet-reference like classifier, with a softmax over ``classes`` outputs."""
+    return [
+        ("net", dict(batch=1, subdivisions=1, width=width, height=height, channels=channels)),
+        _conv(16),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(32),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(64),
+        _conv(classes, size=1, batch_normalize=False, activation="linear"),
+        ("avgpool", {}),
+        ("softmax", dict(groups=1)),
+    ]
+
+
+def tiny_yolo(width=416, height=416, channels=3, classes=80, filters=8) -> List[Section]:
+    """A yolov3-tiny like detector, ``filters`` sets the width of the first layer."""
+    outputs = 3 * (classes + 5)
+
+    def yolo(mask):
+        return (
+            "yolo",
+            dict(
+                mask=mask,
+                anchors=_YOLO_ANCHORS,
+                classes=classes,
+                num=6,
+                jitter=0.3,
+                ignore_thresh=0.7,
+                truth_thresh=1,
+                random=1,
+            ),
+        )
+
+    return [
+        ("net", dict(batch=1, subdivisions=1, width=width, height=height, channels=channels)),
+        _conv(filters),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(2 * filters),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(4 * filters),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(8 * filters),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(16 * filters),
+        ("maxpool", dict(size=2, stride=2)),
+        _conv(32 * filters),
+        ("maxpool", dict(size=2, stride=1)),
+        _conv(64 * filters),
+        _conv(16 * filters, size=1),
+        _conv(32 * filters),
+        _conv(outputs, size=1, batch_normalize=False, activation="linear"),
+        yolo("3,4,5"),
+        ("route", dict(layers=-4)),
+        _conv(8 * filters, size=1),
+        ("upsample", dict(stride=2)),
+        ("route", dict(layers="-1, 8")),
+        _conv(16 * filters),
+        _conv(outputs, size=1, batch_normalize=False, activation="linear"),
+        yolo("0,1,2"),
+    ]
+
+
+def format_cfg(sections: List[Section]) -> str:
+    lines = []
+    for name, options in sections:
+        lines.append(f"[{name}]")
+        lines.extend(f"{key}={value}" for key, value in options.items())
+        lines.append("")
+    return "\n".join(lines)
+
+
+def parameter_counts(sections: List[Section]) -> List[int]:
+    """The number of floats each layer reads from the weights file, in darknet's order."""
+    net = sections[0][1]
+    h, w, c = int(net["height"]), int(net["width"]), int(net["channels"])
+    shapes, counts = [], []
+    for name, options in sections[1:]:
+        count = 0
+        if name == "convolutional":
+            filters, size = int(options["filters"]), int(options["size"])
+            stride = int(options.get("stride", 1))
+            padding = size // 2 if int(options.get("pad", 0)) else 0
+            count = filters * (1 + c * size * size)
+            if int(options.get("batch_normalize", 0)):
+                count += 3 * filters
+            h = (h + 2 * padding - size) // stride + 1
+            w = (w + 2 * padding - size) // stride + 1
+            c = filters
+        elif name == "connected":
+            outputs = int(options["output"])
+            count = outputs * (1 + h * w * c)
+            if int(options.get("batch_normalize", 0)):
+                count += 3 * outputs
+            h, w, c = 1, 1, outputs
+        elif name == "maxpool":
+            size, stride = int(options.get("size", 2)), int(options.get("stride", 2))
+            padding = int(options.get("padding", size - 1))
+            h, w = (h + padding - size) // stride + 1, (w + padding - size) // stride + 1
+        elif name == "avgpool":
+            h, w = 1, 1
+        elif name == "upsample":
+            stride = int(options.get("stride", 2))
+            h, w = h * stride, w * stride
+        elif name == "route":
+            indices = [int(i) for i in str(options["layers"]).split(",")]
+            indices = [i if i >= 0 else len(shapes) + i for i in indices]
+            h, w = shapes[indices[0]][0:2]
+            c = sum(shapes[i][2] for i in indices)
+        elif name not in {"softmax", "yolo", "dropout", "cost"}:
+            raise ValueError(f"The {name} layer is not supported by the synthetic networks.")
+        shapes.append((h, w, c))
+        counts.append(count)
+    return counts
+
+
+def write_weights(sections: List[Section], weights_file: str, seed: int = 0):
+    """Writes random weights in the darknet format (version 0.2.0 header)."""
+    rng = np.random.RandomState(seed)
+    with open(weights_file, "wb") as f:
+        f.write(struct.pack("<iiiQ", 0, 2, 0, 0))
+        for (name, options), count in zip(sections[1:], parameter_counts(sections)):
+            if count == 0:
+                continue
+            weights = rng.normal(0, 0.1, count).astype(np.float32)
+            if name == "convolutional" and int(options.get("batch_normalize", 0)):
+                # biases, scales, rolling mean and rolling variance come before the weights
+                filters = int(options["filters"])
+                batch_normalize = weights[: 4 * filters].reshape((4, filters))
+                batch_normalize[1] = 1
+                batch_normalize[3] = 1
+            weights.tofile(f)
+
+
+def make_network(
+    directory: str, kind: str = "detector", seed: int = 0, **kwargs
+) -> Tuple[str, str, List[str]]:
+    """Writes a synthetic network into ``directory``.
+
+    Args:
+        directory: where the cfg and weights files are written
+        kind: "detector" for tiny_yolo, or "classifier" for tiny_classifier
+        seed: the random weights seed
+        kwargs: passed to tiny_yolo or tiny_classifier
+
+    Returns: the cfg file, weights file and labels
+    """
+    sections = {"detector": tiny_yolo, "classifier": tiny_classifier}[kind](**kwargs)
+    os.makedirs(directory, exist_ok=True)
+    net = sections[0][1]
+    name = f"synthetic-{kind}-{net['width']}x{net['height']}"
+    config_file = os.path.join(directory, f"{name}.cfg")
+    weights_file = os.path.join(directory, f"{name}.weights")
+
+    with open(config_file, "w") as f:
+        f.write(format_cfg(sections))
+    write_weights(sections, weights_file, seed)
+
+    if kind == "detector":
+        num_labels = int(sections[-1][1]["classes"])
+    else:
+        num_labels = int(sections[-3][1]["filters"])
+    return config_file, weights_file, [f"{kind}-label-{i}" for i in range(num_labels)]
@@ -0,0 +1,199 @@
+"""Detection on images much larger than the network input, e.g. 20000x20000 pixels scans.
+
+The image is cut into overlapping, network sized tiles at its own resolution, so small objects
+keep their pixels. Tiles are copied one batch at a time into a (batch_size, channels, height,
+width) float32 buffer, the only float copy of the image, and run through ``detect_batch``.
+
+Every tile owns the part of the image closer to it than to its neighbours, its core. A tile's
+detections are kept when their center is inside its core, then moved to image pixels, and a
+cross-tile NMS merges the duplicates left along the core borders.
+
+Only (height, width, channels) ndarrays, e.g. a np.memmap of raw pixels, keep the memory bounded
+by the tiles. File names, urls and encoded bytes are decoded whole by PIL, as uint8 pixels, and
+the PIL limit on image sizes is replaced by the ``max_pixels`` of ``detect_tiled``.
+"""
+
+import io
+import struct
+from typing import List, NamedTuple, Tuple
+
+import fsspec
+import numpy as np
+from PIL import Image
+
+from .detections import sort_detections
+from .nms import NMS_TYPES, non_max_suppression
+from .preprocess import load_image
+
+
+class Tile(NamedTuple):
+    """A tile's (left, top) corner and its (left, top, right, bottom) core, in image pixels."""
+
+    left: int
+    top: int
+    core: Tuple[float, float, float, float]
+
+
+def tile_starts(length: int, tile: int, overlap: int) -> Tuple[List[int], List[float]]:
+    """The tile starts along an axis, and the core bounds between them.
+
+    The last tile ends with the image, images shorter than a tile get one tile at 0.
+
+    Returns: the n starts, and the n + 1 bounds of the tile cores
+    """
+    if not 0 <= overlap < tile:
+        raise ValueError(f"The overlap {overlap} must be in [0, {tile})")
+    starts = list(range(0, max(1, length - tile + 1), tile - overlap))
+    if starts[-1] + tile < length:
+        starts.append(length - tile)
+    # A core ends in the middle of the overlap with the next tile
+    bounds = [0.0] + [(start + tile + after) / 2 for start, after in zip(starts, starts[1:])]
+    return starts, bounds + [float(length)]
+
+
+def tile_grid(image_size, tile_size, overlap: int) -> List[Tile]:
+    """The tiles of a (width, height) image, row by row."""
+    xs, x_bounds = tile_starts(image_size[0], tile_size[0], overlap)
+    ys, y_bounds = tile_starts(image_size[1], tile_size[1], overlap)
+    return [
+        Tile(x, y, (x_bounds[i], y_bounds[j], x_bounds[i + 1], y_bounds[j + 1]))
+        for j, y in enumerate(ys)
+        for i, x in enumerate(xs)
+    ]
+
+
+def read_tile(image, tile: Tile, out: np.ndarray):
+    """Copies a tile of a PIL Image or (height, width, channels) ndarray into a float32 frame.
+
+    The parts of the tile past the image are zeros, pixel values are scaled to [0, 1]. PIL Images
+    are converted to the frame's channels one tile at a time.
+    """
+    channels, height, width = out.shape
+    left, top = tile.left, tile.top
+    right, bottom = left + width, top + height
+    if isinstance(image, np.ndarray):
+        pixels = image[top:bottom, left:right]
+    else:
+        right, bottom = min(image.width, right), min(image.height, bottom)
+        pixels = image.crop((left, top, right, bottom))
+        mode = "L" if channels == 1 else "RGB"
+        pixels = np.asarray(pixels if pixels.mode == mode else pixels.convert(mode))
+    pixels = pixels.reshape(pixels.shape[:2] + (-1,))
+    rows, cols = pixels.shape[:2]
+    if (rows, cols) != (height, width):
+        out[...] = 0
+    np.divide(pixels.transpose((2, 0, 1)), np.float32(255), out=out[:, :rows, :cols])
+
+
+def detect_tiled(
+    network,
+    image,
+    overlap: int = 64,
+    nms_type: str = "greedy",
+    nms_threshold: float = 0.45,
+    top_k: int = -1,
+    max_pixels: int = 1 << 31,
+    **kwargs,
+) -> np.ndarray:
+    """Detects the objects of a large image, tile by tile, in full batches of the network.
+
+    Args:
+        network: a Network, its batch_size tiles run in one forward pass
+        image: a file name or url, encoded bytes, a PIL Image, or a (height, width, channels)
+            ndarray, e.g. a np.memmap
+        overlap: the pixels shared by neighbouring tiles, larger than the objects to find
+        nms_type: the NMS of every tile, see Network.detect_batch, and of the cross-tile NMS,
+            which is "greedy" after darknet's "sort" and "obj"
+        nms_threshold: the IoU threshold of both NMS
+        top_k: if positive, the number of detections to keep
+        max_pixels: the largest file, url or bytes image decoded, instead of PIL's
+            Image.MAX_IMAGE_PIXELS, None has no limit
+        kwargs: threshold and hierarchical_threshold, see Network.detect_batch
+
+    Returns: a DETECTION_DTYPE array, in image pixels, sorted by decreasing probability
+    """
+    image = _load_image(image, max_pixels)
+    if isinstance(image, np.ndarray):
+        image_size = image.shape[1], image.shape[0]
+    else:
+        image_size = image.size
+
+    width, height = network.shape
+    tiles = tile_grid(image_size, (width, height), overlap)
+    frames = np.empty((network.batch_size, network.depth, height, width), dtype=np.float32)
+
+    parts = []
+    for start in range(0, len(tiles), network.batch_size):
+        stop = start + network.batch_size
+        batch = tiles[start:stop]
+        for tile, frame in zip(batch, frames):
+            read_tile(image, tile, frame)
+        detections = network.detect_batch(
+            frames[: len(batch)].reshape(-1),
+            frame_size=(width, height),
+            relative=0,
+            letterbox=0,
+            nms_type=nms_type,
+            nms_threshold=nms_threshold,
+            as_array=True,
+            **kwargs,
+        )
+        parts.append(_to_image(detections, batch))
+
+    detections = np.concatenate(parts)
+    detections["frame_index"] = 0
+    nms_type = nms_type if nms_type in NMS_TYPES else "greedy"
+    # The detections of a whole scan, they may well be more than a frame's pre_nms_top_k
+    detections = non_max_suppression(detections, nms_threshold, nms_type, pre_nms_top_k=-1)
+    return sort_detections(detections, top_k)
+
+
+def _load_image(image, max_pixels):
+    """load_image, with max_pixels instead of the process wide Image.MAX_IMAGE_PIXELS."""
+    if isinstance(image, str):
+        with fsspec.open(image, mode="rb") as f:
+            image = _open_image(f, max_pixels)
+            image.load()
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return _open_image(io.BytesIO(image), max_pixels)
+    return load_image(image)
+
+
+def _open_image(fp, max_pixels) -> Image.Image:
+    """Image.open, without its check of Image.MAX_IMAGE_PIXELS, other threads may rely on it."""
+    Image.init()
+    prefix = fp.read(16)
+    for format_id in Image.ID:
+        factory, accept = Image.OPEN[format_id]
+        result = accept(prefix) if accept else True
+        if not result or isinstance(result, str):
+            continue
+        fp.seek(0)
+        try:
+            image = factory(fp, None)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+        if max_pixels is not None and image.width * image.height > max_pixels:
+            raise Image.DecompressionBombError(
+                f"Image size ({image.width * image.height} pixels) exceeds the limit of "
+                f"{max_pixels} pixels."
+            )
+        return image
+    raise Image.UnidentifiedImageError("cannot identify image file")
+
+
+def _to_image(detections: np.ndarray, tiles: List[Tile]) -> np.ndarray:
+    """The detections whose center is in their tile's core, moved to image pixels."""
+    index = detections["frame_index"]
+    lefts = np.array([tile.left for tile in tiles], dtype=np.float32)[index]
+    tops = np.array([tile.top for tile in tiles], dtype=np.float32)[index]
+    cores = np.array([tile.core for tile in tiles], dtype=np.float32)[index].reshape(-1, 4)
+
+    x = detections["x"] + lefts
+    y = detections["y"] + tops
+    inside = (cores[:, 0] <= x) & (x < cores[:, 2]) & (cores[:, 1] <= y) & (y < cores[:, 3])
+    detections = detections[inside]
+    detections["x"] = x[inside]
+    detections["y"] = y[inside]
+    return detections
@@ -0,0 +1,279 @@
+"""Video detection that runs the network on keyframes only, and tracks the boxes in between.
+
+Frames of a fixed camera barely change, so ``VideoDetector`` runs ``ImageDetector.detect`` on
+keyframes: the first frame, every ``max_interval`` frames, and the frames that differ enough
+from the last keyframe on a small grayscale thumbnail. ``Tracker`` keeps a constant velocity
+Kalman filter of every box, matches the keyframe detections to the tracks by IoU and carries
+the predicted boxes, with their track ids, through the frames in between.
+
+``audit_interval`` also runs the network on some tracked frames, and compares its detections
+with the tracked boxes, it measures what skipping the network costs on the actual video.
+"""
+
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+from .detections import DETECTION_DTYPE
+from .nms import _corners, _overlaps
+from .preprocess import load_image
+
+# DETECTION_DTYPE rows with the id of their track
+TRACK_DTYPE = np.dtype(DETECTION_DTYPE.descr + [("track_id", np.int32)])
+
+# The motion and observation noise, relative to the box sizes
+_STD_POSITION = 1.0 / 20
+_STD_VELOCITY = 1.0 / 160
+
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+
+
+class Tracker(object):
+    """Constant velocity Kalman filters of (x, y, w, h) boxes, all tracks updated at once.
+
+    Args:
+        min_iou: the IoU a detection needs with a predicted box, of the same class, to continue
+            its track
+        max_misses: the updates a track may go unmatched before it is dropped
+    """
+
+    def __init__(self, min_iou: float = 0.3, max_misses: int = 1):
+        self.min_iou = min_iou
+        self.max_misses = max_misses
+        self.next_id = 0
+        self.means = np.zeros((0, 8))
+        self.covariances = np.zeros((0, 8, 8))
+        self.tracks = np.zeros(0, dtype=TRACK_DTYPE)
+        self.misses = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def predict(self):
+        """Moves every track one frame ahead."""
+        sizes = np.tile(self.means[:, 2:4], 4)
+        std = sizes * np.repeat([_STD_POSITION, _STD_VELOCITY], 4)
+        self.means = self.means @ _F.T
+        self.covariances = _F @ self.covariances @ _F.T + _diagonal(std**2)
+
+    def update(self, detections: np.ndarray):
+        """Matches detections to the predicted tracks, new detections start new tracks."""
+        matches = self._match(detections)
+        tracked = np.array([t for t, _ in matches], dtype=np.intp)
+        detected = np.array([d for _, d in matches], dtype=np.intp)
+
+        if len(matches):
+            observations = _boxes(detections[detected])
+            std = np.tile(observations[:, 2:4], 2) * _STD_POSITION
+            means, covariances = self.means[tracked], self.covariances[tracked]
+            projected = covariances[:, :4, :4] + _diagonal(std**2)
+            # K = P H^T S^-1, both P H^T and S are symmetric blocks of P
+            gains = np.linalg.solve(projected, covariances[:, :4, :]).transpose((0, 2, 1))
+            innovations = observations - means[:, :4]
+            self.means[tracked] = means + np.einsum("nij,nj->ni", gains, innovations)
+            self.covariances[tracked] = covariances - gains @ covariances[:, :4, :]
+            for name in ("class_id", "prob", "objectness"):
+                self.tracks[name][tracked] = detections[name][detected]
+
+        self.misses += 1
+        self.misses[tracked] = 0
+
+        new = np.setdiff1d(np.arange(len(detections)), detected)
+        if len(new):
+            self._start(detections[new])
+        keep = self.misses <= self.max_misses
+        self.means, self.covariances = self.means[keep], self.covariances[keep]
+        self.tracks, self.misses = self.tracks[keep], self.misses[keep]
+
+    def boxes(self) -> np.ndarray:
+        """The TRACK_DTYPE rows of the tracks matched by the last update, at their predicted box."""
+        return self._predicted(self.misses == 0)
+
+    def _predicted(self, selection=slice(None)) -> np.ndarray:
+        rv = self.tracks[selection].copy()
+        means = self.means[selection]
+        for i, name in enumerate(("x", "y", "w", "h")):
+            rv[name] = means[:, i]
+        rv["w"] = np.maximum(rv["w"], 0)
+        rv["h"] = np.maximum(rv["h"], 0)
+        return rv
+
+    def _match(self, detections):
+        """Greedy (track, detection) pairs of the same class, from the highest IoU down."""
+        if not len(self.tracks) or not len(detections):
+            return []
+        predicted = _corners(self._predicted())
+        iou = _overlaps(predicted[:, :, None], _corners(detections)[:, None, :], False)
+        iou[self.tracks["class_id"][:, None] != detections["class_id"][None, :]] = 0
+
+        matches = []
+        used_tracks, used_detections = set(), set()
+        for flat in np.argsort(-iou, axis=None):
+            t, d = np.unravel_index(flat, iou.shape)
+            if iou[t, d] < self.min_iou:
+                break
+            if t not in used_tracks and d not in used_detections:
+                matches.append((t, d))
+                used_tracks.add(t)
+                used_detections.add(d)
+        return matches
+
+    def _start(self, detections):
+        n = len(detections)
+        boxes = _boxes(detections)
+        means = np.concatenate([boxes, np.zeros((n, 4))], axis=1)
+        sizes = np.tile(boxes[:, 2:4], 4)
+        std = sizes * np.repeat([2 * _STD_POSITION, 10 * _STD_VELOCITY], 4)
+
+        tracks = np.zeros(n, dtype=TRACK_DTYPE)
+        for name in DETECTION_DTYPE.names:
+            tracks[name] = detections[name]
+        tracks["track_id"] = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+
+        self.means = np.concatenate([self.means, means])
+        self.covariances = np.concatenate([self.covariances, _diagonal(std**2)])
+        self.tracks = np.concatenate([self.tracks, tracks])
+        self.misses = np.concatenate([self.misses, np.zeros(n, dtype=np.int32)])
+
+
+def thumbnail(frame, size: Tuple[int, int] = (64, 36)) -> np.ndarray:
+    """A small grayscale float32 copy of a frame, for frame_difference."""
+    image = load_image(frame)
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    return np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32) / 255
+
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """The mean absolute difference of two thumbnails, from 0 to 1."""
+    return float(np.abs(a - b).mean())
+
+
+def compare_detections(reference: np.ndarray, candidate: np.ndarray, min_iou: float = 0.5):
+    """The (true positives, reference count, candidate count) of candidate detections.
+
+    A candidate is a true positive when it overlaps a reference box of the same class by at
+    least min_iou, every reference box is matched at most once.
+    """
+    if not len(reference) or not len(candidate):
+        return 0, len(reference), len(candidate)
+    iou = _overlaps(_corners(reference)[:, :, None], _corners(candidate)[:, None, :], False)
+    iou[reference["class_id"][:, None] != candidate["class_id"][None, :]] = 0
+    matched = 0
+    used = np.zeros(len(candidate), dtype=bool)
+    for row in iou:
+        row = np.where(used, 0, row)
+        best = int(np.argmax(row))
+        if row[best] >= min_iou:
+            used[best] = True
+            matched += 1
+    return matched, len(reference), len(candidate)
+
+
+class VideoDetector(object):
+    """Detects the objects of consecutive video frames, with the network on keyframes only.
+
+    Args:
+        detector: the ImageDetector of the keyframes
+        max_interval: the most frames between keyframes, 1 runs the network on every frame
+        difference_threshold: a frame_difference with the last keyframe above it makes a
+            keyframe, e.g. 0.05, None disables the adaptive keyframes
+        audit_interval: if positive, also runs the network every audit_interval tracked
+            frames, and counts its agreement with the tracked boxes in stats()
+        min_iou: the IoU of the tracking and the audit matches
+        max_misses: the keyframes a track may go undetected before it is dropped
+        detect_kwargs: passed to ImageDetector.detect, e.g. threshold
+    """
+
+    def __init__(
+        self,
+        detector,
+        max_interval: int = 10,
+        difference_threshold: float = 0.05,
+        audit_interval: int = 0,
+        min_iou: float = 0.3,
+        max_misses: int = 1,
+        **detect_kwargs,
+    ):
+        self.detector = detector
+        self.max_interval = max_interval
+        self.difference_threshold = difference_threshold
+        self.audit_interval = audit_interval
+        self.min_iou = min_iou
+        self.detect_kwargs = dict(detect_kwargs, as_array=True)
+        self.tracker = Tracker(min_iou, max_misses)
+        self._keyframe = None
+        self._since_keyframe = 0
+        self._stats = dict(frames=0, keyframes=0, audits=0, matched=0, detected=0, tracked=0)
+
+    def detect(self, frame) -> np.ndarray:
+        """The TRACK_DTYPE boxes of the next frame, in frame pixels."""
+        model = self.detector.network.name
+        small = None
+        if self.difference_threshold is not None:
+            small = thumbnail(frame)
+
+        keyframe = self._keyframe is None or self._since_keyframe + 1 >= self.max_interval
+        if not keyframe and small is not None:
+            keyframe = frame_difference(small, self._keyframe) > self.difference_threshold
+        self._stats["frames"] += 1
+
+        if keyframe:
+            detections = self.detector.detect(frame, **self.detect_kwargs)
+            with metrics.timer("track", model):
+                self.tracker.predict()
+                self.tracker.update(detections)
+                rv = self.tracker.boxes()
+            self._keyframe = small if small is not None else True
+            self._since_keyframe = 0
+            self._stats["keyframes"] += 1
+            return rv
+
+        with metrics.timer("track", model):
+            self.tracker.predict()
+            rv = self.tracker.boxes()
+        self._since_keyframe += 1
+        if self.audit_interval > 0 and self._since_keyframe % self.audit_interval == 0:
+            self._audit(frame, rv)
+        return rv
+
+    @property
+    def last_was_keyframe(self) -> bool:
+        return self._since_keyframe == 0
+
+    def stats(self) -> dict:
+        """The frames, keyframes and audits so far, and the audits' precision and recall.
+
+        The audits compare the tracked boxes with the network's detections of the same frames,
+        precision is the share of tracked boxes the network agrees with, recall the share of
+        the network's detections that were tracked.
+        """
+        rv = dict(self._stats)
+        rv["keyframe_ratio"] = rv["keyframes"] / rv["frames"] if rv["frames"] else 0.0
+        rv["precision"] = rv["matched"] / rv["tracked"] if rv["tracked"] else 1.0
+        rv["recall"] = rv["matched"] / rv["detected"] if rv["detected"] else 1.0
+        return rv
+
+    def _audit(self, frame, tracked):
+        detections = self.detector.detect(frame, **self.detect_kwargs)
+        matched, detected, num_tracked = compare_detections(detections, tracked, self.min_iou)
+        self._stats["audits"] += 1
+        self._stats["matched"] += matched
+        self._stats["detected"] += detected
+        self._stats["tracked"] += num_tracked
+
+
+def _boxes(detections) -> np.ndarray:
+    return np.stack([detections[name].astype(np.float64) for name in ("x", "y", "w", "h")], 1)
+
+
+def _diagonal(values) -> np.ndarray:
+    """A stack of diagonal matrices from a (n, k) array."""
+    rv = np.zeros(values.shape + values.shape[-1:])
+    idx = np.arange(values.shape[-1])
+    rv[..., idx, idx] = values
+    return rv
@@ -1,10 +1,38 @@
+import hashlib
 import os
+import tempfile
+import threading
 import fsspec
 
 import numpy as np
 from PIL import Image
 from PIL import ImageDraw
 
+from . import metrics
+from .artifacts import ArtifactCache
+from .preprocess import letterbox
+
+# The byte budget of the model artifact cache, 0 is unbounded
+ARTIFACT_CACHE_BYTES_ENV = "DARKNET_PY_ARTIFACT_CACHE_BYTES"
+DEFAULT_ARTIFACT_CACHE_BYTES = 10 << 30
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def darknet_cache_dir(*paths) -> str:
+    return os.path.join(os.environ["HOME"], ".cache", "darknet.py", *paths)
+
+
+def artifact_cache() -> ArtifactCache:
+    """The model artifact cache of this process, in darknet_cache_dir("artifacts")."""
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if _artifact_cache is None:
+            max_bytes = int(os.environ.get(ARTIFACT_CACHE_BYTES_ENV, DEFAULT_ARTIFACT_CACHE_BYTES))
+            _artifact_cache = ArtifactCache(darknet_cache_dir("artifacts"), max_bytes)
+        return _artifact_cache
+
 
 def fsspec_cache_open(
     urlpath: str,
@@ -14,21 +42,75 @@ def fsspec_cache_open(
     errors=None,
     protocol=None,
     newline=None,
+    refresh: bool = False,
     **kwargs,
 ) -> fsspec.core.OpenFile:
+    """fsspec.open, remote files are fetched into the artifact cache, refresh fetches them again."""
     chain = urlpath.split("::")
 
     if chain[0].startswith("github"):
         chain[0], kwargs = fsspec_split_github_url(chain[0], kwargs)
 
-    # Because darknet is written in C, we need real file names for it to open
-    if chain[0] not in {"filecache", "simplecache"}:
-        first_scheme = chain[0].split("://")[0]
-        urlpath = f"filecache::{urlpath}"
-        filecache = dict(cache_storage=f"{os.environ['HOME']}/.cache/darknet.py")
-        kwargs = {"filecache": filecache, first_scheme: kwargs}
+    # Because darknet is written in C, we need real file names for it to open. Local files
+    # already are, explicitly cached urls are left to fsspec, and the rest go through the
+    # artifact cache.
+    chained = len(chain) > 1
+    first_scheme = chain[0].split("://")[0] if "://" in chain[0] or chained else "file"
+    if chain[0] in {"filecache", "simplecache"} or first_scheme in {"file", "local"}:
+        return fsspec.open(
+            urlpath, mode, compression, encoding, errors, protocol, newline, **kwargs
+        )
 
-    return fsspec.open(urlpath, mode, compression, encoding, errors, protocol, newline, **kwargs)
+    # The storage options of a chained url belong to its first filesystem
+    if chained and kwargs:
+        kwargs = {first_scheme: kwargs}
+    return artifact_cache().open(
+        "::".join(chain), mode, encoding, errors, newline, compression, refresh, **kwargs
+    )
+
+
+def override_net_config(config_url: str, directory: str = None, **options) -> str:
+    """A local copy of a cfg with some [net] options replaced, e.g. width=608, height=608.
+
+    The copies are named after the sha256 of their contents, in darknet_cache_dir("cfg") by
+    default, so the same overrides of the same cfg share a file.
+
+    Returns: the cfg file name
+    """
+    with fsspec_cache_open(config_url, mode="rt") as f:
+        lines = f.read().splitlines()
+
+    in_net, end = False, len(lines)
+    missing = dict(options)
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("["):
+            if in_net:
+                end = i
+                break
+            in_net = stripped in ("[net]", "[network]")
+        elif in_net and "=" in stripped and not stripped.startswith(("#", ";")):
+            key = stripped.split("=", 1)[0].strip()
+            if key in options:
+                lines[i] = f"{key}={missing.pop(key, options[key])}"
+    if not in_net and end == len(lines):
+        raise ValueError(f"The cfg {config_url} has no [net] section")
+    # A blank line may close the [net] section, the missing options go before it
+    while end > 0 and not lines[end - 1].strip():
+        end -= 1
+    lines[end:end] = [f"{key}={value}" for key, value in missing.items()]
+    contents = "\n".join(lines) + "\n"
+
+    directory = directory or darknet_cache_dir("cfg")
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256(contents.encode("utf-8")).hexdigest()
+    file_name = os.path.join(directory, f"{digest}.cfg")
+    if not os.path.exists(file_name):
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+        os.replace(tmp_name, file_name)
+    return file_name
 
 
 def fsspec_split_github_url(github_url: str, kwargs: dict) -> (str, dict):
@@ -54,27 +136,10 @@ def fsspec_split_github_url(github_url: str, kwargs: dict) -> (str, dict):
 
 
 def image_to_3darray(image, target_shape):
-    # We assume the original size matches the target_shape (height, width)
-    orig_size = target_shape
-
-    if isinstance(image, str):
-        with fsspec.open(image, mode="rb") as f:
-            image = Image.open(f)
-            image.load()
-
-    if isinstance(image, Image.Image):
-        orig_size = image.size
-        image = image_scale_and_pad(image, target_shape)
-        image = np.asarray(image)
-
-    if isinstance(image, np.ndarray):
-        if image.shape[0:2] != target_shape:
-            image = Image.fromarray(image)
-            orig_size = image.size
-            image = image_scale_and_pad(image, target_shape)
-            image = np.asarray(image)
-        image = image.transpose((2, 0, 1)).astype(dtype=np.float32, order="C") / 255
-    return image, orig_size
+    width, height = target_shape
+    frame = np.empty((3, height, width), dtype=np.float32)
+    with metrics.timer("preprocess"):
+        return frame, letterbox(image, frame).frame_size
 
 
 def image_scale_and_pad(image: Image.Image, target_shape) -> Image.Image:
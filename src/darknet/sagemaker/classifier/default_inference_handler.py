@@ -1,36 +1,52 @@
 from typing import Tuple, List
 
+import numpy as np
 from sagemaker_inference.errors import UnsupportedFormatError
 
 from .. import DefaultDarknetInferenceHandler, image_to_3darray, Network
+from ..encoding import Classifications
 
 
 class DefaultDarknetClassifierInferenceHandler(DefaultDarknetInferenceHandler):
     def default_predict_fn(self, data, model: Tuple[Network, List[str]]):
         """A default predict_fn for DarkNet. Calls a model on data deserialized in input_fn.
         Args:
-            data: input data (PIL.Image) for prediction deserialized by input_fn
+            data: input data (PIL.Image) for prediction deserialized by input_fn, a list of
+                "Images" is a batch, an "NDArray" holds network inputs, see default_input_fn
             model: Darknet model loaded in memory by model_fn
 
-        Returns: a prediction
+        Returns: the Classifications
         """
+        if "Prediction" in data:
+            # A result cache hit of default_input_fn
+            return data["Prediction"]
         network, labels = model
         max_labels = data.get("MaxLabels", 5)
         # TODO: min_confidence = data.get("MinConfidence", 55)
 
+        width, height = network.shape
         if "NDArray" in data:
-            probabilities = network.predict(data["NDArray"])
-        elif "Image" in data:
-            image, _ = image_to_3darray(data["Image"], network.shape)
-            probabilities = network.predict_image(image)
+            frames = np.asarray(data["NDArray"])
+            is_batch = frames.ndim == 4
+            frames = np.ascontiguousarray(frames, dtype=np.float32)
+            frames = frames.reshape((-1, network.depth, height, width))
+        elif "Image" in data or "Images" in data:
+            images = data["Images"] if "Images" in data else [data["Image"]]
+            frames = [image_to_3darray(image, network.shape)[0] for image in images]
+            is_batch = "Images" in data
         else:
             raise UnsupportedFormatError("Expected an NDArray or an Image")
 
-        rv = [
-            {
-                "Name": label,
-                "Confidence": prob * 100,
-            }
-            for label, prob in sorted(zip(labels, probabilities), key=lambda x: x[1], reverse=True)
-        ]
-        return {"Labels": rv[0:max_labels] if max_labels else rv}
+        frames = np.ascontiguousarray(frames, dtype=np.float32).reshape((len(frames), -1))
+        probabilities = np.empty((len(frames), network.output_size()), dtype=np.float32)
+        for start in range(0, len(frames), network.batch_size):
+            stop = start + network.batch_size
+            probabilities[start:stop] = network.predict_batch(frames[start:stop].reshape(-1))
+        prediction = Classifications(probabilities, labels, max_labels, is_batch)
+        self._cache_prediction(data, prediction)
+        return prediction
+
+    def default_warmup_fn(self, model: Tuple[Network, List[str]]):
+        """Runs a full batch through predict_batch."""
+        network, _ = model
+        network.predict_batch(np.zeros(network.batch_size * network.input_size(), np.float32))
@@ -0,0 +1,105 @@
+"""Model server configuration, from a ``darknet.json`` file in the model dir and the environment.
+
+The environment wins over the file::
+
+    SAGEMAKER_DARKNET_WORKERS_PER_CORE    model server workers per CPU core, e.g. 0.5
+    SAGEMAKER_DARKNET_THREADS_PER_WORKER  OpenMP threads of each worker's darknet
+    SAGEMAKER_DARKNET_BATCH_SIZE          the network batch size
+    SAGEMAKER_DARKNET_WARMUP              synthetic forward passes before a worker is ready
+    SAGEMAKER_DARKNET_METRICS_PORT        serves the stage latencies of every worker on
+                                          http://<host>:<port>/metrics, 0 turns them off
+    SAGEMAKER_DARKNET_RESULT_CACHE_ENTRIES  the predictions each worker caches by payload,
+                                            0 turns the cache off
+    SAGEMAKER_DARKNET_RESULT_CACHE_BYTES    the bytes of cached predictions per worker
+    SAGEMAKER_DARKNET_RESULT_CACHE_TTL      seconds a cached prediction stays valid, 0 forever
+
+An explicit SAGEMAKER_MODEL_SERVER_WORKERS or OMP_NUM_THREADS is left untouched, and
+OMP_NUM_THREADS is only set when the workers per core or the threads per worker are configured.
+"""
+
+import json
+import os
+import tempfile
+from typing import NamedTuple
+
+from darknet.py import metrics
+
+CONFIG_FILE = "darknet.json"
+BATCH_SIZE_ENV = "SAGEMAKER_DARKNET_BATCH_SIZE"
+# Where the workers export their metrics snapshots, set by configure_environment
+METRICS_DIR_ENV = "SAGEMAKER_DARKNET_METRICS_DIR"
+
+_ENVIRONMENT = {
+    "workers_per_core": ("SAGEMAKER_DARKNET_WORKERS_PER_CORE", float),
+    "threads_per_worker": ("SAGEMAKER_DARKNET_THREADS_PER_WORKER", int),
+    "batch_size": (BATCH_SIZE_ENV, int),
+    "warmup": ("SAGEMAKER_DARKNET_WARMUP", int),
+    "metrics_port": ("SAGEMAKER_DARKNET_METRICS_PORT", int),
+    "result_cache_entries": ("SAGEMAKER_DARKNET_RESULT_CACHE_ENTRIES", int),
+    "result_cache_bytes": ("SAGEMAKER_DARKNET_RESULT_CACHE_BYTES", int),
+    "result_cache_ttl": ("SAGEMAKER_DARKNET_RESULT_CACHE_TTL", float),
+}
+
+
+class ServerConfig(NamedTuple):
+    workers_per_core: float = 0.0
+    threads_per_worker: int = 0
+    batch_size: int = 1
+    warmup: int = 1
+    metrics_port: int = 0
+    result_cache_entries: int = 0
+    result_cache_bytes: int = 64 << 20
+    result_cache_ttl: float = 0.0
+
+    @property
+    def num_workers(self) -> int:
+        """The number of model server workers, 0 keeps the model server default."""
+        if self.workers_per_core <= 0:
+            return 0
+        return max(1, round(self.workers_per_core * (os.cpu_count() or 1)))
+
+
+def load_config(model_dir: str = None, environ=None) -> ServerConfig:
+    environ = os.environ if environ is None else environ
+    options = {}
+    if model_dir is not None:
+        try:
+            with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+                options = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    unknown = set(options) - set(ServerConfig._fields)
+    if unknown:
+        raise ValueError(f"Unknown {CONFIG_FILE} options: {sorted(unknown)}")
+
+    for field, (name, cast) in _ENVIRONMENT.items():
+        if environ.get(name):
+            options[field] = environ[name]
+    return ServerConfig(**{field: _ENVIRONMENT[field][1](v) for field, v in options.items()})
+
+
+def configure_environment(config: ServerConfig, environ=None):
+    """Sets the model server workers and darknet's OpenMP threads, before the server starts."""
+    environ = os.environ if environ is None else environ
+    if config.num_workers > 0:
+        environ.setdefault("SAGEMAKER_MODEL_SERVER_WORKERS", str(config.num_workers))
+
+    # Only once threads or workers are configured, the cores are then split between the workers
+    if config.threads_per_worker > 0 or config.num_workers > 0:
+        num_cores = os.cpu_count() or 1
+        num_workers = int(environ.get("SAGEMAKER_MODEL_SERVER_WORKERS") or num_cores)
+        num_threads = config.threads_per_worker or max(1, num_cores // num_workers)
+        environ.setdefault("OMP_NUM_THREADS", str(num_threads))
+
+    if config.metrics_port > 0:
+        environ.setdefault(metrics.ENABLE_ENV, "1")
+        environ.setdefault(METRICS_DIR_ENV, tempfile.mkdtemp(prefix="darknet-metrics-"))
+
+
+def start_metrics_server(config: ServerConfig, environ=None):
+    """Serves the sum of the workers' metrics, after configure_environment, or returns None."""
+    environ = os.environ if environ is None else environ
+    if config.metrics_port <= 0:
+        return None
+    return metrics.serve(config.metrics_port, environ[METRICS_DIR_ENV])
@@ -1,4 +1,8 @@
-import io
+import base64
+import email
+import email.policy
+import json
+import os
 
 import numpy as np
 import PIL.Image as Image
@@ -11,15 +15,68 @@ from sagemaker_inference.encoder import encode
 from sagemaker_inference.decoder import decode
 from sagemaker_inference.default_inference_handler import DefaultInferenceHandler
 
+from darknet.py import metrics
 from darknet.py.network import Network
+from darknet.py.preprocess import open_image
+from darknet.py.result_cache import ResultCache, payload_digest
+
+from .config import METRICS_DIR_ENV, load_config
+from .encoding import Classifications, Detections, encode_prediction
+
+JSONLINES_CONTENT_TYPES = ("application/jsonlines", "application/x-jsonlines")
+RGB8_CONTENT_TYPE = "application/x-image-rgb8"
+
+
+def split_multipart(input_data, content_type) -> List[bytes]:
+    """The encoded image of every part of a multipart payload, in order."""
+    header = f"Content-Type: {content_type}\r\n\r\n".encode("utf-8")
+    message = email.message_from_bytes(header + bytes(input_data), policy=email.policy.HTTP)
+    return [part.get_payload(decode=True) for part in message.iter_parts()]
+
+
+def split_jsonlines(input_data) -> List[bytes]:
+    """One base64 encoded image per line, either a JSON string or a {"Bytes": ...} object."""
+    if isinstance(input_data, (bytes, bytearray)):
+        input_data = input_data.decode("utf-8")
+    payloads = []
+    for line in input_data.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            record = record["Bytes"]
+        payloads.append(base64.b64decode(record))
+    return payloads
+
+
+def decode_rgb8(input_data, content_type) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Reads (N, height, width, 3) uint8 pixels, already resized by the client.
+
+    The content type parameters give the width and height of the pixels, and optionally the
+    frame-width and frame-height of the original frame, the boxes are mapped back to it, e.g.
+    ``application/x-image-rgb8; width=416; height=234; frame-width=1920; frame-height=1080``.
+    """
+    params = dict(
+        param.strip().split("=", 1) for param in content_type.split(";")[1:] if "=" in param
+    )
+    width, height = int(params["width"]), int(params["height"])
+    frames = np.frombuffer(bytes(input_data), dtype=np.uint8).reshape((-1, height, width, 3))
+    frame_size = int(params.get("frame-width", width)), int(params.get("frame-height", height))
+    return frames, frame_size
 
 
 class DefaultDarknetInferenceHandler(DefaultInferenceHandler, ABC):
+    # The network (width, height) and name, set by default_model_fn for input_fn and output_fn
+    network_shape: Tuple[int, int] = None
+    model_name: str = ""
+    # The predictions of recent payloads, set by default_model_fn when configured
+    result_cache: ResultCache = None
+
     def default_model_fn(self, model_dir) -> Tuple[Network, List[str]]:
         """
         Loads a model.
         For PyTorch, a default function to load a model cannot be provided.
-        Returns: A DarkNet Detector.
+        Returns: A DarkNet Detector, warmed up by the configured synthetic forward passes.
         """
         labels_file = glob(f"{model_dir}/*.labels")[0]
         with open(labels_file) as f:
@@ -28,30 +85,110 @@ class DefaultDarknetInferenceHandler(DefaultInferenceHandler, ABC):
         cfg_file = glob(f"{model_dir}/*.cfg")[0]
         weights_file = glob(f"{model_dir}/*.weights")[0]
 
-        return Network(cfg_file, weights_file, batch_size=1), labels
+        config = load_config(model_dir)
+        model = Network(cfg_file, weights_file, batch_size=config.batch_size), labels
+        self.network_shape = model[0].shape
+        self.model_name = model[0].name
+        if metrics.enabled() and os.environ.get(METRICS_DIR_ENV):
+            metrics.export_snapshots(os.environ[METRICS_DIR_ENV])
+        if config.result_cache_entries > 0:
+            self.result_cache = ResultCache(
+                config.result_cache_entries, config.result_cache_bytes, config.result_cache_ttl
+            )
+        for _ in range(config.warmup):
+            self.default_warmup_fn(model)
+        return model
+
+    def default_warmup_fn(self, model: Tuple[Network, List[str]]):
+        """Runs a synthetic forward pass, darknet allocates its working memory on the first one.
+
+        The model server reports a worker ready once model_fn returns, so the first request does
+        not pay for it.
+        """
+        network, _ = model
+        width, height = network.shape
+        network.predict_image(np.zeros((network.depth, height, width), dtype=np.float32))
 
     def default_input_fn(self, input_data, content_type) -> Union[Image.Image, np.array]:
         """A default input_fn that can handle PIL Image Types
 
         Args:
             input_data: the request payload serialized in the content_type format
-            content_type: the request content_type
+            content_type: the request content_type, multipart/* and JSON lines payloads are
+                batches of images
+
+        Returns: a PIL Image, a list of PIL Images, or an NDArray ready for predict_fn. Images
+            come with their original "FrameSize", or "FrameSizes", JPEGs are decoded at the
+            smallest scale that still covers the network shape. An "NDArray" holds float32
+            network inputs, (channels, height, width) for one, or (N, channels, height, width)
+            for a batch, of any N. With a result cache, a payload
+            seen before is not decoded, its cached "Prediction" is returned instead.
+        """
+        digest = None
+        if self.result_cache is not None:
+            digest = payload_digest(content_type, input_data)
+            prediction = self.result_cache.get(self._result_key(digest), self.model_name)
+            if prediction is not None:
+                return {"Prediction": prediction}
 
-        Returns: a PIL Image ready for ImageClassifier
+        with metrics.timer("decode", self.model_name):
+            data = self._decode(input_data, content_type)
+        if digest is not None:
+            data["PayloadDigest"] = digest
+        return data
+
+    def _result_key(self, digest) -> str:
+        """The result cache key of a payload, it is all default_input_fn knows of a request."""
+        return ResultCache.key(digest, self.model_name, self.network_shape)
+
+    def _cache_prediction(self, data, prediction):
+        """Caches the prediction of data decoded by default_input_fn.
+
+        Data with its own MaxLabels or MinConfidence, e.g. set by a custom input_fn, is not
+        cached, the lookup of default_input_fn could not tell it from the defaults.
         """
+        if self.result_cache is None or "PayloadDigest" not in data:
+            return
+        if "MaxLabels" in data or "MinConfidence" in data:
+            return
+        key = self._result_key(data["PayloadDigest"])
+        self.result_cache.put(key, prediction, size=prediction[0].nbytes)
+
+    def _decode(self, input_data, content_type):
         if content_type.startswith("image/"):
-            image = Image.open(io.BytesIO(input_data))
-            return {"Image": image}
+            image, frame_size = open_image(bytes(input_data), self.network_shape)
+            return {"Image": image, "FrameSize": frame_size}
+        elif content_type.startswith("multipart/"):
+            return self._images(split_multipart(input_data, content_type))
+        elif content_type.split(";")[0].strip() in JSONLINES_CONTENT_TYPES:
+            return self._images(split_jsonlines(input_data))
+        elif content_type.split(";")[0].strip() == RGB8_CONTENT_TYPE:
+            frames, frame_size = decode_rgb8(input_data, content_type)
+            if len(frames) == 1:
+                return {"Image": frames[0], "FrameSize": frame_size}
+            return {"Images": list(frames), "FrameSizes": [frame_size] * len(frames)}
         else:
             return {"NDArray": decode(input_data, content_type)}
 
+    def _images(self, payloads):
+        images, frame_sizes = [], []
+        for payload in payloads:
+            image, frame_size = open_image(payload, self.network_shape)
+            images.append(image)
+            frame_sizes.append(frame_size)
+        return {"Images": images, "FrameSizes": frame_sizes}
+
     def default_output_fn(self, prediction, accept):
-        """A default output_fn for PyTorch. Serializes predictions from predict_fn to JSON, CSV or NPY format.
+        """A default output_fn for DarkNet. Serializes Detections and Classifications to JSON,
+        NPY, NPZ or msgpack, see darknet.sagemaker.encoding, other predictions to JSON, CSV or NPY.
 
         Args:
             prediction: a prediction result from predict_fn
             accept: type which the output data needs to be serialized
 
-        Returns: output data serialized (Return Sagemaker format?)
+        Returns: output data serialized
         """
-        return encode(prediction, accept)
+        with metrics.timer("encode", self.model_name):
+            if isinstance(prediction, (Detections, Classifications)):
+                return encode_prediction(prediction, accept)
+            return encode(prediction, accept)
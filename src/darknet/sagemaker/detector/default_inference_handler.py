@@ -1,54 +1,123 @@
-from itertools import groupby
-
 from typing import Tuple, List
+
+import numpy as np
 from sagemaker_inference.errors import UnsupportedFormatError
 
-from .. import DefaultDarknetInferenceHandler, Network, image_to_3darray
+from darknet.py import metrics
+from darknet.py.detections import DETECTION_DTYPE, split_frames
+from darknet.py.preprocess import LetterboxPreprocessor
+
+from .. import DefaultDarknetInferenceHandler, Network
+from ..encoding import Detections
 
 
 class DefaultDarknetDetectorInferenceHandler(DefaultDarknetInferenceHandler):
+    _preprocessor: LetterboxPreprocessor = None
+
     def default_predict_fn(self, data, model: Tuple[Network, List[str]]):
         """A default predict_fn for DarkNet. Calls a model on data deserialized in input_fn.
         Args:
-            data: input data (PIL.Image) for prediction deserialized by input_fn
+            data: input data (PIL.Image) for prediction deserialized by input_fn, a list of
+                "Images" is a batch, an "NDArray" holds network inputs, see default_input_fn
             model: Darknet model loaded in memory by model_fn
 
-        Returns: detected labels
+        Returns: the Detections, in frame pixels
         """
-        if "Image" not in data:
-            raise UnsupportedFormatError("Detector model expects an Image.")
-
+        if "Prediction" in data:
+            # A result cache hit of default_input_fn
+            return data["Prediction"]
         network, labels = model
 
         max_labels = data.get("MaxLabels", None)
         min_confidence = data.get("MinConfidence", 55)
+        threshold = min_confidence / 100.0
+
+        if "Image" in data:
+            is_batch = False
+            detections = self._detect_images(
+                network, [data["Image"]], threshold, [data.get("FrameSize")]
+            )
+        elif "Images" in data:
+            is_batch = True
+            images = data["Images"]
+            frame_sizes = data.get("FrameSizes", [None] * len(images))
+            detections = self._detect_images(network, images, threshold, frame_sizes)
+        elif "NDArray" in data:
+            inputs = np.asarray(data["NDArray"])
+            is_batch = inputs.ndim == 4
+            detections = self._detect_inputs(network, inputs, threshold)
+        else:
+            raise UnsupportedFormatError("Detector model expects an Image or a batch of images.")
+
+        detections = list(detections)
+        # One postprocess observation per request
+        with metrics.timer("postprocess", network.name):
+            frames = []
+            for frame_index, frame in enumerate(detections):
+                if max_labels:
+                    # The detections of the max_labels lowest class ids, as the JSON labels list
+                    class_ids = np.unique(frame["class_id"])[:max_labels]
+                    frame = frame[np.isin(frame["class_id"], class_ids)]
+                frame["frame_index"] = frame_index
+                frames.append(frame)
+            detections = np.concatenate(frames) if frames else np.empty(0, dtype=DETECTION_DTYPE)
+        prediction = Detections(detections, len(frames), labels, is_batch)
+        self._cache_prediction(data, prediction)
+        return prediction
+
+    def default_warmup_fn(self, model: Tuple[Network, List[str]]):
+        """Runs a full batch through detect_batch."""
+        network, _ = model
+        width, height = network.shape
+        blank = np.zeros((height, width, network.depth), dtype=np.uint8)
+        for _ in self._detect_images(network, [blank] * network.batch_size, 1.0):
+            pass
+
+    def _detect_inputs(self, network: Network, inputs: np.ndarray, threshold):
+        """Detects the objects of network inputs, in network pixels."""
+        width, height = network.shape
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32)
+        inputs = inputs.reshape((-1, network.depth * height * width))
+        for start in range(0, len(inputs), network.batch_size):
+            stop = start + network.batch_size
+            batch = inputs[start:stop]
+            detections = network.detect_batch(
+                batch.reshape(-1),
+                frame_size=network.shape,
+                threshold=threshold,
+                hierarchical_threshold=threshold,
+                relative=0,
+                letterbox=0,
+                as_array=True,
+            )
+            yield from split_frames(detections, len(batch))
+
+    def _detect_images(self, network: Network, images, threshold, frame_sizes=None):
+        preprocessor = self._preprocessor
+        if preprocessor is None or (preprocessor.shape, preprocessor.batch_size) != (
+            network.shape,
+            network.batch_size,
+        ):
+            self._preprocessor = LetterboxPreprocessor.for_network(network)
 
-        image = data["Image"]
-        image, frame_size = image_to_3darray(image, network.shape)
-        _ = network.predict_image(image)
-
-        detections = network.detect(
-            frame_size=frame_size,
-            threshold=min_confidence / 100.0,
-            hierarchical_threshold=min_confidence / 100,
-        )
-        detections = sorted(detections, key=lambda x: x[0])
-
-        def bbox_to_sm_map(x_0, y_0, w, h):
-            return {"Width": w, "Height": h, "Left": x_0 - w / 2, "Top": y_0 + h / 2}
-
-        rv = []
-        for label_idx, instances in groupby(detections, key=lambda x: x[0]):
-            instances = [
-                {"Confidence": prob * 100, "BoundingBox": bbox_to_sm_map(*bbox)}
-                for _, prob, bbox in sorted(instances, key=lambda x: x[1], reverse=True)
-            ]
-            detection = {
-                "Name": labels[label_idx],
-                "Confidence": instances[0]["Confidence"],
-                "Instances": instances,
-                "Parents": [],
-            }
-            detection["Confidence"] = detection["Instances"][0]["Confidence"]
-            rv.append(detection)
-        return {"Labels": rv[0:max_labels] if max_labels else rv}
+        batch_size = self._preprocessor.batch_size
+        for start in range(0, len(images), batch_size):
+            stop = start + batch_size
+            frames, letterboxes = self._preprocessor(images[start:stop])
+            if frame_sizes is not None:
+                # Boxes go back to the original frame, not to the reduced size decoded image
+                letterboxes = [
+                    box if size is None else box.scaled_to(size)
+                    for box, size in zip(letterboxes, frame_sizes[start:stop])
+                ]
+            detections = network.detect_batch(
+                frames.reshape(-1),
+                frame_size=network.shape,
+                threshold=threshold,
+                hierarchical_threshold=threshold,
+                relative=0,
+                letterbox=0,
+                as_array=True,
+            )
+            for letterbox, frame in zip(letterboxes, split_frames(detections, len(frames))):
+                yield letterbox.map_detections(frame)
@@ -0,0 +1,164 @@
+"""Array form predictions, and their encodings for output_fn.
+
+The predict_fn of the handlers return Detections or Classifications. The npy, npz and msgpack
+encodings are written straight from their arrays, the Rekognition style dicts are only built for
+JSON::
+
+    application/json      the Rekognition style {"Labels": [...]}, a list of them for a batch
+    application/x-npy     detections: a DETECTION_DTYPE array, boxes are (center x, center y,
+                          width, height) frame pixels. classifications: (frames, labels)
+                          probabilities
+    application/x-npz     the same, one array per column, plus "labels"
+    text/csv              detections: one row per box, the DETECTION_DTYPE columns and "label".
+                          classifications: one row of probabilities per frame, under a header
+                          of the labels
+    application/x-msgpack {"labels": [...], "num_frames": n, "columns": {name: bytes}}, the
+                          columns are little endian and typed as in DETECTION_DTYPE, or float32
+                          "probabilities" of shape (frames, labels). Requires msgpack.
+"""
+
+import csv
+import io
+import json
+from itertools import groupby
+from typing import List, NamedTuple
+
+import numpy as np
+from sagemaker_inference import content_types
+from sagemaker_inference.errors import UnsupportedFormatError
+
+from darknet.py.classifier import top_k_batch
+from darknet.py.detections import DETECTION_DTYPE, detections_to_tuples, split_frames
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MSGPACK = "application/x-msgpack"
+
+
+class Detections(NamedTuple):
+    detections: np.ndarray
+    num_frames: int
+    labels: List[str]
+    is_batch: bool
+
+    def columns(self) -> dict:
+        return {name: self.detections[name] for name in DETECTION_DTYPE.names}
+
+    def to_array(self) -> np.ndarray:
+        return self.detections
+
+    def to_rekognition(self):
+        rv = [
+            rekognition_detections(detections_to_tuples(frame), self.labels)
+            for frame in split_frames(self.detections, self.num_frames)
+        ]
+        return rv if self.is_batch else rv[0]
+
+
+class Classifications(NamedTuple):
+    probabilities: np.ndarray
+    labels: List[str]
+    max_labels: int
+    is_batch: bool
+
+    @property
+    def num_frames(self):
+        return len(self.probabilities)
+
+    def columns(self) -> dict:
+        return {"probabilities": self.probabilities}
+
+    def to_array(self) -> np.ndarray:
+        return self.probabilities
+
+    def to_rekognition(self):
+        rv = rekognition_classifications(self.probabilities, self.labels, self.max_labels)
+        return rv if self.is_batch else rv[0]
+
+
+def rekognition_detections(detections, labels) -> dict:
+    """The {"Labels": [...]} of one frame's [(class_id, prob, (x, y, w, h)), ...] detections."""
+    detections = sorted(detections, key=lambda x: x[0])
+
+    def bbox_to_sm_map(x_0, y_0, w, h):
+        return {"Width": w, "Height": h, "Left": x_0 - w / 2, "Top": y_0 + h / 2}
+
+    rv = []
+    for label_idx, instances in groupby(detections, key=lambda x: x[0]):
+        instances = [
+            {"Confidence": prob * 100, "BoundingBox": bbox_to_sm_map(*bbox)}
+            for _, prob, bbox in sorted(instances, key=lambda x: x[1], reverse=True)
+        ]
+        detection = {
+            "Name": labels[label_idx],
+            "Confidence": instances[0]["Confidence"],
+            "Instances": instances,
+            "Parents": [],
+        }
+        detection["Confidence"] = detection["Instances"][0]["Confidence"]
+        rv.append(detection)
+    return {"Labels": rv}
+
+
+def rekognition_classifications(probabilities, labels, max_labels) -> List[dict]:
+    """The {"Labels": [...]} of every row of a (frames, labels) probabilities array."""
+    # top_k_batch only sorts the max_labels most probable labels of each frame
+    top = max_labels if max_labels else len(labels)
+    return [
+        {"Labels": [{"Name": label, "Confidence": prob * 100} for label, prob in frame]}
+        for frame in top_k_batch(labels, probabilities, top)
+    ]
+
+
+def encode_csv(prediction) -> str:
+    """The CSV of Detections or Classifications, with a header row."""
+    with io.StringIO() as f:
+        writer = csv.writer(f)
+        if isinstance(prediction, Detections):
+            columns = prediction.columns()
+            writer.writerow(list(columns) + ["label"])
+            labels = [prediction.labels[class_id] for class_id in columns["class_id"]]
+            writer.writerows(zip(*(column.tolist() for column in columns.values()), labels))
+        else:
+            writer.writerow(prediction.labels)
+            writer.writerows(prediction.probabilities.tolist())
+        return f.getvalue()
+
+
+def encode_prediction(prediction, accept):
+    """Encodes Detections or Classifications for the accept content type."""
+    if accept == content_types.JSON:
+        return json.dumps(prediction.to_rekognition())
+
+    if accept == content_types.NPY:
+        with io.BytesIO() as f:
+            np.save(f, prediction.to_array())
+            return f.getvalue()
+
+    if accept == content_types.NPZ:
+        with io.BytesIO() as f:
+            np.savez(f, labels=np.array(prediction.labels), **prediction.columns())
+            return f.getvalue()
+
+    if accept == content_types.CSV:
+        return encode_csv(prediction)
+
+    if accept == MSGPACK:
+        if msgpack is None:
+            raise UnsupportedFormatError(f"{accept}, msgpack is not installed")
+        return msgpack.packb(
+            {
+                "labels": list(prediction.labels),
+                "num_frames": prediction.num_frames,
+                "columns": {
+                    name: column.astype(column.dtype.newbyteorder("<"), copy=False).tobytes()
+                    for name, column in prediction.columns().items()
+                },
+            },
+            use_bin_type=True,
+        )
+
+    raise UnsupportedFormatError(accept)
@@ -1,6 +1,6 @@
 # __init__.pxd
 
-cdef extern from "darknet.h":
+cdef extern from "darknet.h" nogil:
     """
     /*
      * darknet.h forgot to extern some useful network functions
@@ -74,6 +74,7 @@ cdef extern from "darknet.h":
     network* load_network(char* cfg_filename, char* weights_filename, int clear)
     network* load_network_custom(char* cfg_filename, char* weights_filename, int clear, int batch_size)
     void free_network(network self)
+    void set_batch_network(network* self, int batch_size)
 
     int network_batch_size(network *self);
     int network_width(network *self);
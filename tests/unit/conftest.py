@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from darknet.py.detections import DETECTION_DTYPE
+
+
+class FakeNetwork(object):
+    """A Network of (8, 8) RGB inputs, that reads the red value at the center of its frames.
+
+    detect_batch finds one box per frame, with that red value as its probability, of class 1
+    when it is above 0.5. predict_batch gives the (mean red, 1 - mean red) probabilities.
+    """
+
+    name = "fake"
+    shape = (8, 8)
+    depth = 3
+
+    def __init__(self, batch_size: int = 2, box=(8, 4)):
+        self.batch_size = batch_size
+        self.box = box
+        self.batches = []
+
+    def _frames(self, frames):
+        frames = frames.reshape((-1, self.depth) + self.shape[::-1])
+        self.batches.append(len(frames))
+        return frames
+
+    def detect_batch(self, frames, as_array=False, **kwargs):
+        frames = self._frames(frames)
+        rv = np.zeros(len(frames), dtype=DETECTION_DTYPE)
+        rv["frame_index"] = np.arange(len(frames))
+        rv["prob"] = frames[:, 0, 4, 4]
+        rv["class_id"] = (rv["prob"] > 0.5).astype(np.int32)
+        rv["x"], rv["y"] = 4, 4
+        rv["w"], rv["h"] = self.box
+        return rv
+
+    def output_size(self):
+        return 2
+
+    def input_size(self):
+        return self.depth * self.shape[0] * self.shape[1]
+
+    def predict_batch(self, frames):
+        means = self._frames(frames)[:, 0].mean(axis=(1, 2))
+        return np.stack([means, 1 - means], axis=1).astype(np.float32)
+
+
+@pytest.fixture
+def fake_network():
+    """Builds FakeNetworks, e.g. fake_network(batch_size=2)."""
+    return FakeNetwork
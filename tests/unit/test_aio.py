@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import darknet.py.aio as darknet_aio
+
+
+class FakeNetwork(object):
+    def output_size(self):
+        return 3
+
+
+class FakePool(object):
+    shape = (4, 4)
+
+    def __init__(self, config_url, weights_url, size=None):
+        self.networks = [FakeNetwork(), FakeNetwork()]
+
+    def __len__(self):
+        return len(self.networks)
+
+    def predict_image(self, image):
+        return np.array([0.1, image.mean(), 0.5], dtype=np.float32)
+
+    def detect_image(self, image, frame_size=None, **kwargs):
+        return [(1, float(image.mean()), (0, 0) + frame_size)]
+
+
+@pytest.fixture(autouse=True)
+def fake_pool(mocker):
+    mocker.patch.object(darknet_aio, "NetworkPool", FakePool)
+
+
+def test_async_image_detector():
+    async def main():
+        async with darknet_aio.AsyncImageDetector(["a", "b"], "cfg", "weights") as detector:
+            return await detector.detect(Image.new("RGB", (8, 4), (255, 255, 255)))
+
+    ((label, prob, bbox),) = asyncio.run(main())
+    assert label == "b"
+    assert bbox == (0, 0, 8, 4)
+
+
+def test_async_image_classifier_many_is_ordered():
+    images = [Image.new("RGB", (4, 4), (i * 25,) * 3) for i in range(10)]
+
+    async def main():
+        async with darknet_aio.AsyncImageClassifier(None, "cfg", "weights") as classifier:
+            return [rv async for rv in classifier.classify_many(images, top=1)]
+
+    results = asyncio.run(main())
+    assert [label for ((label, _),) in results] == [2] * 6 + [1] * 4
+    assert [prob for ((_, prob),) in results] == pytest.approx(
+        [0.5] * 6 + [i / 10.2 for i in range(6, 10)]
+    )
+
+
+def test_async_image_classifier_checks_labels():
+    with pytest.raises(TypeError):
+        darknet_aio.AsyncImageClassifier(["a"], "cfg", "weights")
+
+
+def test_async_classifier_in_successive_loops():
+    classifier = darknet_aio.AsyncImageClassifier(None, "cfg", "weights", max_pending=1)
+    images = [Image.new("RGB", (4, 4))] * 4
+
+    async def main():
+        # More calls than slots, they wait on the semaphore
+        return await asyncio.gather(*(classifier.classify(image, top=1) for image in images))
+
+    try:
+        assert len(asyncio.run(main())) == 4
+        assert len(asyncio.run(main())) == 4
+    finally:
+        classifier.close()
+
+
+def test_async_exit_does_not_block_the_loop():
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        async with darknet_aio.AsyncImageClassifier(None, "cfg", "weights") as classifier:
+            running = asyncio.ensure_future(classifier._submit(time.sleep, 0.3))
+            await asyncio.sleep(0.01)
+            del ticks[:]
+        ticker.cancel()
+        await running
+
+    asyncio.run(main())
+    # The loop kept running while the executor shut down
+    assert len(ticks) > 10
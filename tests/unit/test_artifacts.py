@@ -0,0 +1,72 @@
+import os
+import threading
+
+import fsspec
+import pytest
+
+from darknet.py.artifacts import ArtifactCache
+
+
+@pytest.fixture
+def memory_files():
+    fs = fsspec.filesystem("memory")
+    files = {
+        f"memory://artifacts/{name}": os.urandom(size)
+        for name, size in [("a", 100), ("b", 200), ("c", 300)]
+    }
+    files["memory://artifacts/a-copy"] = files["memory://artifacts/a"]
+    for url, contents in files.items():
+        with fs.open(url, "wb") as f:
+            f.write(contents)
+    yield files
+    fs.rm("/artifacts", recursive=True)
+
+
+def test_artifact_cache_hits_and_misses(tmp_path, memory_files):
+    cache = ArtifactCache(str(tmp_path))
+    for url in ["memory://artifacts/a", "memory://artifacts/a", "memory://artifacts/a-copy"]:
+        with cache.open(url) as f:
+            assert f.read() == memory_files[url]
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["fetched_bytes"]) == (1, 2, 200)
+    # The copy has the same contents, and the same blob
+    assert stats["bytes"] == 100
+    assert os.listdir(tmp_path / "blobs") == [os.path.basename(f.name)]
+
+
+def test_artifact_cache_evicts_the_least_recently_used(tmp_path, memory_files):
+    cache = ArtifactCache(str(tmp_path), max_bytes=500)
+    a, b = cache.fetch("memory://artifacts/a"), cache.fetch("memory://artifacts/b")
+    for ref in os.listdir(tmp_path / "refs"):
+        os.utime(tmp_path / "refs" / ref, (1, 1))
+    cache.fetch("memory://artifacts/a")
+
+    # b is the least recently used, a is open
+    with cache.open("memory://artifacts/a"):
+        c = cache.fetch("memory://artifacts/c")
+    assert os.path.exists(a) and os.path.exists(c) and not os.path.exists(b)
+    assert cache.stats()["evicted_bytes"] == 200
+
+    # Every blob is open, the cache goes over its budget instead
+    with cache.open("memory://artifacts/a"), cache.open("memory://artifacts/c"):
+        cache.fetch("memory://artifacts/b")
+    assert cache.stats()["bytes"] == 600
+
+
+def test_artifact_cache_fetches_once(tmp_path, memory_files, mocker):
+    cache = ArtifactCache(str(tmp_path))
+    download_spy = mocker.spy(cache, "_download")
+    barrier = threading.Barrier(4)
+
+    def fetch():
+        barrier.wait()
+        return cache.fetch("memory://artifacts/c")
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert download_spy.call_count == 1
+    assert cache.stats()["hits"] == 3
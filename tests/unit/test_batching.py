@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from darknet.py.batching import BatchScheduler
+from darknet.py.detections import DETECTION_DTYPE
+
+
+def test_batch_scheduler_groups_requests(fake_network):
+    network = fake_network(batch_size=4)
+    images = [Image.new("RGB", (16, 8), (i * 50, 0, 0)) for i in range(5)]
+    with BatchScheduler(network, max_wait=0.25) as scheduler:
+        futures = [scheduler.submit(image) for image in images]
+        detections = [future.result(timeout=5) for future in futures]
+
+    assert network.batches == [4, 1]
+    for i, frame_detections in enumerate(detections):
+        ((class_id, prob, bbox),) = frame_detections
+        assert prob == pytest.approx(i * 50 / 255)
+        assert bbox == pytest.approx((8, 4, 16, 8))
+
+
+def test_batch_scheduler_flushes_on_deadline(fake_network):
+    network = fake_network()
+    with BatchScheduler(network, max_wait=0.01, as_array=True) as scheduler:
+        detections = scheduler.detect(Image.new("RGB", (8, 8)), timeout=5)
+    assert network.batches == [1]
+    assert detections.dtype == DETECTION_DTYPE
+
+
+def test_batch_scheduler_isolates_bad_images(fake_network):
+    network = fake_network()
+    with BatchScheduler(network, max_wait=0.25) as scheduler:
+        good, bad = scheduler.submit(Image.new("RGB", (8, 8))), scheduler.submit(b"not an image")
+        assert len(good.result(timeout=5)) == 1
+        with pytest.raises(Exception):
+            bad.result(timeout=5)
+
+
+def test_batch_scheduler_rejects_managed_arguments(fake_network):
+    with pytest.raises(TypeError):
+        BatchScheduler(fake_network(), letterbox=1)
+
+
+def test_batch_scheduler_close_resolves_concurrent_submits(fake_network):
+    scheduler = BatchScheduler(fake_network(), max_wait=0.001)
+    futures, stop = [], threading.Event()
+
+    def submit():
+        while not stop.is_set():
+            try:
+                futures.append(scheduler.submit(Image.new("RGB", (8, 8))))
+            except RuntimeError:
+                return
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    scheduler.close()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Every queued request was processed, none was left behind the sentinel
+    assert futures and all(len(future.result(timeout=5)) == 1 for future in futures)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(Image.new("RGB", (8, 8)))
+
+
+def test_batch_scheduler_fails_requests_on_postprocessing_errors(mocker, fake_network):
+    network = fake_network()
+    mocker.patch("darknet.py.batching.split_frames", side_effect=ValueError("bad output"))
+    with BatchScheduler(network, max_wait=0.25) as scheduler:
+        futures = [scheduler.submit(Image.new("RGB", (8, 8))) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError, match="bad output"):
+                future.result(timeout=5)
+        # The scheduler still runs
+        mocker.stopall()
+        assert len(scheduler.detect(Image.new("RGB", (8, 8)), timeout=5)) == 1
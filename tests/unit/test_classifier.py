@@ -0,0 +1,24 @@
+import numpy as np
+
+from darknet.py.classifier import top_k, top_k_batch
+
+LABELS = ["a", "b", "c", "d"]
+
+
+def test_top_k_batch():
+    probabilities = np.array([[0.1, 0.4, 0.3, 0.2], [0.7, 0.05, 0.05, 0.2]], dtype=np.float32)
+    rv = top_k_batch(LABELS, probabilities, 2)
+    assert [[label for label, _ in row] for row in rv] == [["b", "c"], ["a", "d"]]
+
+    rv = top_k_batch(LABELS, probabilities, 4, min_confidence=0.25)
+    assert [[label for label, _ in row] for row in rv] == [["b", "c"], ["a"]]
+
+    # A non-positive top keeps every label, in labels order
+    rv = top_k_batch(LABELS, probabilities, -1)
+    assert [label for label, _ in rv[1]] == LABELS
+
+
+def test_top_k():
+    rv = top_k(LABELS, np.array([0.1, 0.4, 0.3, 0.2]), 3)
+    assert [label for label, _ in rv] == ["b", "c", "d"]
+    assert rv[0][1] == np.float32(0.4)
@@ -0,0 +1,39 @@
+import numpy as np
+
+from darknet.py.detections import (
+    DETECTION_DTYPE,
+    detections_to_tuples,
+    sort_detections,
+    split_frames,
+)
+
+
+def make_detections(rows):
+    detections = np.zeros(len(rows), dtype=DETECTION_DTYPE)
+    for i, (frame_index, class_id, prob) in enumerate(rows):
+        detections[i] = (class_id, prob, i, i, 1, 1, 1, frame_index)
+    return detections
+
+
+def test_sort_detections_by_frame_and_prob():
+    detections = make_detections([(1, 0, 0.5), (0, 1, 0.25), (0, 2, 0.75), (1, 3, 0.5)])
+    detections = sort_detections(detections)
+    assert detections["frame_index"].tolist() == [0, 0, 1, 1]
+    assert detections["class_id"].tolist() == [2, 1, 0, 3]
+
+
+def test_sort_detections_top_k_per_frame():
+    detections = make_detections([(0, 0, 0.1), (0, 1, 0.9), (0, 2, 0.5), (1, 3, 0.2)])
+    detections = sort_detections(detections, top_k=2)
+    assert detections["class_id"].tolist() == [1, 2, 3]
+
+
+def test_split_frames():
+    detections = sort_detections(make_detections([(0, 0, 0.1), (2, 1, 0.9), (2, 2, 0.5)]))
+    frames = split_frames(detections, 4)
+    assert [len(frame) for frame in frames] == [1, 0, 2, 0]
+
+
+def test_detections_to_tuples():
+    detections = make_detections([(0, 7, 0.5)])
+    assert detections_to_tuples(detections) == [(7, 0.5, (0.0, 0.0, 1.0, 1.0))]
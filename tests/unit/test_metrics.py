@@ -0,0 +1,96 @@
+import json
+import subprocess
+import sys
+import urllib.request
+
+import numpy as np
+import pytest
+
+from darknet.py import metrics
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.enable(False)
+    metrics.reset()
+
+
+def test_disabled_timer_records_nothing():
+    metrics.reset()
+    metrics.enable(False)
+    with metrics.timer("decode", "yolo"):
+        pass
+    assert metrics.snapshot() == {}
+
+
+def test_timer_histograms(enabled, mocker):
+    mocker.patch("time.perf_counter", side_effect=[0.0, 0.003, 1.0, 3.0])
+    with metrics.timer("decode", "yolo"):
+        pass
+    with metrics.timer("decode", "yolo"):
+        pass
+
+    value = metrics.snapshot()["decode|yolo"]
+    assert (value["count"], value["sum"]) == (2, 2.003)
+    assert value["buckets"][metrics.BUCKETS.index(0.005)] == 1
+    assert value["buckets"][metrics.BUCKETS.index(2.5)] == 1
+
+    text = metrics.to_prometheus()
+    assert "# TYPE darknet_stage_seconds histogram" in text
+    assert 'darknet_stage_seconds_bucket{stage="decode",model="yolo",le="0.0025"} 0' in text
+    assert 'darknet_stage_seconds_bucket{stage="decode",model="yolo",le="0.005"} 1' in text
+    assert 'darknet_stage_seconds_bucket{stage="decode",model="yolo",le="+Inf"} 2' in text
+    assert 'darknet_stage_seconds_count{stage="decode",model="yolo"} 2' in text
+
+
+def test_merge_snapshots(enabled, tmp_path):
+    metrics.observe("predict", 0.01, "yolo")
+    (tmp_path / "1.json").write_text(json.dumps(metrics.snapshot()))
+    (tmp_path / "2.json").write_text(json.dumps(metrics.snapshot()))
+    assert metrics.read_snapshots(str(tmp_path))["predict|yolo"]["count"] == 2
+
+
+def test_exported_snapshot_is_removed_at_exit(tmp_path):
+    code = (
+        "import os, sys, time\n"
+        "from darknet.py import metrics\n"
+        "metrics.export_snapshots(sys.argv[1], interval=0.01)\n"
+        "while not os.listdir(sys.argv[1]):\n"
+        "    time.sleep(0.01)\n"
+    )
+    subprocess.run([sys.executable, "-c", code, str(tmp_path)], check=True, timeout=30)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_serve(enabled):
+    metrics.observe("encode", 0.001)
+    server = metrics.serve(0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == metrics.PROMETHEUS_CONTENT_TYPE
+            assert 'stage="encode",model=""' in response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_one_observation_per_stage_and_detect(enabled, tmp_path, batch):
+    from darknet.py import synthetic
+    from darknet.py.network import Network
+
+    config, weights, _ = synthetic.make_network(str(tmp_path), "detector", width=32, height=32)
+    network = Network.open(config, weights, batch_size=2)
+    frames = np.zeros((2, 3, 32, 32), dtype=np.float32)
+    if batch:
+        network.detect_batch(frames.ravel(), nms_type="sort")
+    else:
+        network.predict_image(frames[0])
+        network.detect(nms_type="sort")
+    snapshot = metrics.snapshot()
+    for stage in ("convert", "nms", "tuples"):
+        assert snapshot[f"{stage}|{network.name}"]["count"] == 1
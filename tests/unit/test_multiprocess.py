@@ -0,0 +1,108 @@
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from darknet.py import synthetic
+from darknet.py.multiprocess import ProcessImageClassifier
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "SIGSTOP"), reason="needs SIGSTOP")
+
+
+@pytest.fixture
+def classifier_files(tmp_path):
+    return synthetic.make_network(str(tmp_path), "classifier", width=32, height=32)
+
+
+@pytest.fixture
+def engine(classifier_files):
+    config, weights, _ = classifier_files
+    engine = ProcessImageClassifier(
+        None, config, weights, num_workers=1, max_retries=1, max_restarts=1, monitor_interval=0.05
+    )
+    yield engine
+    engine.close()
+
+
+def _image():
+    return np.full((32, 32, 3), 128, dtype=np.uint8)
+
+
+def _next_worker(engine, process, timeout=30.0):
+    """The process that replaces a worker process, stopped before it gets ready."""
+    deadline = time.monotonic() + timeout
+    while engine._workers[0] is process:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    rv = engine._workers[0]
+    os.kill(rv.pid, signal.SIGSTOP)
+    return rv
+
+
+def _kill(process):
+    process.kill()
+    process.join(5)
+
+
+def test_classify(engine):
+    predictions = engine.classify(_image())
+    assert len(predictions) == engine.output_size
+    assert engine.submit(_image(), top=1).result(timeout=30) == engine.classify(_image(), 1)
+
+
+def test_killed_worker_frame_is_retried(engine):
+    expected = engine.classify(_image())
+    worker = engine._workers[0]
+    os.kill(worker.pid, signal.SIGSTOP)
+    future = engine.submit(_image())
+    _kill(worker)
+    assert future.result(timeout=30) == expected
+    assert engine._restarts == [0]
+
+
+def test_killed_worker_frame_fails_after_max_retries(engine):
+    worker = engine._workers[0]
+    os.kill(worker.pid, signal.SIGSTOP)
+    future = engine.submit(_image())
+    _kill(worker)
+    # The retry dies too, before its worker gets ready
+    _kill(_next_worker(engine, worker))
+    with pytest.raises(RuntimeError, match="darknet worker 0"):
+        future.result(timeout=30)
+
+
+def test_worker_is_given_up_after_max_restarts(engine):
+    worker = engine._workers[0]
+    _kill(worker)
+    _kill(_next_worker(engine, worker))
+    deadline = time.monotonic() + 30
+    while engine._restarts[0] is not None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    with pytest.raises(RuntimeError, match="gave up"):
+        engine.submit(_image())
+
+
+def test_close(engine):
+    worker = engine._workers[0]
+    os.kill(worker.pid, signal.SIGSTOP)
+    pending = [engine.submit(_image()) for _ in range(engine.num_slots)]
+    # No free slot left, the submit waits until the engine closes
+    with ThreadPoolExecutor(1) as executor:
+        waiting = executor.submit(engine.submit, _image())
+        time.sleep(0.2)
+        assert not waiting.done()
+        engine.close(timeout=0.1)
+        with pytest.raises(RuntimeError, match="closed"):
+            waiting.result(timeout=5)
+    _kill(worker)
+
+    for future in pending:
+        with pytest.raises(RuntimeError, match="closed"):
+            future.result(timeout=5)
+    with pytest.raises(RuntimeError, match="closed"):
+        engine.submit(_image())
+    assert engine._shm is None
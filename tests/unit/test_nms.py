@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from darknet.py.detections import DETECTION_DTYPE
+from darknet.py.nms import DEFAULT_PRE_NMS_TOP_K, non_max_suppression
+
+
+def make_detections(rows):
+    """Rows of (frame_index, class_id, prob, x, y, w, h)."""
+    return np.array(
+        [(class_id, prob, x, y, w, h, 1, frame) for frame, class_id, prob, x, y, w, h in rows],
+        dtype=DETECTION_DTYPE,
+    )
+
+
+@pytest.fixture
+def detections():
+    return make_detections(
+        [
+            (0, 0, 0.9, 10, 10, 10, 10),
+            (0, 0, 0.8, 11, 11, 10, 10),  # overlaps the first one
+            (0, 1, 0.7, 11, 11, 10, 10),  # same box, another class
+            (0, 0, 0.6, 50, 50, 10, 10),
+            (1, 0, 0.5, 11, 11, 10, 10),  # same box, another frame
+        ]
+    )
+
+
+@pytest.mark.parametrize("nms_type", ["greedy", "diou"])
+def test_suppression_is_per_frame_and_class(detections, nms_type):
+    kept = non_max_suppression(detections, 0.45, nms_type)
+    assert kept["prob"].tolist() == pytest.approx([0.9, 0.7, 0.6, 0.5])
+    assert kept["frame_index"].tolist() == [0, 0, 0, 1]
+
+
+def test_soft_nms_decays_overlaps(detections):
+    kept = non_max_suppression(detections, 0.45, "soft")
+    assert len(kept) == len(detections)
+    assert kept["prob"][:3].tolist() == pytest.approx([0.9, 0.7, 0.6])
+    assert 0.001 < kept["prob"][3] < 0.8
+
+
+def test_pre_nms_and_top_k(detections):
+    assert len(non_max_suppression(detections, 0.45, pre_nms_top_k=1)) == 2
+    assert len(non_max_suppression(detections, 0, top_k=2)) == 3
+
+
+def test_pre_nms_top_k_is_on_by_default():
+    n = DEFAULT_PRE_NMS_TOP_K + 1
+    # Disjoint boxes, the worst case of the suppression keeps every one
+    detections = make_detections([(0, 0, 1 - i / (2 * n), 20 * i, 0, 10, 10) for i in range(n)])
+    assert len(non_max_suppression(detections, 0.45, "soft")) == DEFAULT_PRE_NMS_TOP_K
+    assert len(non_max_suppression(detections, 0.45, "soft", pre_nms_top_k=-1)) == n
+
+
+def test_matches_naive_greedy_nms():
+    rng = np.random.RandomState(0)
+    n = 300
+    rows = zip(
+        rng.randint(0, 3, n),
+        rng.randint(0, 4, n),
+        rng.rand(n),
+        rng.rand(n) * 100,
+        rng.rand(n) * 100,
+        rng.rand(n) * 30 + 1,
+        rng.rand(n) * 30 + 1,
+    )
+    detections = make_detections(list(rows))
+
+    def iou(a, b):
+        w = min(a["x"] + a["w"] / 2, b["x"] + b["w"] / 2) - max(
+            a["x"] - a["w"] / 2, b["x"] - b["w"] / 2
+        )
+        h = min(a["y"] + a["h"] / 2, b["y"] + b["h"] / 2) - max(
+            a["y"] - a["h"] / 2, b["y"] - b["h"] / 2
+        )
+        inter = max(w, 0) * max(h, 0)
+        return inter / (a["w"] * a["h"] + b["w"] * b["h"] - inter)
+
+    expected = []
+    for detection in sorted(detections, key=lambda d: -d["prob"]):
+        group = detection["frame_index"], detection["class_id"]
+        kept = [k for k in expected if (k["frame_index"], k["class_id"]) == group]
+        if all(iou(k, detection) <= 0.45 for k in kept):
+            expected.append(detection)
+
+    kept = non_max_suppression(detections, 0.45)
+    assert sorted(kept["prob"].tolist()) == sorted(float(d["prob"]) for d in expected)
+
+
+def test_unknown_nms_type(detections):
+    with pytest.raises(ValueError):
+        non_max_suppression(detections, nms_type="fast")
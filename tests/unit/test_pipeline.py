@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from darknet.py.detections import DETECTION_DTYPE
+from darknet.py.pipeline import DetectionPipeline
+
+
+def test_pipeline_yields_in_order(fake_network):
+    network = fake_network(box=(8, 8))
+    frames = (Image.new("RGB", (16, 16), (i, 0, 0)) for i in range(20))
+    pipeline = DetectionPipeline(network, labels=["person"], decode_workers=4)
+
+    detections = list(pipeline.run(frames))
+    assert [dets[0][1] for dets in detections] == pytest.approx([i / 255 for i in range(20)])
+    assert all(dets[0][0] == "person" and dets[0][2] == (8, 8, 16, 16) for dets in detections)
+    assert sum(network.batches) == 20
+    assert max(network.batches) <= network.batch_size
+    assert set(pipeline.queue_depths()) == {"preprocess", "infer", "postprocess", "output"}
+
+
+def test_pipeline_propagates_errors(fake_network):
+    pipeline = DetectionPipeline(fake_network())
+    # The decode stage's own exception, raised in the caller's thread
+    with pytest.raises(UnidentifiedImageError, match="cannot identify image file"):
+        list(pipeline.run([Image.new("RGB", (8, 8)), b"not an image"]))
+
+
+def test_pipeline_can_stop_early(fake_network):
+    pipeline = DetectionPipeline(fake_network(), as_array=True)
+    frames = (np.zeros((8, 8, 3), dtype=np.uint8) for _ in range(1000))
+    for i, detections in enumerate(pipeline.run(frames)):
+        assert detections.dtype == DETECTION_DTYPE
+        if i == 5:
+            break
@@ -0,0 +1,71 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import darknet.py.pool as darknet_pool
+
+
+class FakeNetwork(object):
+    def __init__(self, config_file, weights_file, batch_size):
+        self.name = os.path.splitext(os.path.basename(config_file))[0]
+        self.batch_size = batch_size
+        self.shape = (4, 4)
+        self.output = np.zeros(2, dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def predict_image(self, image):
+        # Fails if two threads ever share the same network
+        assert self.lock.acquire(blocking=False)
+        self.output[:] = image.mean()
+        self.lock.release()
+        return self.output
+
+    def detect(self, **kwargs):
+        return [(0, float(self.output[0]), (0, 0, 1, 1))]
+
+
+@pytest.fixture
+def pool(mocker, tmp_path):
+    mocker.patch.object(darknet_pool, "Network", FakeNetwork)
+    config, weights = tmp_path / "net.cfg", tmp_path / "net.weights"
+    config.write_text("")
+    weights.write_bytes(b"")
+    return darknet_pool.NetworkPool(f"file://{config}", f"file://{weights}", size=3)
+
+
+def test_network_pool_size(pool):
+    assert len(pool) == 3
+    assert len({id(network) for network in pool.networks}) == 3
+
+
+def test_network_pool_outputs_are_copies(pool):
+    with ThreadPoolExecutor(8) as executor:
+        images = [np.full((3, 4, 4), i, dtype=np.float32) for i in range(32)]
+        outputs = list(executor.map(pool.predict_image, images))
+        detections = list(executor.map(pool.detect_image, images))
+    assert [output[0] for output in outputs] == list(range(32))
+    assert [dets[0][1] for dets in detections] == list(range(32))
+
+
+def test_network_pool_checkout_timeout(pool):
+    with pool.checkout(), pool.checkout(), pool.checkout():
+        with pytest.raises(TimeoutError):
+            with pool.checkout(timeout=0.01):
+                pass
+
+
+def test_network_pool_names_networks_after_the_url(mocker):
+    @contextmanager
+    def cache_open(urlpath, mode):
+        # The artifact cache names its files after their sha256
+        yield SimpleNamespace(name="/cache/blobs/0123abcd")
+
+    mocker.patch.object(darknet_pool, "Network", FakeNetwork)
+    mocker.patch.object(darknet_pool, "fsspec_cache_open", cache_open)
+    pool = darknet_pool.NetworkPool("s3://models/yolov4.cfg", "s3://models/yolov4.weights", 2)
+    assert [network.name for network in pool.networks] == ["yolov4", "yolov4"]
@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from darknet.py.preprocess import Letterbox, LetterboxPreprocessor, letterbox, open_image
+from darknet.py.util import image_to_3darray
+
+
+def test_letterbox_scales_and_centers():
+    frame = np.full((3, 8, 8), -1, dtype=np.float32)
+    box = letterbox(Image.new("RGB", (16, 8), (255, 0, 0)), frame)
+
+    assert box == Letterbox((16, 8), 0.5, (0, 2))
+    assert (frame[:, 0:2] == 0).all() and (frame[:, 6:] == 0).all()
+    assert (frame[0, 2:6] == 1).all() and (frame[1:, 2:6] == 0).all()
+
+
+def test_letterbox_ndarray_at_network_shape():
+    frame = np.empty((3, 4, 6), dtype=np.float32)
+    pixels = np.arange(4 * 6 * 3, dtype=np.uint8).reshape((4, 6, 3))
+    box = letterbox(pixels, frame)
+
+    assert box == Letterbox((6, 4), 1.0, (0, 0))
+    np.testing.assert_array_equal(frame, pixels.transpose((2, 0, 1)).astype(np.float32) / 255)
+
+
+def test_letterbox_to_frame_roundtrip():
+    box = Letterbox((640, 480), 0.65, (0, 52))
+    np.testing.assert_allclose(box.to_frame(*box.to_network(320, 240, 64, 32)), (320, 240, 64, 32))
+
+
+def test_open_image_decodes_jpeg_drafts():
+    with io.BytesIO() as f:
+        Image.new("RGB", (1600, 1200), (255, 0, 0)).save(f, format="JPEG")
+        data = f.getvalue()
+
+    image, frame_size = open_image(data, (416, 416))
+    assert frame_size == (1600, 1200)
+    assert image.size == (800, 600)
+
+    frame = np.zeros((3, 416, 416), dtype=np.float32)
+    box = letterbox(image, frame).scaled_to(frame_size)
+    assert box.frame_size == (1600, 1200)
+    assert box.to_frame(208, 208, 416, 312) == pytest.approx((800, 600, 1600, 1200), abs=1)
+
+
+def test_preprocessor_reuses_buffer():
+    images = [Image.new("RGB", (32, 16)), Image.new("RGB", (16, 32)), Image.new("L", (8, 8))]
+    with LetterboxPreprocessor((8, 8), batch_size=4, max_workers=2) as preprocessor:
+        frames, boxes = preprocessor(images)
+        assert frames.shape == (3, 3, 8, 8)
+        assert np.shares_memory(frames, preprocessor.buffer)
+        assert [box.frame_size for box in boxes] == [(32, 16), (16, 32), (8, 8)]
+
+        with pytest.raises(ValueError):
+            preprocessor(images * 2)
+
+
+def test_image_to_3darray():
+    image, frame_size = image_to_3darray(Image.new("RGB", (20, 10)), (10, 10))
+    assert image.shape == (3, 10, 10)
+    assert image.dtype == np.float32
+    assert frame_size == (20, 10)
@@ -2,9 +2,17 @@
 
 """Tests for `darknet.py` package."""
 
+import json
+import os
+import sys
+
+import fsspec
+import numpy as np
 import pytest
 from click.testing import CliRunner
-from darknet.py import cli
+from PIL import Image
+
+from darknet.py import cli, synthetic
 
 
 @pytest.fixture
@@ -26,9 +34,128 @@ def test_content(response):
 def test_command_line_interface():
     """Test the CLI."""
     runner = CliRunner()
-    result = runner.invoke(cli.py)
-    assert result.exit_code == 0
-    assert "Replace this message" in result.output
     help_result = runner.invoke(cli.py, ["--help"])
     assert help_result.exit_code == 0
     assert "--help  Show this message and exit." in help_result.output
+    assert "detect" in help_result.output
+    assert "classify" in help_result.output
+
+
+@pytest.fixture
+def classifier_files(tmp_path):
+    config, weights, labels = synthetic.make_network(str(tmp_path / "net"), "classifier")
+    names = tmp_path / "net" / "names.txt"
+    names.write_text("\n".join(labels) + "\n")
+    for i in range(5):
+        path = tmp_path / "images" / f"{i}.png"
+        path.parent.mkdir(exist_ok=True)
+        Image.fromarray(np.full((32, 48, 3), 50 * i, dtype=np.uint8)).save(path)
+    return ["-c", config, "-w", weights, "-l", str(names), str(tmp_path / "images")]
+
+
+def test_classify_jsonlines(classifier_files, tmp_path):
+    pytest.importorskip("pandas")
+    output = tmp_path / "out.jsonl"
+    args = ["classify", "--top", "2", "--chunk-size", "2", "-b", "2", "-o", str(output)]
+    result = CliRunner().invoke(cli.py, args + classifier_files)
+    assert result.exit_code == 0, result.output
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(rows) == 10
+    assert [row["urlpath"].rsplit("/", 1)[1] for row in rows[::2]] == [f"{i}.png" for i in range(5)]
+    assert json.loads((tmp_path / "out.jsonl.checkpoint").read_text())["done"] == 5
+
+
+def test_classify_resumes_from_the_checkpoint(classifier_files, tmp_path, mocker):
+    pytest.importorskip("pandas")
+    from darknet.py import scoring
+
+    output = tmp_path / "out.jsonl"
+    args = ["classify", "--top", "1", "--chunk-size", "2", "-o", str(output)]
+    score_images = scoring.score_images
+    calls = []
+
+    def fail_on_the_second_chunk(urlpaths, **kwargs):
+        calls.append(len(urlpaths))
+        if len(calls) == 2:
+            # A crash after part of the chunk was written
+            with open(output, "a") as f:
+                f.write('{"partial"')
+            raise RuntimeError("crash")
+        return score_images(urlpaths, **kwargs)
+
+    mocker.patch.object(scoring, "score_images", side_effect=fail_on_the_second_chunk)
+    result = CliRunner().invoke(cli.py, args + classifier_files)
+    assert isinstance(result.exception, RuntimeError)
+
+    scoring.score_images.side_effect = score_images
+    result = CliRunner().invoke(cli.py, args + ["--resume"] + classifier_files)
+    assert result.exit_code == 0, result.output
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(rows) == 5
+    assert scoring.score_images.call_count == 4
+
+
+def test_resume_without_the_output_starts_over(classifier_files, tmp_path):
+    pytest.importorskip("pandas")
+    output = tmp_path / "out.jsonl"
+    args = ["classify", "--top", "1", "--chunk-size", "2", "-o", str(output)]
+    assert CliRunner().invoke(cli.py, args + classifier_files).exit_code == 0
+    output.unlink()
+
+    result = CliRunner().invoke(cli.py, args + ["--resume"] + classifier_files)
+    assert result.exit_code == 0, result.output
+    assert len(output.read_text().splitlines()) == 5
+    assert json.loads((tmp_path / "out.jsonl.checkpoint").read_text())["done"] == 5
+
+
+def test_detect_parquet(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    config, weights, _ = synthetic.make_network(str(tmp_path / "net"), "detector")
+    for i in range(3):
+        Image.fromarray(np.zeros((64, 64, 3), dtype=np.uint8)).save(tmp_path / f"{i}.jpg")
+
+    output = tmp_path / "out.parquet"
+    args = ["detect", "-c", config, "-w", weights, "--chunk-size", "2", "--threshold", "0.01"]
+    args += ["-j", "2", "-o", str(output), str(tmp_path / "*.jpg")]
+    result = CliRunner().invoke(cli.py, args)
+    assert result.exit_code == 0, result.output
+    assert sorted(os.listdir(output)) == ["part-00000.parquet", "part-00001.parquet"]
+    assert pd.read_parquet(output)["urlpath"].nunique() == 3
+
+
+def test_bench_synthetic_classifier(tmp_path):
+    output = tmp_path / "bench.json"
+    args = ["bench", "--synthetic", "classifier", "--batch-sizes", "1,2", "--resolutions", "32x32"]
+    args += ["--iterations", "3", "--warmup", "1", "--mode", "image", "--json", str(output)]
+    result = CliRunner().invoke(cli.py, args)
+    assert result.exit_code == 0, result.output
+    assert "images/s" in result.output
+
+    results = json.loads(output.read_text())
+    assert [r["batch_size"] for r in results] == [1, 2]
+    assert all(r["resolution"] == "32x32" and r["images"] == 3 * r["batch_size"] for r in results)
+    assert all(r["p50_ms"] <= r["p99_ms"] and r["peak_rss_mb"] > 0 for r in results)
+
+
+def test_local_file_of_a_chained_url(tmp_path):
+    (tmp_path / "yolov3.cfg").write_text("[net]\n")
+    (tmp_path / "yolov3.weights").write_bytes(b"\0" * 16)
+    directory = tmp_path / "local"
+    directory.mkdir()
+    files = [
+        cli._local_file(f"filecache::file://{tmp_path / name}", str(directory), fsspec.open)
+        for name in ("yolov3.cfg", "yolov3.weights")
+    ]
+    assert [os.path.basename(f) for f in files] == ["yolov3.cfg", "yolov3.weights"]
+    assert open(files[0]).read() == "[net]\n"
+
+
+def test_scoring_without_pandas(classifier_files, tmp_path, mocker):
+    mocker.patch.dict(sys.modules, {"pandas": None})
+    sys.modules.pop("darknet.py.scoring", None)
+    args = ["classify", "-o", str(tmp_path / "out.jsonl")]
+    result = CliRunner().invoke(cli.py, args + classifier_files)
+    assert result.exit_code == 1
+    assert "Scoring needs pandas" in result.output
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from darknet.py import ImageDetector, ResolutionNetworks, synthetic
+
+
+@pytest.fixture
+def detector_files(tmp_path):
+    config, weights, labels = synthetic.make_network(str(tmp_path), "detector", width=64, height=64)
+    return config, weights, labels
+
+
+def test_networks_are_built_once_per_resolution(detector_files):
+    config, weights, _ = detector_files
+    networks = ResolutionNetworks(config, weights, resolutions=[(32, 32), (96, 96)])
+    assert networks.get().shape == (64, 64)
+    assert networks.resolutions == [(32, 32), (64, 64), (96, 96)]
+
+    network = networks.get((32, 32))
+    assert network.shape == (32, 32)
+    assert networks.get([32, 32]) is network
+    assert networks.get((64, 64)) is networks.default
+    assert len(networks._networks) == 2
+
+
+def test_for_budget(detector_files):
+    config, weights, _ = detector_files
+    networks = ResolutionNetworks(config, weights, resolutions=[(32, 32), (128, 128)])
+    # Nothing observed yet, the smallest resolution
+    assert networks.for_budget(1.0) == (32, 32)
+
+    networks.observe((64, 64), 0.1)
+    assert networks.estimate((32, 32)) == pytest.approx(0.025)
+    assert networks.estimate((128, 128)) == pytest.approx(0.4)
+    assert networks.for_budget(0.2) == (64, 64)
+    assert networks.for_budget(0.5) == (128, 128)
+    assert networks.for_budget(0.01) == (32, 32)
+
+
+def test_image_detector_resolutions(detector_files):
+    config, weights, labels = detector_files
+    detector = ImageDetector(labels, config, weights, resolutions=[(32, 32)])
+    image = np.zeros((48, 80, 3), dtype=np.uint8)
+
+    detections = detector.detect(image, resolution=(32, 32), threshold=0.1)
+    assert detector._last_network.shape == (32, 32)
+    assert detections and all(label in labels for label, _, _ in detections)
+
+    detector.detect(image, latency_budget=0.0)
+    assert detector._last_network.shape == (32, 32)
+    detector.detect(image)
+    assert detector._last_network is detector.network
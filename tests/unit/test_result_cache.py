@@ -0,0 +1,121 @@
+from typing import NamedTuple
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from darknet.py import ImageClassifier, ImageDetector, metrics, synthetic
+from darknet.py.result_cache import ResultCache, image_digest
+
+
+def test_lru_entries_budget():
+    cache = ResultCache(max_entries=2, max_bytes=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # b was the least recently used
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (3, 1, 1, 2)
+    assert stats["hit_rate"] == 0.75
+
+
+def test_bytes_budget_and_copies():
+    cache = ResultCache(max_entries=0, max_bytes=100)
+    value = np.zeros(10, dtype=np.float32)
+    cache.put("a", value)
+    value[0] = 1
+    rv = cache.get("a")
+    assert rv[0] == 0
+    rv[1] = 1
+    assert cache.get("a")[1] == 0
+
+    cache.put("b", np.zeros(16, dtype=np.float32))
+    assert cache.get("a") is None and cache.stats()["bytes"] == 64
+    # Larger than the whole budget, not cached
+    cache.put("c", np.zeros(30, dtype=np.float32))
+    assert cache.get("c") is None and len(cache) == 1
+
+
+def test_named_tuples_are_copied():
+    class Result(NamedTuple):
+        array: np.ndarray
+        labels: list
+
+    cache = ResultCache()
+    cache.put("a", Result(np.zeros(2), ["a"]))
+    rv = cache.get("a")
+    assert isinstance(rv, Result)
+    rv.array[0] = 1
+    rv.labels.append("b")
+    assert cache.get("a").array[0] == 0 and cache.get("a").labels == ["a"]
+
+
+def test_ttl(mocker):
+    monotonic = mocker.patch("darknet.py.result_cache.time.monotonic", return_value=100.0)
+    cache = ResultCache(ttl=10)
+    cache.put("a", [1])
+    monotonic.return_value = 109.0
+    assert cache.get("a") == [1]
+    monotonic.return_value = 110.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_hit_metrics():
+    metrics.enable()
+    metrics.reset()
+    try:
+        cache = ResultCache()
+        cache.get("a", "yolo")
+        cache.put("a", 1)
+        cache.get("a", "yolo")
+        snap = metrics.snapshot()
+        assert snap["cache_hit|yolo"]["count"] == snap["cache_miss|yolo"]["count"] == 1
+    finally:
+        metrics.enable(False)
+        metrics.reset()
+
+
+def test_keys_and_digests():
+    pixels = np.zeros((4, 4, 3), dtype=np.uint8)
+    assert image_digest(pixels) == image_digest(pixels.copy())
+    assert image_digest(pixels) != image_digest(pixels.reshape((4, 12)))
+    assert image_digest(Image.fromarray(pixels)) != image_digest(Image.fromarray(pixels[:2]))
+    assert image_digest(b"abc") == image_digest(bytearray(b"abc"))
+    assert image_digest("image.jpg") is None
+
+    digest = image_digest(b"abc")
+    assert ResultCache.key(digest, "cfg", threshold=0.5, nms_type="sort") == ResultCache.key(
+        digest, "cfg", nms_type="sort", threshold=0.5
+    )
+    assert ResultCache.key(digest, "cfg", threshold=0.5) != ResultCache.key(
+        digest, "cfg", threshold=0.6
+    )
+
+
+@pytest.mark.parametrize(
+    "kind, params",
+    [
+        ("detector", (dict(threshold=0.1), dict(threshold=0.2))),
+        ("classifier", (dict(top=3), dict(top=2))),
+    ],
+)
+def test_image_models_check_the_cache_first(tmp_path, mocker, kind, params):
+    config, weights, labels = synthetic.make_network(str(tmp_path), kind, width=32, height=32)
+    model_class = ImageDetector if kind == "detector" else ImageClassifier
+    model = model_class(labels, config, weights, result_cache=ResultCache())
+    run = model.detect if kind == "detector" else model.classify
+    image = np.full((24, 40, 3), 64, dtype=np.uint8)
+
+    first = run(image, **params[0])
+    to_3darray = mocker.patch(
+        f"darknet.py.{kind}.image_to_3darray", side_effect=AssertionError("decoded")
+    )
+    assert run(image, **params[0]) == first
+    to_3darray.assert_not_called()
+
+    # Other parameters are another result
+    with pytest.raises(AssertionError, match="decoded"):
+        run(image, **params[1])
@@ -0,0 +1,206 @@
+import base64
+import csv
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("sagemaker_inference")
+
+from darknet.py import metrics  # noqa: E402
+from darknet.py.detections import DETECTION_DTYPE  # noqa: E402
+from darknet.sagemaker.classifier.default_inference_handler import (  # noqa: E402
+    DefaultDarknetClassifierInferenceHandler,
+)
+from darknet.sagemaker.detector.default_inference_handler import (  # noqa: E402
+    DefaultDarknetDetectorInferenceHandler,
+)
+
+
+def encode_image(image):
+    with io.BytesIO() as f:
+        image.save(f, format="PNG")
+        return f.getvalue()
+
+
+@pytest.fixture
+def images():
+    return [Image.new("RGB", (16, 8), (255 * (i % 2), 0, 0)) for i in range(3)]
+
+
+def test_multipart_input(images):
+    body = b"".join(
+        b"--xyz\r\nContent-Type: image/png\r\n\r\n" + encode_image(image) + b"\r\n"
+        for image in images
+    )
+    data = DefaultDarknetDetectorInferenceHandler().default_input_fn(
+        body + b"--xyz--\r\n", "multipart/form-data; boundary=xyz"
+    )
+    assert [image.size for image in data["Images"]] == [(16, 8)] * 3
+    assert data["FrameSizes"] == [(16, 8)] * 3
+
+
+def test_jsonlines_input(images):
+    lines = [base64.b64encode(encode_image(image)).decode() for image in images]
+    body = "\n".join([json.dumps(lines[0]), json.dumps({"Bytes": lines[1]}), json.dumps(lines[2])])
+    data = DefaultDarknetDetectorInferenceHandler().default_input_fn(body, "application/jsonlines")
+    pixels = [image.getpixel((0, 0)) for image in data["Images"]]
+    assert pixels == [(0, 0, 0), (255, 0, 0), (0, 0, 0)]
+
+
+def test_rgb8_input(fake_network):
+    pixels = np.zeros((2, 4, 8, 3), dtype=np.uint8).tobytes()
+    handler = DefaultDarknetDetectorInferenceHandler()
+    data = handler.default_input_fn(
+        pixels, "application/x-image-rgb8; width=8; height=4; frame-width=16; frame-height=8"
+    )
+    assert [image.shape for image in data["Images"]] == [(4, 8, 3)] * 2
+    assert data["FrameSizes"] == [(16, 8)] * 2
+
+    rv = handler.default_predict_fn(data, (fake_network(), ["zero", "one"])).to_rekognition()
+    bbox = rv[0]["Labels"][0]["Instances"][0]["BoundingBox"]
+    assert (bbox["Width"], bbox["Height"]) == pytest.approx((16, 8))
+
+
+def test_detector_batch(images, fake_network):
+    network = fake_network()
+    handler = DefaultDarknetDetectorInferenceHandler()
+    rv = handler.default_predict_fn({"Images": images}, (network, ["zero", "one"]))
+    rv = rv.to_rekognition()
+
+    assert network.batches == [2, 1]
+    assert [result["Labels"][0]["Name"] for result in rv] == ["zero", "one", "zero"]
+    bbox = rv[0]["Labels"][0]["Instances"][0]["BoundingBox"]
+    assert (bbox["Width"], bbox["Height"]) == pytest.approx((16, 8))
+
+    single = handler.default_predict_fn({"Image": images[1]}, (network, ["zero", "one"]))
+    assert single.to_rekognition() == rv[1]
+
+
+def test_one_postprocess_observation_per_request(images, fake_network):
+    metrics.reset()
+    metrics.enable()
+    try:
+        handler = DefaultDarknetDetectorInferenceHandler()
+        handler.default_predict_fn({"Images": images}, (fake_network(), ["zero", "one"]))
+        assert metrics.snapshot()["postprocess|fake"]["count"] == 1
+    finally:
+        metrics.enable(False)
+        metrics.reset()
+
+
+def test_classifier_batch(images, fake_network):
+    network = fake_network()
+    handler = DefaultDarknetClassifierInferenceHandler()
+    rv = handler.default_predict_fn({"Images": images}, (network, ["zero", "one"]))
+    rv = rv.to_rekognition()
+    assert [result["Labels"][0]["Name"] for result in rv] == ["one", "zero", "one"]
+    assert network.batches == [2, 1]
+
+    frames = np.zeros((2, 3, 8, 8), dtype=np.float32)
+    rv = handler.default_predict_fn({"NDArray": frames}, (network, ["zero", "one"]))
+    assert rv.probabilities.shape == (2, 2)
+
+
+@pytest.mark.parametrize(
+    "handler_type",
+    [DefaultDarknetDetectorInferenceHandler, DefaultDarknetClassifierInferenceHandler],
+)
+def test_ndarray_network_inputs(handler_type, fake_network):
+    network, handler = fake_network(), handler_type()
+    frames = np.ones((1, 3, 8, 8), dtype=np.float32)
+    # The ndim of the NDArray decides, a batch of one is still a batch
+    batch = handler.default_predict_fn({"NDArray": frames}, (network, ["zero", "one"]))
+    single = handler.default_predict_fn({"NDArray": frames[0]}, (network, ["zero", "one"]))
+    assert (batch.is_batch, single.is_batch) == (True, False)
+    assert batch.num_frames == single.num_frames == 1
+    assert network.batches == [1, 1]
+
+
+@pytest.mark.parametrize("accept", ["application/x-npy", "application/x-npz", "application/json"])
+def test_detector_output_encodings(images, accept, fake_network):
+    handler = DefaultDarknetDetectorInferenceHandler()
+    prediction = handler.default_predict_fn({"Images": images}, (fake_network(), ["zero", "one"]))
+    body = handler.default_output_fn(prediction, accept)
+
+    if accept == "application/json":
+        assert json.loads(body) == prediction.to_rekognition()
+        return
+    rv = np.load(io.BytesIO(body))
+    if accept == "application/x-npz":
+        assert rv["labels"].tolist() == ["zero", "one"]
+    assert rv["frame_index"].tolist() == [0, 1, 2]
+
+
+def test_csv_output_encoding(images, fake_network):
+    detector = DefaultDarknetDetectorInferenceHandler()
+    prediction = detector.default_predict_fn({"Images": images}, (fake_network(), ["zero", "one"]))
+    rows = list(csv.reader(io.StringIO(detector.default_output_fn(prediction, "text/csv"))))
+    assert rows[0] == list(DETECTION_DTYPE.names) + ["label"]
+    assert [row[-1] for row in rows[1:]] == ["zero", "one", "zero"]
+    assert [int(row[rows[0].index("frame_index")]) for row in rows[1:]] == [0, 1, 2]
+
+    classifier = DefaultDarknetClassifierInferenceHandler()
+    prediction = classifier.default_predict_fn({"Images": images}, (fake_network(), ["a", "b"]))
+    rows = list(csv.reader(io.StringIO(classifier.default_output_fn(prediction, "text/csv"))))
+    assert rows[0] == ["a", "b"]
+    assert np.allclose(np.array(rows[1:], dtype=float), prediction.probabilities)
+
+
+def test_msgpack_output_encoding(images, fake_network):
+    msgpack = pytest.importorskip("msgpack")
+    handler = DefaultDarknetDetectorInferenceHandler()
+    prediction = handler.default_predict_fn({"Images": images}, (fake_network(), ["zero", "one"]))
+    rv = msgpack.unpackb(handler.default_output_fn(prediction, "application/x-msgpack"))
+
+    assert rv["labels"] == ["zero", "one"] and rv["num_frames"] == 3
+    assert np.frombuffer(rv["columns"]["class_id"], "<i4").tolist() == [0, 1, 0]
+
+
+def test_detector_warmup_runs_a_full_batch(fake_network):
+    network = fake_network()
+    DefaultDarknetDetectorInferenceHandler().default_warmup_fn((network, ["zero", "one"]))
+    assert network.batches == [network.batch_size]
+
+
+def test_result_cache_skips_decoding(images, mocker, fake_network):
+    from darknet.py.result_cache import ResultCache
+
+    handler = DefaultDarknetDetectorInferenceHandler()
+    handler.network_shape = fake_network.shape
+    handler.result_cache = ResultCache()
+    network = fake_network()
+    body = encode_image(images[1])
+
+    data = handler.default_input_fn(body, "image/png")
+    first = handler.default_predict_fn(data, (network, ["zero", "one"]))
+    decode_spy = mocker.spy(handler, "_decode")
+    data = handler.default_input_fn(body, "image/png")
+    assert data.keys() == {"Prediction"}
+    cached = handler.default_predict_fn(data, (network, ["zero", "one"]))
+    assert cached.detections is not first.detections
+    np.testing.assert_array_equal(cached.detections, first.detections)
+    assert cached[1:] == first[1:]
+    decode_spy.assert_not_called()
+    assert network.batches == [1]
+
+    # The same bytes with another content type are another payload
+    handler.default_input_fn(body, "image/x-png")
+    assert handler.result_cache.stats()["hits"] == 1
+
+
+def test_result_cache_skips_custom_parameters(images, fake_network):
+    from darknet.py.result_cache import ResultCache
+
+    handler = DefaultDarknetDetectorInferenceHandler()
+    handler.network_shape = fake_network.shape
+    handler.result_cache = ResultCache()
+    body = encode_image(images[1])
+
+    data = handler.default_input_fn(body, "image/png")
+    data["MinConfidence"] = 95
+    handler.default_predict_fn(data, (fake_network(), ["zero", "one"]))
+    assert len(handler.result_cache) == 0
+    assert "Prediction" not in handler.default_input_fn(body, "image/png")
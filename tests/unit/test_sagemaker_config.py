@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+pytest.importorskip("sagemaker_inference")
+
+from darknet.sagemaker.config import (  # noqa: E402
+    ServerConfig,
+    configure_environment,
+    load_config,
+    start_metrics_server,
+)
+
+
+def test_load_config(tmp_path):
+    assert load_config(str(tmp_path), {}) == ServerConfig()
+
+    (tmp_path / "darknet.json").write_text(json.dumps(dict(batch_size=4, workers_per_core=0.5)))
+    environ = {"SAGEMAKER_DARKNET_BATCH_SIZE": "8", "SAGEMAKER_DARKNET_WARMUP": "3"}
+    assert load_config(str(tmp_path), environ) == ServerConfig(0.5, 0, 8, 3)
+
+    (tmp_path / "darknet.json").write_text(json.dumps(dict(batchsize=4)))
+    with pytest.raises(ValueError):
+        load_config(str(tmp_path), {})
+
+
+def test_configure_environment(mocker):
+    mocker.patch("os.cpu_count", return_value=8)
+
+    environ = {}
+    configure_environment(ServerConfig(workers_per_core=0.25), environ)
+    assert environ == {"SAGEMAKER_MODEL_SERVER_WORKERS": "2", "OMP_NUM_THREADS": "4"}
+
+    environ = {"OMP_NUM_THREADS": "1"}
+    configure_environment(ServerConfig(threads_per_worker=2), environ)
+    assert environ == {"OMP_NUM_THREADS": "1"}
+
+    environ = {}
+    configure_environment(ServerConfig(threads_per_worker=2), environ)
+    assert environ == {"OMP_NUM_THREADS": "2"}
+
+    # Nothing configured, existing deployments keep their environment
+    environ = {}
+    configure_environment(ServerConfig(), environ)
+    assert environ == {}
+
+
+def test_configure_metrics(mocker, tmp_path):
+    mocker.patch("os.cpu_count", return_value=1)
+    mocker.patch("tempfile.mkdtemp", return_value=str(tmp_path))
+    serve_mock = mocker.patch("darknet.py.metrics.serve")
+
+    environ = {}
+    config = load_config(None, {"SAGEMAKER_DARKNET_METRICS_PORT": "9090"})
+    configure_environment(config, environ)
+    assert environ["DARKNET_PY_METRICS"] == "1"
+    assert environ["SAGEMAKER_DARKNET_METRICS_DIR"] == str(tmp_path)
+
+    start_metrics_server(config, environ)
+    serve_mock.assert_called_once_with(9090, str(tmp_path))
+    assert start_metrics_server(ServerConfig(), environ) is None
+
+
+def test_load_result_cache_config():
+    environ = {
+        "SAGEMAKER_DARKNET_RESULT_CACHE_ENTRIES": "1000",
+        "SAGEMAKER_DARKNET_RESULT_CACHE_TTL": "60",
+    }
+    config = load_config(None, environ)
+    assert (config.result_cache_entries, config.result_cache_ttl) == (1000, 60.0)
+    assert config.result_cache_bytes == 64 << 20
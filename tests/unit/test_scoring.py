@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+pd = pytest.importorskip("pandas")
+
+from darknet.py import scoring, synthetic  # noqa: E402
+
+
+@pytest.fixture
+def images(tmp_path):
+    rv = []
+    for i, size in enumerate([(64, 48), (32, 32), (48, 96)]):
+        path = tmp_path / "images" / f"{i}.png"
+        path.parent.mkdir(exist_ok=True)
+        Image.fromarray(np.full(size[::-1] + (3,), 60 * i, dtype=np.uint8)).save(path)
+        rv.append(str(path))
+    return rv
+
+
+@pytest.fixture
+def classifier(tmp_path):
+    config, weights, labels = synthetic.make_network(str(tmp_path / "net"), "classifier")
+    names = tmp_path / "net" / "names.txt"
+    names.write_text("\n".join(labels) + "\n")
+    yield config, weights, str(names)
+    scoring.clear_cache()
+
+
+def test_cached_network_is_loaded_once(classifier):
+    config, weights, _ = classifier
+    cached = scoring.cached_network(config, weights, 2)
+    assert scoring.cached_network(config, weights, 2) is cached
+    assert scoring.cached_network(config, weights, 1) is not cached
+    assert cached.network.batch_size == 2
+
+
+def test_score_images_classifier(classifier, images):
+    config, weights, names = classifier
+    rv = scoring.score_images(images, "classifier", config, weights, names, batch_size=2, top=3)
+    assert list(rv.columns) == list(scoring.CLASSIFICATION_COLUMNS)
+    assert rv["urlpath"].tolist() == [path for path in images for _ in range(3)]
+    assert rv["rank"].tolist() == [0, 1, 2] * 3
+    assert rv["label"].str.startswith("classifier-label-").all()
+    assert (rv.groupby("urlpath")["prob"].diff().dropna() <= 0).all()
+
+
+def test_score_images_rejects_managed_arguments(classifier, images):
+    config, weights, names = classifier
+    with pytest.raises(TypeError):
+        scoring.score_images(images, "detector", config, weights, letterbox=1)
+    with pytest.raises(ValueError):
+        scoring.score_images(images, "segmenter", config, weights)
+
+
+def test_intake_source(classifier, images, tmp_path):
+    intake_source = pytest.importorskip("darknet.py.intake")
+    config, weights, names = classifier
+    source = intake_source.DarknetSource(
+        names,
+        config,
+        weights,
+        names_slice=(None,),
+        urlpath=str(tmp_path / "images" / "*.png"),
+        partition_size=2,
+        score_kwargs=dict(top=1),
+    )
+    assert source.discover()["npartitions"] == 2
+    rv = source.read()
+    assert rv["urlpath"].tolist() == images
+    assert len(source.read_partition(1)) == 1
+
+    pytest.importorskip("dask.dataframe")
+    assert source.to_dask().compute()["urlpath"].tolist() == images
+
+
+def test_score_bag_and_dataframe(classifier, images):
+    db = pytest.importorskip("dask.bag")
+    dd = pytest.importorskip("dask.dataframe")
+    config, weights, names = classifier
+
+    bag = db.from_sequence(images, npartitions=2)
+    rv = scoring.score_bag(bag, "classifier", config, weights, names=names, top=1)
+    assert rv.npartitions == 2
+    assert rv.compute()["urlpath"].tolist() == images
+
+    df = dd.from_pandas(pd.DataFrame({"image": images}), npartitions=2)
+    rv = scoring.score_dataframe(df, "classifier", config, weights, column="image", top=2)
+    assert rv.compute()["urlpath"].tolist() == [path for path in images for _ in range(2)]
+
+
+def test_local_cluster_loads_the_network_once_per_worker(classifier, images):
+    distributed = pytest.importorskip("distributed")
+    db = pytest.importorskip("dask.bag")
+    config, weights, names = classifier
+
+    with distributed.LocalCluster(
+        n_workers=2, threads_per_worker=2, processes=True, dashboard_address=None
+    ) as cluster, distributed.Client(cluster) as client:
+        bag = db.from_sequence(images * 4, npartitions=6)
+        rv = scoring.score_bag(bag, "classifier", config, weights, names=names, batch_size=2)
+        assert len(rv.compute()) == 5 * len(images) * 4
+        cached = client.run(lambda: len(scoring._networks))
+        assert sorted(cached.values()) in ([0, 1], [1, 1])
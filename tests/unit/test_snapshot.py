@@ -0,0 +1,82 @@
+import os
+
+import fsspec
+import pytest
+
+import darknet.py.util as darknet_util
+from darknet.py import snapshot as darknet_snapshot
+from darknet.py.artifacts import ArtifactCache
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    config, weights = tmp_path / "net.cfg", tmp_path / "net.weights"
+    config.write_text("[net]\nwidth=8\nheight=8\n")
+    weights.write_bytes(os.urandom(1024))
+    return str(config), str(weights), str(tmp_path / "snapshots")
+
+
+def test_create_and_find_snapshot(model):
+    config_url, weights_url, root = model
+    assert darknet_snapshot.find_snapshot(config_url, weights_url, root) is None
+
+    snapshot = darknet_snapshot.create_snapshot(config_url, weights_url, root)
+    assert snapshot.is_complete()
+    with open(snapshot.weights_file, "rb") as f, open(weights_url, "rb") as g:
+        assert f.read() == g.read()
+
+    assert darknet_snapshot.find_snapshot(config_url, weights_url, root) == snapshot
+    assert darknet_snapshot.resolve_snapshot(config_url, weights_url, root) == snapshot
+
+
+def test_snapshot_is_content_addressed(model):
+    config_url, weights_url, root = model
+    key = darknet_snapshot.create_snapshot(config_url, weights_url, root).key
+    assert key == darknet_snapshot.snapshot_key(config_url, weights_url)
+
+    os.remove(os.path.join(root, key, "network.weights"))
+    assert darknet_snapshot.find_snapshot(config_url, weights_url, root) is None
+    assert darknet_snapshot.resolve_snapshot(config_url, weights_url, root).is_complete()
+
+
+def test_changed_urls_are_snapshotted_again(model):
+    config_url, weights_url, root = model
+    snapshot = darknet_snapshot.create_snapshot(config_url, weights_url, root)
+
+    # A new file, the snapshot holds a hard link to the old one
+    with open(weights_url + ".new", "wb") as f:
+        f.write(os.urandom(2048))
+    os.replace(weights_url + ".new", weights_url)
+    assert darknet_snapshot.find_snapshot(config_url, weights_url, root) is None
+    assert darknet_snapshot.find_snapshot(config_url, weights_url, root, revalidate=False)
+    rv = darknet_snapshot.resolve_snapshot(config_url, weights_url, root)
+    assert rv.key != snapshot.key and os.path.getsize(rv.weights_file) == 2048
+    assert darknet_snapshot.find_snapshot(config_url, weights_url, root) == rv
+
+
+def test_changed_remote_urls_are_fetched_again(model, mocker):
+    config_url, _, root = model
+    cache = ArtifactCache(os.path.join(root, "artifacts"))
+    mocker.patch.object(darknet_util, "artifact_cache", return_value=cache)
+    weights_url = "memory://darknet-snapshot/net.weights"
+    with fsspec.open(weights_url, "wb") as f:
+        f.write(b"1" * 16)
+    snapshot = darknet_snapshot.resolve_snapshot(config_url, weights_url, root)
+
+    with fsspec.open(weights_url, "wb") as f:
+        f.write(b"2" * 32)
+    rv = darknet_snapshot.resolve_snapshot(config_url, weights_url, root)
+    assert rv.key != snapshot.key
+    with open(rv.weights_file, "rb") as f:
+        assert f.read() == b"2" * 32
+
+
+def test_complete_snapshots_are_not_replaced(model):
+    config_url, weights_url, root = model
+    snapshot = darknet_snapshot.create_snapshot(config_url, weights_url, root)
+    inode = os.stat(snapshot.weights_file).st_ino
+
+    darknet_snapshot._write_snapshot(snapshot, config_url, weights_url, config_url, weights_url)
+    assert os.stat(snapshot.weights_file).st_ino == inode
+    assert [name for name in os.listdir(root) if name.startswith(".tmp-")] == []
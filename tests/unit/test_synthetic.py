@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from darknet.py import synthetic
+
+
+def test_tiny_yolo_weights_match_yolov3_tiny():
+    # The published yolov3-tiny.weights is 35434956 bytes, with a 20 bytes header
+    sections = synthetic.tiny_yolo(filters=16)
+    assert 4 * sum(synthetic.parameter_counts(sections)) + 20 == 35434956
+
+
+@pytest.mark.parametrize("kind", ["detector", "classifier"])
+def test_make_network(tmp_path, kind):
+    config_file, weights_file, labels = synthetic.make_network(
+        str(tmp_path), kind, width=32, height=32
+    )
+    with open(config_file) as f:
+        cfg = f.read()
+    assert cfg.startswith("[net]\n")
+    assert "width=32" in cfg
+
+    sections = synthetic.tiny_yolo if kind == "detector" else synthetic.tiny_classifier
+    num_floats = sum(synthetic.parameter_counts(sections(width=32, height=32)))
+    assert os.path.getsize(weights_file) == 20 + 4 * num_floats
+    assert len(labels) == (80 if kind == "detector" else 10)
+
+
+def test_unsupported_layer():
+    sections = synthetic.tiny_classifier() + [("lstm", dict(output=8))]
+    with pytest.raises(ValueError):
+        synthetic.parameter_counts(sections)
@@ -0,0 +1,100 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from darknet.py import ImageDetector, synthetic
+from darknet.py.detections import DETECTION_DTYPE
+from darknet.py.tiling import Tile, _load_image, _to_image, read_tile, tile_grid, tile_starts
+
+
+def test_tile_starts():
+    assert tile_starts(100, 40, 10) == ([0, 30, 60], [0.0, 35.0, 65.0, 100.0])
+    # The last tile ends with the image
+    assert tile_starts(90, 40, 10) == ([0, 30, 50], [0.0, 35.0, 60.0, 90.0])
+    assert tile_starts(20, 40, 10) == ([0], [0.0, 20.0])
+    with pytest.raises(ValueError):
+        tile_starts(100, 40, 40)
+
+
+def test_tile_grid_cores_cover_the_image():
+    tiles = tile_grid((100, 50), (40, 40), 10)
+    assert [(t.left, t.top) for t in tiles] == [
+        (0, 0),
+        (30, 0),
+        (60, 0),
+        (0, 10),
+        (30, 10),
+        (60, 10),
+    ]
+    area = sum((t.core[2] - t.core[0]) * (t.core[3] - t.core[1]) for t in tiles)
+    assert area == 100 * 50
+
+
+@pytest.mark.parametrize("as_pil", [False, True])
+def test_read_tile(as_pil):
+    pixels = np.arange(30 * 20 * 3, dtype=np.uint8).reshape((30, 20, 3))
+    image = Image.fromarray(pixels) if as_pil else pixels
+    out = np.full((3, 16, 16), -1, dtype=np.float32)
+    read_tile(image, Tile(8, 20, None), out)
+    np.testing.assert_allclose(out[:, :10, :12], pixels[20:, 8:].transpose((2, 0, 1)) / 255)
+    assert not out[:, 10:].any() and not out[:, :, 12:].any()
+
+
+def test_to_image_keeps_the_core_detections():
+    tiles = [Tile(0, 0, (0, 0, 35, 40)), Tile(30, 0, (35, 0, 100, 40))]
+    detections = np.zeros(3, dtype=DETECTION_DTYPE)
+    detections["x"] = [10, 38, 10]
+    detections["y"] = 5
+    detections["frame_index"] = [0, 0, 1]
+    rv = _to_image(detections, tiles)
+    assert rv["x"].tolist() == [10, 40]
+    assert rv["frame_index"].tolist() == [0, 1]
+
+
+def test_image_detector_detect_tiled(tmp_path):
+    config, weights, labels = synthetic.make_network(str(tmp_path), "detector", width=32, height=32)
+    detector = ImageDetector(labels, config, weights, batch_size=4)
+    image = np.full((100, 150, 3), 128, dtype=np.uint8)
+
+    detections = detector.detect_tiled(image, overlap=8, threshold=0.1, as_array=True)
+    assert len(detections)
+    assert (detections["x"] >= 0).all() and (detections["x"] < 150).all()
+    assert (detections["y"] >= 0).all() and (detections["y"] < 100).all()
+    assert (detections["frame_index"] == 0).all()
+    assert np.all(np.diff(detections["prob"]) <= 0)
+
+    tuples = detector.detect_tiled(image, overlap=8, threshold=0.1)
+    assert len(tuples) == len(detections)
+    assert all(label in labels for label, _, _ in tuples)
+
+
+def test_detect_tiled_large_encoded_image(tmp_path, monkeypatch):
+    config, weights, _ = synthetic.make_network(str(tmp_path), "detector", width=32, height=32)
+    detector = ImageDetector(None, config, weights, batch_size=4)
+    path = tmp_path / "large.png"
+    Image.new("RGBA", (100, 150), (128, 128, 128, 255)).save(path)
+
+    # Past twice PIL's limit, opening the image is a DecompressionBombError
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(path)
+
+    detections = detector.detect_tiled(str(path), overlap=8, threshold=0.1, as_array=True)
+    assert len(detections)
+    assert Image.MAX_IMAGE_PIXELS == 1000
+    with pytest.raises(Image.DecompressionBombError):
+        detector.detect_tiled(path.read_bytes(), max_pixels=1000)
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG", "BMP", "TIFF", "GIF"])
+def test_load_image_leaves_pil_limit_alone(image_format, monkeypatch):
+    with io.BytesIO() as f:
+        Image.new("RGB", (100, 150)).save(f, image_format)
+        data = f.getvalue()
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    image = _load_image(data, max_pixels=None)
+    assert (image.format, image.size) == (image_format, (100, 150))
+    with pytest.raises(Image.DecompressionBombError):
+        _load_image(data, max_pixels=100 * 150 - 1)
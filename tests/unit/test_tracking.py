@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from darknet.py.detections import DETECTION_DTYPE
+from darknet.py.tracking import Tracker, VideoDetector, compare_detections, thumbnail
+
+
+def boxes(*rows):
+    rv = np.zeros(len(rows), dtype=DETECTION_DTYPE)
+    for i, (class_id, x, y, w, h) in enumerate(rows):
+        rv[i] = (class_id, 0.9, x, y, w, h, 1.0, 0)
+    return rv
+
+
+def test_tracker_keeps_ids_and_extrapolates_motion():
+    tracker = Tracker()
+    for step in range(10):
+        tracker.predict()
+        tracker.update(boxes((0, 100 + 10 * step, 50, 20, 20), (1, 300, 200, 40, 40)))
+    tracks = tracker.boxes()
+    assert sorted(tracks["track_id"].tolist()) == [0, 1]
+
+    tracker.predict()
+    moving = tracker.boxes()[tracker.boxes()["class_id"] == 0][0]
+    # Past the last detection, at 190, the velocity estimate converges on 10 per frame
+    assert moving["x"] == pytest.approx(200, abs=2)
+    assert moving["y"] == pytest.approx(50, abs=1)
+
+
+def test_tracker_drops_missed_tracks():
+    tracker = Tracker(max_misses=1)
+    tracker.predict()
+    tracker.update(boxes((0, 100, 50, 20, 20)))
+    tracker.predict()
+    # Another class at the same place is another object
+    tracker.update(boxes((1, 100, 50, 20, 20)))
+    assert tracker.boxes()["track_id"].tolist() == [1]
+    assert len(tracker) == 2
+    tracker.predict()
+    tracker.update(boxes((1, 100, 50, 20, 20)))
+    assert len(tracker) == 1
+
+
+def test_compare_detections():
+    reference = boxes((0, 100, 50, 20, 20), (0, 300, 50, 20, 20))
+    candidate = boxes((0, 102, 50, 20, 20), (1, 300, 50, 20, 20), (0, 500, 50, 20, 20))
+    assert compare_detections(reference, candidate) == (1, 2, 3)
+    assert compare_detections(reference, candidate[:0]) == (0, 2, 0)
+
+
+@pytest.fixture
+def detector(mocker):
+    detector = mocker.Mock()
+    detector.network.name = "fake"
+    detector.detect.side_effect = lambda frame, **kwargs: boxes((0, 100, 50, 20, 20))
+    return detector
+
+
+def test_video_detector_keyframes(detector):
+    video = VideoDetector(detector, max_interval=4, difference_threshold=0.1, threshold=0.3)
+    still = np.zeros((36, 64, 3), dtype=np.uint8)
+
+    track_ids = [video.detect(still)["track_id"].tolist() for _ in range(8)]
+    assert track_ids == [[0]] * 8
+    assert detector.detect.call_count == 2
+    assert detector.detect.call_args[1] == dict(threshold=0.3, as_array=True)
+
+    # A scene change is a keyframe
+    video.detect(np.full((36, 64, 3), 255, dtype=np.uint8))
+    assert video.last_was_keyframe
+    stats = video.stats()
+    assert (stats["frames"], stats["keyframes"]) == (9, 3)
+
+
+def test_video_detector_audits(detector):
+    video = VideoDetector(detector, max_interval=10, difference_threshold=None, audit_interval=2)
+    for _ in range(5):
+        video.detect(np.zeros((36, 64, 3), dtype=np.uint8))
+    stats = video.stats()
+    assert (stats["keyframes"], stats["audits"]) == (1, 2)
+    assert stats["precision"] == stats["recall"] == 1.0
+
+
+def test_thumbnail():
+    small = thumbnail(np.full((720, 1280, 3), 255, dtype=np.uint8))
+    assert small.shape == (36, 64)
+    np.testing.assert_allclose(small, 1.0)